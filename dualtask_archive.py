@@ -0,0 +1,276 @@
+"""
+Per-subject session archives.
+Packs results/<subject> and recordings/<subject> of one or many subjects into one ZIP archive per subject,
+with one worker process per archive. Files are streamed into the archive in chunks, FLAC recordings (already
+compressed) are stored without compression.
+
+Every archive is verified after writing: all CRCs are checked and the recordings are compared with the checksums
+of their manifest (see dualtask_recording.RecordingManifest) - recordings in a session container by the hash of
+their stored samples. The digest of the subject's content (manifest and
+results) is stored next to the archive, so subjects that did not change since their last archive are skipped.
+
+Usage:
+    python dualtask_archive.py [subject ...] [--out archives] [--workers 4] [--force]
+        Archives the given subjects (default: all subjects in results/ and recordings/) and reports the throughput.
+"""
+
+# Import necessary libraries
+import argparse
+import datetime
+import hashlib
+import json
+import os
+import shutil
+import time
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dualtask_container import ContainerReader, stored_sha256
+from dualtask_recording import MANIFEST_FILENAME, read_manifest, file_sha256
+
+
+# Files that are already compressed are stored as they are
+STORED_EXTENSIONS = ('.flac', '.zip', '.npz')
+CHUNK_SIZE = 1 << 20
+
+
+def subject_files(subject, results_path, recordings_path):
+    """
+    List the files of a subject.
+
+    Args:
+        subject (str): The subject ID.
+        results_path (str): The results directory.
+        recordings_path (str): The recordings directory.
+
+    Returns:
+        list: (path on disk, name in the archive) of all files, sorted by name in the archive.
+    """
+    files = []
+    for root_path, prefix in ((results_path, 'results'), (recordings_path, 'recordings')):
+        subject_path = os.path.join(root_path, subject)
+        for directory, _, names in os.walk(subject_path):
+            for name in names:
+                path = os.path.join(directory, name)
+                relative = os.path.relpath(path, subject_path).replace(os.sep, '/')
+                files.append((path, '/'.join([prefix, subject, relative])))
+    return sorted(files, key=lambda file: file[1])
+
+
+def subject_digest(subject, results_path, recordings_path):
+    """
+    Compute the digest of a subject's content.
+
+    The recordings are represented by their manifest (which holds their checksums), all other files by their
+    content. Recordings without a manifest entry (e.g. of older sessions) are represented by name, size and time.
+
+    Args:
+        subject (str): The subject ID.
+        results_path (str): The results directory.
+        recordings_path (str): The recordings directory.
+
+    Returns:
+        str: The SHA-256 hex digest.
+    """
+    manifest = read_manifest(os.path.join(recordings_path, subject))
+    digest = hashlib.sha256()
+    for path, name in subject_files(subject, results_path, recordings_path):
+        base = os.path.basename(path)
+        digest.update(name.encode('utf-8'))
+        if base in manifest and name.startswith('recordings/'):
+            digest.update(manifest[base]['sha256'].encode('ascii'))
+        elif name.startswith('recordings/') and base != MANIFEST_FILENAME:
+            status = os.stat(path)
+            digest.update('{}:{}'.format(status.st_size, int(status.st_mtime)).encode('ascii'))
+        else:
+            digest.update(file_sha256(path).encode('ascii'))
+    return digest.hexdigest()
+
+
+def verify_archive(archive_file, files, manifest):
+    """
+    Verify a written archive.
+
+    Args:
+        archive_file (str): The archive.
+        files (list): (path on disk, name in the archive) of the files that were packed.
+        manifest (dict): The manifest of the subject's recordings (file name -> row).
+
+    Returns:
+        list: Problems found, empty if the archive is complete and intact.
+    """
+    problems = []
+    with zipfile.ZipFile(archive_file) as archive:
+        names = set(archive.namelist())
+        for path, name in files:
+            if name not in names:
+                problems.append('missing: ' + name)
+            elif archive.getinfo(name).file_size != os.path.getsize(path):
+                problems.append('size differs: ' + name)
+        # reading every entry checks its CRC; recordings are also compared with their manifest checksum
+        for name in sorted(names):
+            digest = hashlib.sha256()
+            try:
+                with archive.open(name) as entry:
+                    for chunk in iter(lambda: entry.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+            except zipfile.BadZipFile as e:
+                problems.append('{}: {}'.format(name, e))
+                continue
+            base = name.rsplit('/', 1)[-1]
+            if name.startswith('recordings/') and base in manifest and digest.hexdigest() != manifest[base]['sha256']:
+                problems.append('checksum differs from manifest: ' + name)
+    return problems
+
+
+def verify_containers(files, manifest):
+    """
+    Compare the recordings of the packed session containers with their manifest.
+
+    The archive entries of the containers are checked against the files on disk by verify_archive, so the files
+    on disk are read here.
+
+    Args:
+        files (list): (path on disk, name in the archive) of the files that were packed.
+        manifest (dict): The manifest of the subject's recordings (recording name -> row).
+
+    Returns:
+        list: Problems found, empty if all recordings of the containers match their manifest.
+    """
+    problems = []
+    stored = set()
+    for path, name in files:
+        base = os.path.basename(path)
+        if not (name.startswith('results/') and base.startswith('session_') and base.endswith('.h5')):
+            continue
+        try:
+            with ContainerReader(path) as container:
+                for recording in container.names():
+                    stored.add(recording)
+                    samples, _ = container.recording(recording)
+                    if recording in manifest and stored_sha256(samples) != manifest[recording]['sha256']:
+                        problems.append('checksum differs from manifest: {} in {}'.format(recording, name))
+        except (OSError, RuntimeError) as e:
+            problems.append('{}: {}'.format(name, e))
+    # recordings of a container are listed without extension
+    for recording in sorted(set(manifest) - stored):
+        if not os.path.splitext(recording)[1]:
+            problems.append('missing from the session containers: ' + recording)
+    return problems
+
+
+def archive_subject(job):
+    """
+    Pack the files of one subject into its archive and verify it (runs in a worker process).
+
+    Args:
+        job (tuple): Subject ID, results directory, recordings directory, archive directory and whether existing
+            archives are replaced even if the subject did not change.
+
+    Returns:
+        dict: 'subject', 'status' ('archived', 'skipped' or 'failed'), 'files', 'bytes', 'seconds' and 'problems'.
+    """
+    subject, results_path, recordings_path, archive_path, force = job
+    start = time.perf_counter()
+    archive_file = os.path.join(archive_path, subject + '.zip')
+    info_file = archive_file + '.json'
+    digest = subject_digest(subject, results_path, recordings_path)
+    report = {'subject': subject, 'status': 'skipped', 'files': 0, 'bytes': 0, 'seconds': 0.0, 'problems': []}
+
+    if not force and os.path.isfile(archive_file) and os.path.isfile(info_file):
+        with open(info_file) as file:
+            if json.load(file).get('digest') == digest:
+                return report
+
+    files = subject_files(subject, results_path, recordings_path)
+    temporary_file = archive_file + '.tmp'
+    with zipfile.ZipFile(temporary_file, 'w', allowZip64=True) as archive:
+        for path, name in files:
+            stored = os.path.splitext(path)[1].lower() in STORED_EXTENSIONS
+            info = zipfile.ZipInfo.from_file(path, name)
+            info.compress_type = zipfile.ZIP_STORED if stored else zipfile.ZIP_DEFLATED
+            with open(path, 'rb') as source, archive.open(info, 'w', force_zip64=True) as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+            report['bytes'] += info.file_size
+        archive.comment = digest.encode('ascii')
+    report['files'] = len(files)
+
+    manifest = read_manifest(os.path.join(recordings_path, subject))
+    report['problems'] = verify_archive(temporary_file, files, manifest) + verify_containers(files, manifest)
+    report['seconds'] = time.perf_counter() - start
+    if report['problems']:
+        # keep the last good archive - the report tells which files have to be checked
+        os.remove(temporary_file)
+        report['status'] = 'failed'
+        return report
+    os.replace(temporary_file, archive_file)
+    with open(info_file, 'w') as file:
+        json.dump({'subject': subject, 'digest': digest, 'files': report['files'], 'bytes': report['bytes'],
+                   'archived': datetime.datetime.now().isoformat(timespec='seconds')}, file, indent=2)
+    report['status'] = 'archived'
+    return report
+
+
+def find_subjects(results_path, recordings_path):
+    """Return the subjects that have a folder in the results or recordings directory."""
+    subjects = set()
+    for root_path in (results_path, recordings_path):
+        if os.path.isdir(root_path):
+            subjects.update(name for name in os.listdir(root_path) if os.path.isdir(os.path.join(root_path, name)))
+    return sorted(subjects)
+
+
+def archive_subjects(subjects, results_path='results', recordings_path='recordings', archive_path='archives',
+                     workers=None, force=False):
+    """
+    Archive several subjects in parallel and print a report.
+
+    Args:
+        subjects (list): Subject IDs - all subjects if empty.
+        results_path (str, optional): The results directory.
+        recordings_path (str, optional): The recordings directory.
+        archive_path (str, optional): The directory of the archives.
+        workers (int, optional): Number of worker processes.
+        force (bool, optional): Replace archives of subjects that did not change.
+
+    Returns:
+        bool: True if all archives were written and verified (or skipped).
+    """
+    subjects = subjects or find_subjects(results_path, recordings_path)
+    os.makedirs(archive_path, exist_ok=True)
+    start = time.perf_counter()
+    total_bytes = 0
+    all_ok = True
+    jobs = [(subject, results_path, recordings_path, archive_path, force) for subject in subjects]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for report in executor.map(archive_subject, jobs):
+            total_bytes += report['bytes']
+            if report['status'] == 'skipped':
+                print('{}: unchanged since the last archive - skipped'.format(report['subject']))
+                continue
+            print('{subject}: {status} - {files} files, {mb:.1f} MB in {seconds:.1f} s ({rate:.1f} MB/s)'.format(
+                mb=report['bytes'] / 1e6, rate=report['bytes'] / 1e6 / max(report['seconds'], 1e-9), **report))
+            for problem in report['problems']:
+                print('    ' + problem)
+            all_ok = all_ok and report['status'] == 'archived'
+    elapsed = time.perf_counter() - start
+    print('{} subjects, {:.1f} MB in {:.1f} s ({:.1f} MB/s)'.format(
+        len(subjects), total_bytes / 1e6, elapsed, total_bytes / 1e6 / max(elapsed, 1e-9)))
+    return all_ok
+
+
+def main():
+    """Command line interface of the archive packer."""
+    parser = argparse.ArgumentParser(description='Pack results and recordings into one archive per subject.')
+    parser.add_argument('subjects', nargs='*', help='subject IDs (default: all subjects)')
+    parser.add_argument('--results', default='results', help='results directory')
+    parser.add_argument('--recordings', default='recordings', help='recordings directory')
+    parser.add_argument('--out', default='archives', help='directory of the archives')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    parser.add_argument('--force', action='store_true', help='also re-archive subjects that did not change')
+    args = parser.parse_args()
+    ok = archive_subjects(args.subjects, args.results, args.recordings, args.out, args.workers, args.force)
+    raise SystemExit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,273 @@
+"""
+Monitor calibration cache.
+Measuring the refresh rate of the experiment window blocks the start of the experiment for several seconds and
+occasionally fails. The measured refresh rate (with its 95% confidence interval) is therefore stored per monitor,
+resolution and screen index in a JSON file and reused on later launches. At startup the stored rate is only checked
+with the flips of half a second; if the display runs at another rate (e.g. switched from 60 to 120 Hz in the
+driver), it is measured again.
+While the experiment runs, psychopy records the intervals between flips anyway; at the end of a session these are
+used to revalidate the stored calibration when it is older than the revalidation interval - without any extra
+measurement at startup.
+"""
+
+# Import necessary libraries
+import datetime
+import json
+import os
+import numpy as np
+
+
+# Number of flips used for a full measurement (after a few warm-up flips)
+MEASURE_FRAMES = 240
+WARMUP_FRAMES = 20
+# Number of flips of the quick check of a stored calibration at startup, and the allowed relative deviation
+CHECK_FRAMES = 30
+CHECK_TOLERANCE = 0.05
+
+
+def calibration_key(monitor_name, size, screen):
+    """
+    Build the key of a display setup in the calibration file.
+
+    Args:
+        monitor_name (str): Name of the psychopy monitor, e.g. 'EA244WMi'.
+        size (tuple): Resolution in pixels (width, height).
+        screen (int): Index of the screen the window is shown on.
+
+    Returns:
+        str: The key, e.g. 'EA244WMi_1920x1080_screen2'.
+    """
+    return '{}_{}x{}_screen{}'.format(monitor_name, size[0], size[1], screen)
+
+
+def load_calibration(store_file, key):
+    """
+    Load the calibration of a display setup.
+
+    Args:
+        store_file (str): Path of the calibration JSON file.
+        key (str): The key of the display setup.
+
+    Returns:
+        dict or None: The stored calibration, None if there is none (or the file cannot be read).
+    """
+    if not os.path.isfile(store_file):
+        return None
+    try:
+        with open(store_file) as file:
+            return json.load(file).get(key)
+    except (OSError, ValueError):
+        return None
+
+
+def save_calibration(store_file, key, entry):
+    """
+    Store the calibration of a display setup, keeping the entries of all other setups.
+
+    The file is replaced atomically, so an interrupted write never leaves a broken calibration file.
+
+    Args:
+        store_file (str): Path of the calibration JSON file.
+        key (str): The key of the display setup.
+        entry (dict): The calibration to store.
+    """
+    directory = os.path.dirname(store_file)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory)
+    calibrations = {}
+    if os.path.isfile(store_file):
+        try:
+            with open(store_file) as file:
+                calibrations = json.load(file)
+        except (OSError, ValueError):
+            calibrations = {}
+    calibrations[key] = entry
+    temporary_file = store_file + '.tmp'
+    with open(temporary_file, 'w') as file:
+        json.dump(calibrations, file, indent=2)
+    os.replace(temporary_file, store_file)
+
+
+def estimate_refresh_rate(intervals, nominal_rate=None):
+    """
+    Estimate the refresh rate and its 95% confidence interval from flip intervals.
+
+    Intervals of dropped frames and of pauses between flips (e.g. core.wait) are excluded: only intervals within
+    25% of the nominal frame period (or the median interval, if no nominal rate is given) are used.
+
+    Args:
+        intervals (sequence of float): Intervals between consecutive flips in seconds.
+        nominal_rate (float, optional): The expected refresh rate in Hz.
+
+    Returns:
+        dict or None: 'refresh_rate', 'ci95' (half width in Hz) and 'n_intervals', None if too few intervals are valid.
+    """
+    intervals = np.asarray(intervals, dtype=float)
+    intervals = intervals[intervals > 0]
+    if len(intervals) < 10:
+        return None
+    period = 1.0 / nominal_rate if nominal_rate else np.median(intervals)
+    valid = intervals[np.abs(intervals - period) < 0.25 * period]
+    if len(valid) < 10:
+        return None
+    mean_period = valid.mean()
+    # standard error of the mean period, propagated to the rate (d(1/p) = dp / p^2)
+    ci95 = 1.96 * valid.std(ddof=1) / np.sqrt(len(valid)) / mean_period ** 2
+    return {
+        'refresh_rate': round(float(1.0 / mean_period), 4),
+        'ci95': round(float(ci95), 4),
+        'n_intervals': int(len(valid)),
+    }
+
+
+def measure_refresh_rate(window, n_frames=MEASURE_FRAMES):
+    """
+    Measure the refresh rate of a window by timing consecutive flips.
+
+    Args:
+        window (psychopy.visual.Window): The experiment window.
+        n_frames (int, optional): Number of flips to time. Defaults to MEASURE_FRAMES.
+
+    Returns:
+        dict or None: The estimate (see estimate_refresh_rate), None if the measurement failed.
+    """
+    for _ in range(WARMUP_FRAMES):
+        window.flip()
+    flip_times = [window.flip() for _ in range(n_frames)]
+    if any(flip_time is None for flip_time in flip_times):
+        return None
+    return estimate_refresh_rate(np.diff(flip_times))
+
+
+def check_refresh_rate(window, refresh_rate, n_frames=CHECK_FRAMES, tolerance=CHECK_TOLERANCE):
+    """
+    Quickly check a stored refresh rate against the median interval of a few flips.
+
+    Catches a changed refresh rate under the same display setup (e.g. 60 Hz switched to 120 Hz in the driver),
+    which would otherwise scale all durations of the trials until the next revalidation.
+
+    Args:
+        window (psychopy.visual.Window): The experiment window.
+        refresh_rate (float): The stored refresh rate in Hz.
+        n_frames (int, optional): Number of flips to time. Defaults to CHECK_FRAMES.
+        tolerance (float, optional): Allowed relative deviation of the measured rate. Defaults to CHECK_TOLERANCE.
+
+    Returns:
+        bool: False if the flips clearly disagree with the stored rate, True otherwise (also if the flips could
+        not be timed).
+    """
+    window.flip()
+    flip_times = [window.flip() for _ in range(n_frames + 1)]
+    if any(flip_time is None for flip_time in flip_times):
+        return True
+    # the median is not affected by a few dropped frames
+    median_interval = np.median(np.diff(flip_times))
+    if median_interval <= 0:
+        return True
+    return abs(1.0 / median_interval - refresh_rate) <= tolerance * refresh_rate
+
+
+def get_refresh_rate(window, store_file, key, default_rate=60):
+    """
+    Return the refresh rate of the display setup, measuring it only if no calibration is stored yet.
+
+    A stored rate is checked with a few flips (see check_refresh_rate); if the display runs at another rate, the
+    rate is measured again and the calibration replaced.
+
+    Args:
+        window (psychopy.visual.Window): The experiment window.
+        store_file (str): Path of the calibration JSON file.
+        key (str): The key of the display setup.
+        default_rate (float, optional): Rate used if the measurement fails. Defaults to 60 Hz.
+
+    Returns:
+        float: The refresh rate in Hz.
+    """
+    entry = load_calibration(store_file, key)
+    if entry is not None:
+        if check_refresh_rate(window, entry['refresh_rate']):
+            return entry['refresh_rate']
+        print("The refresh rate of '{}' differs from the stored {} Hz - measuring it again".format(
+            key, entry['refresh_rate']))
+
+    estimate = measure_refresh_rate(window)
+    if estimate is None:
+        # If for some reason the measurement fails, default to a reasonable estimate - nothing is stored
+        return default_rate
+
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    estimate.update({'measured': now, 'validated': now})
+    save_calibration(store_file, key, estimate)
+    return estimate['refresh_rate']
+
+
+def revalidation_due(store_file, key, revalidation_days):
+    """
+    Check whether the stored calibration of a display setup should be revalidated.
+
+    Args:
+        store_file (str): Path of the calibration JSON file.
+        key (str): The key of the display setup.
+        revalidation_days (float): Age in days after which a calibration is revalidated.
+
+    Returns:
+        bool: True if a calibration exists and was last validated more than revalidation_days ago.
+    """
+    entry = load_calibration(store_file, key)
+    if entry is None:
+        return False
+    validated = datetime.datetime.fromisoformat(entry['validated'])
+    return datetime.datetime.now() - validated > datetime.timedelta(days=revalidation_days)
+
+
+def start_revalidation(window, store_file, key, revalidation_days):
+    """
+    Let psychopy record the flip intervals of the session if the stored calibration is due for revalidation.
+
+    Args:
+        window (psychopy.visual.Window): The experiment window.
+        store_file (str): Path of the calibration JSON file.
+        key (str): The key of the display setup.
+        revalidation_days (float): Age in days after which a calibration is revalidated.
+
+    Returns:
+        bool: True if the revalidation was started.
+    """
+    if not revalidation_due(store_file, key, revalidation_days):
+        return False
+    window.recordFrameIntervals = True
+    return True
+
+
+def finish_revalidation(window, store_file, key, tolerance=0.5):
+    """
+    Revalidate the stored calibration with the flip intervals recorded during the session.
+
+    If the new estimate agrees with the stored rate (within the confidence intervals plus the tolerance), only the
+    validation date is updated. Otherwise the stored calibration is replaced by the new estimate.
+
+    Args:
+        window (psychopy.visual.Window): The experiment window after the session.
+        store_file (str): Path of the calibration JSON file.
+        key (str): The key of the display setup.
+        tolerance (float, optional): Allowed difference in Hz on top of the confidence intervals. Defaults to 0.5.
+
+    Returns:
+        dict or None: The stored calibration after revalidation, None if nothing was revalidated.
+    """
+    entry = load_calibration(store_file, key)
+    if entry is None or not window.recordFrameIntervals:
+        return None
+    estimate = estimate_refresh_rate(window.frameIntervals, entry['refresh_rate'])
+    if estimate is None:
+        return None
+
+    now = datetime.datetime.now().isoformat(timespec='seconds')
+    difference = abs(estimate['refresh_rate'] - entry['refresh_rate'])
+    if difference > entry['ci95'] + estimate['ci95'] + tolerance:
+        print("Refresh rate of '{}' changed from {} Hz to {} Hz - calibration updated".format(
+            key, entry['refresh_rate'], estimate['refresh_rate']))
+        entry = dict(estimate, measured=now)
+    entry['validated'] = now
+    save_calibration(store_file, key, entry)
+    return entry
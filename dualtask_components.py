@@ -0,0 +1,612 @@
+"""
+Task components and the frame engine of the dual tasks.
+A dual task trial is composed of components - the read-aloud item (the primary task, see dualtask_task_setup) and
+secondary tasks such as a beep stream (counted or pressed), a dot field or a number to remember.
+Each component declares what it does on the frames of the trial:
+    frame_events - (frame, callback) pairs that run once; if the frame is dropped they run on the next frame
+    frame_spans - (first frame, stop frame, callback) that run on every presented frame of the span
+and its response screens after the presentation (respond), which return the fields of the trial's TrialRecord.
+
+The FrameEngine merges the frame events and spans of all components into one table per trial before the trial
+starts, so the frame loop only walks the precompiled calls of the current frame: the per-frame overhead does not
+grow with the number of components, and secondary tasks can be combined freely.
+
+The hooks of a component are called in this order:
+    start_task(session_rng, task_name, n_trials) - once per task, draws the random parameters of all trials
+    start_trial(trial) - before every trial (before 'Wer kommt?')
+    before_presentation(window, trial) - screens before 'Wer kommt?', e.g. the number to remember
+    frame_events(trial), frame_spans(trial) - compiled by the engine
+    end_presentation(trial) - after the frame loop, e.g. saving the beep rows
+    respond(window, trial) - response screens, returns the fields of the trial result
+Components send the events of a trial to external recording systems through the trial (TrialState.mark and
+mark_now, see dualtask_markers).
+"""
+
+# Import necessary libraries
+import datetime
+import threading
+import time
+from psychopy import sound, core, event
+from psychopy.hardware import keyboard
+from dualtask_markers import MarkerEvent
+from dualtask_records import BeepRecord, BeepPressRecord, Phase, Presentation, BeepType, Accuracy, PressResponse
+from dualtask_schedule import next_beep_type, in_beep_blackout, select_and_replace_number, score_beep_presses, \
+    BEEP_NOTES, BEEP_PRESS_MIN_RT, BEEP_PRESS_MAX_RT
+
+
+def clock_times(start_time):
+    """
+    Format the current time and the time passed since start_time for the result files.
+
+    Args:
+        start_time (float): The start time of the task (time.time()).
+
+    Returns:
+        tuple: The current time ('HH:MM:SS') and the duration since start_time ('HH:MM:SS').
+    """
+    end_time = time.time()
+    end_time_str = datetime.datetime.fromtimestamp(end_time).strftime('%H:%M:%S')
+    duration = end_time - start_time
+    hours, remainder = divmod(duration, 3600)
+    minutes, seconds = divmod(remainder, 60)
+    return end_time_str, '{:02d}:{:02d}:{:02d}'.format(int(hours), int(minutes), int(seconds))
+
+
+def arrow_response(window, prompt, text, pos, drawables, feedback, response_keys, correct_index, on_response=None):
+    """
+    Show a response screen, wait for an arrow key and give feedback.
+
+    Args:
+        window: The display window.
+        prompt: The TextStim of the question.
+        text (str): The question.
+        pos (tuple): The position of the question.
+        drawables (list): Stimuli shown with the question (arrows, number options).
+        feedback: The TextStim of the feedback.
+        response_keys (list): The allowed keys, in the order of the answer options.
+        correct_index (int): The index of the correct key in response_keys.
+        on_response (callable, optional): Called with the Accuracy as soon as the key is pressed, e.g. to send a
+            marker.
+
+    Returns:
+        tuple: The pressed keys (list) and the Accuracy of the response.
+    """
+    prompt.setText(text)
+    prompt.pos = pos
+    prompt.size = 0.12
+    prompt.draw()
+    for drawable in drawables:
+        drawable.draw()
+    window.flip()
+
+    # wait for a response - allowed are the key buttons on the keypad
+    keys = event.waitKeys(keyList=response_keys)
+    accuracy = Accuracy.correct if response_keys.index(keys[0]) == correct_index else Accuracy.incorrect
+    if on_response is not None:
+        on_response(accuracy)
+    feedback.setText('Korrekt!' if accuracy == Accuracy.correct else 'Inkorrekt!')
+    feedback.setColor('black')
+    feedback.draw()
+    window.flip()
+
+    core.wait(2)
+    return keys, accuracy
+
+
+class TrialState:
+    """
+    State of a trial shared by its components.
+
+    The primary task sets the item presentation (item_start, item_end, max_item_end) in start_trial and adapts
+    item_end during the presentation; the secondary tasks read it, e.g. for the beep blackout.
+    Events for external recording systems are sent with mark (stamped with the next flip) and mark_now.
+    """
+    __slots__ = ('index', 'task_name', 'frame_grid', 'start_time', 'start_time_str', 'save', 'reference_start',
+                 'item_start', 'item_end', 'max_item_end', 'markers', 'pending_markers')
+
+    def __init__(self, index, task_name, frame_grid, start_time, start_time_str, save, markers=None):
+        self.index = index
+        self.task_name = task_name
+        self.frame_grid = frame_grid
+        self.start_time = start_time
+        self.start_time_str = start_time_str
+        self.save = save  # save(record, type) passes a record to the result backend(s)
+        self.reference_start = None
+        self.item_start = None
+        self.item_end = None
+        self.max_item_end = None
+        self.markers = markers  # MarkerOutlet or None
+        self.pending_markers = []
+
+    @property
+    def main_trial(self):
+        """The number of the trial (starting at 1)."""
+        return self.index + 1
+
+    def mark(self, event, frame, value=0):
+        """Send a marker with the time of the next flip - for a stimulus drawn on this frame."""
+        if self.markers is not None:
+            self.pending_markers.append((event, value, frame))
+
+    def mark_now(self, event, frame=0, value=0, event_time=None):
+        """Send a marker with the time of an event that is not bound to a flip (defaults to now)."""
+        if self.markers is not None:
+            self.markers.push(event, value, self.main_trial, frame,
+                              core.getTime() if event_time is None else event_time)
+
+
+class Component:
+    """Base class of the task components - all hooks do nothing by default."""
+
+    def start_task(self, session_rng, task_name, n_trials):
+        """Draw the random parameters of all trials of the task."""
+
+    def start_trial(self, trial):
+        """Prepare a trial."""
+
+    def before_presentation(self, window, trial):
+        """Show screens before 'Wer kommt?'."""
+
+    def frame_events(self, trial):
+        """Return the (frame, callback) pairs of the trial - callback(frame) runs once, also if frame was dropped."""
+        return []
+
+    def frame_spans(self, trial):
+        """Return the (first, stop, callback) spans of the trial - callback(frame) runs on every presented frame."""
+        return []
+
+    def end_presentation(self, trial):
+        """Finish the presentation after the frame loop."""
+
+    def respond(self, window, trial):
+        """Show the response screens and return the fields of the trial result."""
+        return {}
+
+
+class FrameEngine:
+    """
+    Runs the frame loop of a trial for a set of components.
+
+    Attributes:
+        components (list): The components in the order their calls run within a frame and their responses are
+            collected.
+    """
+
+    def __init__(self, components):
+        self.components = list(components)
+
+    def compile(self, trial, n_frames):
+        """
+        Merge the frame events and spans of all components into per-frame call tables.
+
+        Args:
+            trial (TrialState): The trial.
+            n_frames (int): The number of frames of the trial.
+
+        Returns:
+            tuple: The events and the span calls per frame (tuples of callbacks, one per frame).
+        """
+        events = [[] for _ in range(n_frames)]
+        calls = [[] for _ in range(n_frames)]
+        for component in self.components:
+            for frame, callback in component.frame_events(trial):
+                if frame < n_frames:
+                    events[max(frame, 0)].append(callback)
+            for first, stop, callback in component.frame_spans(trial):
+                for frame in range(max(first, 0), min(stop, n_frames)):
+                    calls[frame].append(callback)
+        return [tuple(callbacks) for callbacks in events], [tuple(callbacks) for callbacks in calls]
+
+    def run(self, window, trial, n_frames, frame_clock):
+        """
+        Present the frames of a trial.
+
+        Args:
+            window: The display window.
+            trial (TrialState): The trial.
+            n_frames (int): The number of frames of the trial.
+            frame_clock (FrameClock): Maps the flip times to frame indices - dropped frames are skipped.
+        """
+        events, calls = self.compile(trial, n_frames)
+        frame = 0
+        next_event = 0
+        trial.mark(MarkerEvent.trial_start, 0)
+        while frame < n_frames:
+            # the events of frames lost to dropped frames run now, in their order
+            while next_event <= frame:
+                for callback in events[next_event]:
+                    callback(next_event)
+                next_event += 1
+            for callback in calls[frame]:
+                callback(frame)
+            flip_time = window.flip()
+            if trial.pending_markers:
+                # the stimuli of the markers are on the screen from this flip on
+                for marker_event, value, marked_frame in trial.pending_markers:
+                    trial.markers.push(marker_event, value, trial.main_trial, marked_frame, flip_time)
+                trial.pending_markers = []
+            frame = frame_clock.next_frame(flip_time)
+        # the clock may have jumped past the last frame - the events of the skipped frames still run once
+        while next_event < n_frames:
+            for callback in events[next_event]:
+                callback(next_event)
+            next_event += 1
+        if trial.pending_markers:
+            # stimuli of the skipped frames were never shown - their markers carry the time of the end of the loop
+            for marker_event, value, marked_frame in trial.pending_markers:
+                trial.markers.push(marker_event, value, trial.main_trial, marked_frame, core.getTime())
+            trial.pending_markers = []
+
+
+class BeepStream(Component):
+    """
+    Normal and deviant beeps in the slots of the trial, paused around the item presentation, with the beep count
+    response: the participant picks the number of deviant beeps among four options.
+
+    The beeps are written to the beep count CSV file (one row per beep and one row for the pause).
+    """
+
+    def __init__(self, prompt, feedback, number_prompts, arrows_small, response_keys, beep_duration=0.2):
+        self.prompt = prompt
+        self.feedback = feedback
+        self.number_prompts = number_prompts
+        self.arrows_small = arrows_small
+        self.response_keys = response_keys
+        self.beep_duration = beep_duration  # Duration of each beep in seconds
+
+    def start_task(self, session_rng, task_name, n_trials):
+        self.beep_draws = session_rng.draw_beep_draws(task_name, n_trials)
+        self.numbers_rng = session_rng.stream(task_name, 'numbers')
+
+    def start_trial(self, trial):
+        self.trial = trial
+        self.draws = self.beep_draws[trial.index]  # Uniform numbers deciding the type of each beep slot
+        self.slot = 0  # Index of the current beep slot
+        self.beep_counter = 0
+        self.beep_sequence = []  # The beeps played within the current trial
+        self.onsets = []  # core.getTime() at the start of every played beep
+        self.rows = []
+        self.pause_row = None  # The row of the pause during the item presentation
+
+    def frame_events(self, trial):
+        return [(slot_frame, self._slot) for slot_frame in trial.frame_grid.beep_slot_frames]
+
+    def _slot(self, slot_frame):
+        """Play the beep of a slot, or add the pause row if the slot falls in the item presentation."""
+        trial = self.trial
+        # Decide the beep type - the first 3 are normal, at least 3 deviants follow (see dualtask_schedule)
+        beep_type = BeepType(next_beep_type(self.beep_counter, self.beep_sequence.count(BeepType.deviant),
+                                            self.draws[self.slot]))
+        self.slot += 1
+        end_time_str, duration_str = clock_times(trial.start_time)
+
+        if in_beep_blackout(slot_frame, trial.item_start, trial.item_end, trial.frame_grid.beep_blackout):
+            # the length of the pause is updated after the loop, the item presentation may still be adapted
+            if self.pause_row is None:
+                self.pause_row = BeepRecord(
+                    task=trial.task_name, phase=Phase.of_task(trial.task_name), main_trial=trial.main_trial,
+                    beep_count_trial='pause for ' + str(trial.item_end - trial.item_start) + 'frames',
+                    beep_count_stimulus=BeepType.none, presentation=Presentation.pause,
+                    start_time=trial.start_time_str, end_time=end_time_str, duration=duration_str)
+                self.rows.append(self.pause_row)
+            return
+
+        beep = sound.Sound(BEEP_NOTES[beep_type], octave=5, secs=self.beep_duration)
+        self.onsets.append(core.getTime())
+        beep.play()
+        trial.mark_now(MarkerEvent.beep, slot_frame, 2 if beep_type == BeepType.deviant else 1, self.onsets[-1])
+        self.beep_counter += 1
+        self.beep_sequence.append(beep_type)
+        self.rows.append(BeepRecord(
+            task=trial.task_name, phase=Phase.of_task(trial.task_name), main_trial=trial.main_trial,
+            beep_count_trial=self.beep_counter, beep_count_stimulus=beep_type,
+            presentation=Presentation.dual if trial.item_start <= slot_frame < trial.item_end else Presentation.single,
+            start_time=trial.start_time_str, end_time=end_time_str, duration=duration_str))
+
+    def end_presentation(self, trial):
+        # the final length of the item presentation is known now
+        if self.pause_row is not None:
+            self.pause_row.beep_count_trial = 'pause for ' + str(trial.item_end - trial.item_start) + 'frames'
+        for row in self.rows:
+            trial.save(row, 'beep_count')
+
+    def respond(self, window, trial):
+        number_selection, correct_index = select_and_replace_number(self.beep_sequence.count(BeepType.deviant),
+                                                                    self.numbers_rng)
+        # now number_prompts have been created and are of the same length as number_selection
+        for number_prompt, number in zip(self.number_prompts, number_selection):
+            number_prompt.text = str(number)
+        keys, accuracy = arrow_response(
+            window, self.prompt,
+            'Wieviele hohe Töne haben Sie gehört?\n Drücken Sie den entsprechenden Pfeil auf der Tastatur.',
+            (0, -0.75), self.number_prompts[:len(number_selection)] + list(self.arrows_small), self.feedback,
+            self.response_keys, correct_index,
+            lambda accuracy: trial.mark_now(MarkerEvent.beep_count_response, value=accuracy == Accuracy.correct))
+
+        # beeps played alone (not during the item presentation) and the deviants among them
+        single = [row for row in self.rows if row.presentation == Presentation.single]
+        deviants = sum(row.beep_count_stimulus == BeepType.deviant for row in single)
+        return {
+            'beep_sequence': self.beep_sequence,
+            'beep_count_trials': len(single),
+            'beep_count_deviant_trials': deviants,
+            'beep_count_normal_trials': len(single) - deviants,
+            'beep_count_number_selection': number_selection,
+            'beep_count_index_correct_count': correct_index,
+            'beep_count_response': str(keys[0]),
+            'beep_count_response_accuracy': accuracy,
+        }
+
+
+class DotField(Component):
+    """
+    Moving dots shortly after the item onset, with the response of their movement direction.
+
+    With a staircase (see dualtask_staircase) the coherence of every trial is chosen from the previous responses,
+    or - in the tasks the staircase does not adapt - set to the estimated threshold; the presented coherence and
+    the posterior estimates after the response are added to the trial result.
+    """
+
+    def __init__(self, dots, movement_directions, prompt, feedback, arrows, response_keys, staircase=None):
+        self.dots = dots
+        self.movement_directions = movement_directions
+        self.prompt = prompt
+        self.feedback = feedback
+        self.arrows = arrows
+        self.response_keys = response_keys
+        self.staircase = staircase
+
+    def start_task(self, session_rng, task_name, n_trials):
+        self.parameters = session_rng.draw_dot_parameters(task_name, n_trials)
+        self.adapt = self.staircase is not None and self.staircase.adapts(task_name)
+        if self.staircase is not None and not self.adapt:
+            # the coherence stays at the threshold estimated so far
+            self.dots.coherence = min(self.staircase.estimate()['dot_threshold'], 1.0)
+
+    def start_trial(self, trial):
+        if self.adapt:
+            self.dots.coherence = self.staircase.next_coherence()
+        # Random movement direction, start 15 to 50 reference frames after the item onset
+        self.movement = self.movement_directions[self.parameters['movement_index'][trial.index]]
+        self.first_frame = trial.frame_grid.from_reference(
+            trial.reference_start + int(self.parameters['dot_delay'][trial.index]))
+        self.last_frame = self.first_frame + trial.frame_grid.dot_frames
+        self.trial = trial
+        self.shown = False
+
+    def frame_events(self, trial):
+        return [(self.last_frame, self._hide)]
+
+    def frame_spans(self, trial):
+        return [(self.first_frame, self.last_frame, self._draw)]
+
+    def _draw(self, frame):
+        """Present the dots."""
+        self.dots.dir = self.movement
+        self.dots.draw()
+        if not self.shown:
+            self.shown = True
+            self.trial.mark(MarkerEvent.dot_onset, frame, self.movement_directions.index(self.movement))
+
+    def _hide(self, frame):
+        """Mark the first frame without the dots."""
+        self.trial.mark(MarkerEvent.dot_offset, frame)
+
+    def respond(self, window, trial):
+        # these are the arrows pointing at 0,90,180,270 degrees - resembling movement direction of dots
+        keys, accuracy = arrow_response(
+            window, self.prompt,
+            'Drücken Sie den Richtungs-Pfeil auf der Tastatur,\n in die sich die Punkte bewegt haben.',
+            (0, -0.6), self.arrows, self.feedback, self.response_keys,
+            self.movement_directions.index(self.movement),
+            lambda accuracy: trial.mark_now(MarkerEvent.dot_response, value=accuracy == Accuracy.correct))
+        fields = {
+            'dot_direction': self.movement,
+            'dot_1st_frame': self.first_frame,
+            'dot_last_frame': self.last_frame,
+            'dot_response_key': keys,
+            'dot_response_accuracy': accuracy,
+            'dot_coherence': round(float(self.dots.coherence), 4),
+        }
+        if self.staircase is not None:
+            if self.adapt:
+                self.staircase.update(self.dots.coherence, accuracy == Accuracy.correct)
+            fields.update(self.staircase.estimate())
+        return fields
+
+
+class NumberMemory(Component):
+    """A three-digit number shown before the trial, recognized among four options after the presentation."""
+
+    def __init__(self, number_stim, prompt, feedback, number_prompts, arrows_small, response_keys,
+                 show_seconds=2.0):
+        self.number_stim = number_stim
+        self.prompt = prompt
+        self.feedback = feedback
+        self.number_prompts = number_prompts
+        self.arrows_small = arrows_small
+        self.response_keys = response_keys
+        self.show_seconds = show_seconds
+
+    def start_task(self, session_rng, task_name, n_trials):
+        self.rng = session_rng.stream(task_name, 'numbers')
+        self.numbers = self.rng.integers(100, 1000, size=n_trials)
+
+    def before_presentation(self, window, trial):
+        number = int(self.numbers[trial.index])
+        # naming the TextStim to find it in the log-file
+        self.number_stim.name = 'randNumber_' + str(number)
+        self.number_stim.setText(str(number))
+        self.number_stim.draw()
+        window.flip()
+        core.wait(self.show_seconds)
+        window.flip()
+
+    def respond(self, window, trial):
+        number = int(self.numbers[trial.index])
+        number_selection, correct_index = select_and_replace_number(number, self.rng)
+        for number_prompt, option in zip(self.number_prompts, number_selection):
+            number_prompt.text = str(option)
+        keys, accuracy = arrow_response(
+            window, self.prompt,
+            'Welche Nummer haben Sie sich gemerkt?\n Drücken Sie den entsprechenden Pfeil auf der Tastatur.',
+            (0, -0.75), self.number_prompts[:len(number_selection)] + list(self.arrows_small), self.feedback,
+            self.response_keys, correct_index,
+            lambda accuracy: trial.mark_now(MarkerEvent.number_response, value=accuracy == Accuracy.correct))
+        return {
+            'rand_nr': number,
+            'number_selection': number_selection,
+            'index_rand_nr': correct_index,
+            'index_number_response': str(keys[0]),
+            'number_response_accuracy': accuracy,
+        }
+
+
+class KeyListener:
+    """
+    Collects key presses in a background thread while the frames of a trial are presented.
+
+    psychopy's Keyboard queues the presses with the time the key went down - with the psychtoolbox backend the time
+    stamp of the input event itself, on the clock of core.getTime(). The thread empties the queue every
+    poll_interval seconds, so the time of a press does not depend on when the queue is read, and the frame loop
+    does not poll the keyboard at all.
+
+    Attributes:
+        keys (list): The keys that are collected.
+        poll_interval (float): Seconds between two reads of the queue.
+    """
+
+    def __init__(self, keys, poll_interval=0.005):
+        self.keys = list(keys)
+        self.poll_interval = poll_interval
+        self.keyboard = keyboard.Keyboard()
+        self._presses = []
+        self._on_press = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self, on_press=None):
+        """
+        Discard earlier presses and start collecting.
+
+        Args:
+            on_press (callable, optional): Called from the listener thread with the key and the time of every press,
+                e.g. to send a marker.
+        """
+        self._on_press = on_press
+        self._presses = []
+        self._stop.clear()
+        self.keyboard.clearEvents()
+        self._thread = threading.Thread(target=self._run, name='KeyListener', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        """Listener loop: read the queue until stop() is called."""
+        while not self._stop.wait(self.poll_interval):
+            self._collect()
+        self._collect()
+
+    def _collect(self):
+        """Move the queued presses to the list of the trial."""
+        for press in self.keyboard.getKeys(keyList=self.keys, waitRelease=False, clear=True):
+            self._presses.append((press.name, press.tDown))
+            if self._on_press is not None:
+                self._on_press(press.name, press.tDown)
+
+    def stop(self):
+        """
+        Stop collecting.
+
+        Returns:
+            list: (key, time) of the presses since start(), the times on the clock of core.getTime().
+        """
+        if self._thread is None:
+            return []
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        return self._presses
+
+
+class BeepPress(BeepStream):
+    """
+    The beeps of the beep stream, but the participant presses the space bar as fast as possible on every deviant
+    beep instead of counting them.
+
+    A KeyListener collects the presses in its own thread from the first frame of the trial on. After the
+    presentation they are matched to the onsets of the played beeps (see score_beep_presses): every beep is written
+    to the beep press CSV file with the reaction to it, and the trial result gets the number of hits, misses and
+    false alarms and the mean reaction times. As in the beep count task, these are counted over the beeps played
+    alone (not during the item presentation).
+    """
+
+    def __init__(self, listener, prompt, feedback, min_rt=BEEP_PRESS_MIN_RT, max_rt=BEEP_PRESS_MAX_RT,
+                 beep_duration=0.2):
+        super().__init__(prompt, feedback, None, None, None, beep_duration)
+        self.listener = listener
+        self.min_rt = min_rt
+        self.max_rt = max_rt
+
+    def frame_events(self, trial):
+        return [(0, self._listen)] + super().frame_events(trial)
+
+    def _listen(self, frame):
+        """Start collecting the presses of the trial."""
+        trial = self.trial
+        self.listener.start(lambda key, seconds: trial.mark_now(MarkerEvent.key_press, event_time=seconds))
+
+    def end_presentation(self, trial):
+        presses = self.listener.stop()
+        responses, unmatched = score_beep_presses(self.onsets, [beep_type.value for beep_type in self.beep_sequence],
+                                                  [seconds for _, seconds in presses], self.min_rt, self.max_rt)
+        self.unmatched = len(unmatched)
+        self.press_rows = []
+        played = iter(responses)
+        for row in self.rows:
+            response_type = rt = accuracy = None
+            if row.beep_count_stimulus == BeepType.none:
+                # the final length of the item presentation is known now
+                row.beep_count_trial = 'pause for ' + str(trial.item_end - trial.item_start) + 'frames'
+            else:
+                response = next(played)
+                response_type = PressResponse(response.response_type)
+                rt = response.rt
+                accuracy = Accuracy.correct if response_type in (PressResponse.hit, PressResponse.none) \
+                    else Accuracy.incorrect
+            self.press_rows.append(BeepPressRecord(
+                task=row.task, phase=row.phase, main_trial=row.main_trial, beep_press_trial=row.beep_count_trial,
+                beep_press_stimulus=row.beep_count_stimulus, beep_press_rt=rt, beep_press_response_type=response_type,
+                beep_press_accuracy=accuracy, presentation=row.presentation, start_time=row.start_time,
+                end_time=row.end_time, duration=row.duration))
+        for row in self.press_rows:
+            trial.save(row, 'beep_press')
+
+    def respond(self, window, trial):
+        # beeps played alone (not during the item presentation) and the deviants among them
+        single = [row for row in self.press_rows if row.presentation == Presentation.single]
+        deviants = [row for row in single if row.beep_press_stimulus == BeepType.deviant]
+        hits = [row for row in deviants if row.beep_press_response_type == PressResponse.hit]
+        false_alarms = [row for row in single if row.beep_press_response_type == PressResponse.false_alarm]
+
+        self.prompt.setText('Korrekt erkannt: ' + str(len(hits)) + ' von ' + str(len(deviants)))
+        self.prompt.pos = (0, 0)
+        self.prompt.size = 0.12
+        self.prompt.draw()
+        window.flip()
+        core.wait(2)
+
+        correct = sum(row.beep_press_accuracy == Accuracy.correct for row in single)
+        return {
+            'beep_sequence': self.beep_sequence,
+            'beep_press_trials': len(single),
+            'beep_press_deviant_trials': len(deviants),
+            'beep_press_normal_trials': len(single) - len(deviants),
+            'beep_press_hits': len(hits),
+            'beep_press_misses': len(deviants) - len(hits),
+            'beep_press_false_alarms': len(false_alarms),
+            'beep_press_unmatched': self.unmatched,
+            'beep_press_rt_correct': sum(row.beep_press_rt for row in hits) / len(hits) if hits else None,
+            'beep_press_rt_incorrect':
+                sum(row.beep_press_rt for row in false_alarms) / len(false_alarms) if false_alarms else None,
+            'beep_press_accuracy': correct / len(single) if single else None,
+        }
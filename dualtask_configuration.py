@@ -6,6 +6,8 @@ Next, the create_window function creates a new window for the experiment using t
 The initialize_stimuli function sets up all the visual and auditory stimuli as well as parameter values needed for the experiment.
 The get_participant_info function retrieves information about the participant.
 And the append_result_to_csv function is used to save the participant's trial results to a CSV file.
+save_result passes the results to the configured result backend(s) - the CSV files and/or the SQLite session store -
+and to the HDF5 session container if it is switched on.
 """
 
 # Import necessary libraries
@@ -14,6 +16,12 @@ import csv
 import os
 import datetime
 import sys
+from dualtask_rng import new_session_seed
+from dualtask_schedule import MOVEMENT_DIRECTIONS, RESPONSE_KEYS, ITEM_MS, REFERENCE_FRAME_RATE, MAX_ITEM_EXTENSION_MS
+from dualtask_calibration import calibration_key, get_refresh_rate
+from dualtask_store import SessionStore, session_database
+from dualtask_container import SessionContainer, session_container_path
+from dualtask_records import RECORD_TYPES
 
 
 def resource_path(relative_path):
@@ -33,12 +41,83 @@ def resource_path(relative_path):
 # Setup paths
 # stimulus directory
 stim_path = resource_path('stimuli/')
+# pre-generated stimulus lists of the planned participants (python dualtask_lists.py N) - without a list the
+# stimulus order is randomized at the start of the session
+stimulus_lists_file = resource_path('stimuli/stimulus_lists.db')
 # output directory for experiment results
 output_path = resource_path('results/')
 # directory for the pictograms used
 pics_path = resource_path('pics/')
 # directory for all recordings
 record_path = resource_path('recordings/')
+# file with the stored monitor calibrations (refresh rates)
+calibration_file = resource_path('calibration/monitor_calibration.json')
+
+# Display setup in the acoustic lab - the calibration is stored per monitor, resolution and screen
+monitor_name = 'EA244WMi'
+screen_size = (1920, 1080)
+screen_index = 2  # index of the second screen (0 for the first screen, 1 for the second, etc.)
+monitor_key = calibration_key(monitor_name, screen_size, screen_index)
+calibration_revalidation_days = 7  # revalidate the stored refresh rate with the flips of a session after 7 days
+
+# Preflight check before a session (python dualtask_preflight.py) - the measurements of a good run are stored per
+# computer and display setup; a later run fails if a measurement is worse than its baseline by this factor
+preflight_baseline_file = resource_path('calibration/preflight_baselines.json')
+preflight_tolerance = 1.5
+
+# Recording output format - 'flac' (lossless, smallest), 'int24', 'int16' or 'float32' (WAV)
+recording_format = 'flac'
+
+# Voice activity detection during the item presentation
+vad_enabled = True  # adapt the item presentation and recording to the participant's speech
+vad_threshold_db = -45.0  # block level (dBFS) from which the input counts as speech
+vad_hangover = 0.3  # seconds a short pause may last and still count as continued speech
+vad_max_extension = 2.5  # seconds the item presentation is extended at most while speech continues
+vad_early_advance = False  # end the item presentation early once the participant has finished speaking
+vad_trailing_silence = 1.0  # seconds of silence after speech that end the item presentation early
+# the extended presentation of the latest item onset must end within the trial, or its recording is cut off
+if vad_enabled and vad_max_extension * 1000 > MAX_ITEM_EXTENSION_MS:
+    raise ValueError('vad_max_extension must not exceed {:.2f} s - the extended item presentation would outlast '
+                     'the trial.'.format(MAX_ITEM_EXTENSION_MS / 1000))
+
+# Recording health check after every recording - an alert is printed (and shown on the dashboard) if a recording
+# is clipped, (almost) silent or lost input samples
+qc_clip_level = 0.999  # absolute sample value from which a sample counts as clipped
+qc_max_clipping_ratio = 0.001  # alert if more than 0.1% of the samples are clipped
+qc_silence_db = -50.0  # 10 ms blocks below this level (dBFS) count as silent
+qc_min_peak_dbfs = -40.0  # alert if the peak of a recording stays below this level
+
+# Result backend - 'csv' (the CSV files per task), 'sqlite' (one SQLite database per session) or 'both'
+# the replay and analysis tools read the CSV files
+result_backend = 'csv'
+
+# HDF5 session container - the recordings and result tables of a session in one file
+# (results/<subject>/session_<subject>_<date>.h5, needs h5py); the recordings are then not written as single files
+# (with recording_format 'int16' they are stored as 16-bit integers, otherwise as float32)
+session_container = False
+
+# Experimenter dashboard - a local web page in a separate process showing the progress of the session
+dashboard_enabled = False
+dashboard_port = 8765  # the page is served at http://127.0.0.1:8765/
+
+# Coherence of the moving dots - 'fixed' (dot_coherence in initialize_stimuli), 'adaptive_practice' (a QUEST+
+# staircase adapts the coherence in the practice trials, the test trials use the estimated threshold) or 'adaptive'
+# (the staircase also runs in the test trials); the coherence and the posterior estimates are written per trial
+dot_coherence_mode = 'fixed'
+
+# Beep press dual task after the beep count task - a number to remember, and a press of the space bar on every
+# high beep; the presses are collected with their key-down time in a background thread
+beep_press_enabled = False
+
+# Event markers for external recording systems (e.g. physiological recordings) - item onset, beeps, dots and
+# responses are sent as binary UDP datagrams to marker_host:marker_port (see dualtask_markers)
+marker_enabled = False
+marker_host = '127.0.0.1'
+marker_port = 15000
+
+# psychopy log file of the session (results/<subject>/log_<subject>_<date>.log), written in a background thread
+log_enabled = True
+log_repeat_interval = 0.5  # repeated values and changes of a stimulus attribute within 0.5 s are summarized
 
 
 # to use in acoustic lab - second monitor name fixed here
@@ -50,14 +129,14 @@ def create_window():
     win: A PsychoPy visual.Window object for the experiment.
     """
     # Create a monitor object for the second screen
-    second_monitor = monitors.Monitor(name='EA244WMi')
+    second_monitor = monitors.Monitor(name=monitor_name)
     # Set the appropriate settings for the second monitor
-    second_monitor.setSizePix((1920, 1080))  # Set the desired resolution of the second screen
+    second_monitor.setSizePix(screen_size)  # Set the desired resolution of the second screen
 
     # Create and return a window for the experiment on the second monitor
     return visual.Window(monitor=second_monitor,  # Use the second monitor
-                         size=(1920, 1080),
-                         screen=2,  # Specify the index of the second screen (0 for the first screen, 1 for the second, etc.)
+                         size=screen_size,
+                         screen=screen_index,  # Specify the index of the second screen
                          allowGUI=True,
                          fullscr=True,
                          color=(255, 255, 255)
@@ -80,13 +159,15 @@ def initialize_stimuli(window):
             prompt (psychopy.visual.TextStim): Text stimulus for displaying response prompt.
             feedback (psychopy.visual.TextStim): Text stimulus for displaying feedback.
             fs (int): Sample rate for recordings.
-            rec_seconds (float): Recording duration in seconds, calculated based on visual frames and estimated frame rate.
+            rec_seconds (float): Maximum recording duration in seconds - the duration of the item presentation including
+            the possible extension by the voice activity detection.
             movementDirections (list): Possible directions for the dots to move.
             responseList (list): Corresponding responses to the movement directions.
             dots (psychopy.visual.DotStim): Dot stimulus object.
             arrows (list): List of visual.ImageStim objects representing arrows in different orientations.
             arrows_small (list): List of smaller visual.ImageStim objects representing arrows in different orientations.
             number_prompts (list): List of visual.TextStim objects for number prompts in different positions.
+            frame_rate (float): The refresh rate of the window, used to map the trial timeline to frames.
     """
 
     # set up different TextStim needed throughout experiment
@@ -126,24 +207,24 @@ def initialize_stimuli(window):
 
     # default parameters for the recordings
     fs = 48000  # Sample rate
-    # Calculate the recording duration in seconds
-    visual_frames = 350
-    # automatically estimate monitor's refresh rate from window object
-    estimated_frame_rate = window.getActualFrameRate()
-    # If for some reason the function fails to get the actual frame rate, it will return None.
-    # In this case, you could default to a reasonable estimate, e.g., 60 Hz.
-    if estimated_frame_rate is None:
-        estimated_frame_rate = 60
+    # Calculate the recording duration in seconds - the item is shown for 350 frames at 60 Hz (5.83 s)
+    rec_seconds = ITEM_MS / 1000.0
+    # while the participant is still speaking the item presentation may be extended - the buffers must fit that
+    if vad_enabled:
+        rec_seconds += vad_max_extension
 
-    rec_seconds = visual_frames / estimated_frame_rate
+    # monitor's refresh rate from the calibration cache - measured from the window only on the first launch
+    # on this display setup; if the measurement fails, a reasonable estimate of 60 Hz is used
+    # all durations are mapped to frames of this refresh rate, so they stay the same on high-refresh monitors
+    frame_rate = get_refresh_rate(window, calibration_file, monitor_key, default_rate=60)
 
     # dot parameters
     n_dots = 500  # number of dots in the stimulus
     dot_size = 6  # size of each dot in pixels
-    dot_speed = 3  # speed of the dots in pixels per frame
+    dot_speed = 3 * REFERENCE_FRAME_RATE / frame_rate  # speed of the dots in pixels per frame - 3 pixels at 60 Hz
     dot_coherence = 0.5  # coherence - proportion of dots that move in the same direction
-    movementDirections = [0, 90, 180, 270]  # possible directions to move
-    responseList = ['right', 'up', 'left', 'down']  # corresponding responses
+    movementDirections = list(MOVEMENT_DIRECTIONS)  # possible directions to move - [0, 90, 180, 270]
+    responseList = list(RESPONSE_KEYS)  # corresponding responses - ['right', 'up', 'left', 'down']
 
     # dot stimulus
     dots = visual.DotStim(
@@ -202,7 +283,7 @@ def initialize_stimuli(window):
         number_prompts.append(number_prompt)
 
 
-    return werKommt, fixation, item, prompt, feedback, fs, rec_seconds, movementDirections, responseList, dots, arrows, arrows_small, number_prompts
+    return werKommt, fixation, item, prompt, feedback, fs, rec_seconds, movementDirections, responseList, dots, arrows, arrows_small, number_prompts, frame_rate
 
 
 def get_participant_info():
@@ -217,6 +298,8 @@ def get_participant_info():
             - 'experiment' (str): The name of the experiment, in this case, 'dual_task_experiment'.
             - 'subject' (str): The subject's unique identifier entered by the participant.
             - 'cur_date' (str): The current date and time when the function is executed, in 'YYYY-MM-DD_HHhMM' format.
+            - 'session_seed' (int): The seed of all random number streams of the session. A fresh seed is proposed,
+              entering the seed of an earlier session reproduces its randomization.
 
     If the user cancels the dialog box, the function will terminate the experiment by calling core.quit().
 
@@ -227,7 +310,8 @@ def get_participant_info():
     experiment_config = {
         'experiment': 'dual_task_experiment',
         'subject': 'subjectID',
-        'cur_date': datetime.datetime.now().strftime("%Y-%m-%d_%Hh%M")  # Use strftime to format the date string
+        'cur_date': datetime.datetime.now().strftime("%Y-%m-%d_%Hh%M"),  # Use strftime to format the date string
+        'session_seed': new_session_seed()
     }
     # Create a dialogue box for the subject to enter their information
     info_dialog = gui.DlgFromDict(experiment_config,
@@ -247,15 +331,16 @@ def append_result_to_csv(result, base_filename, participant_info, type='main'):
     Append a participant's trial result to a CSV file. This can correspond to different task results and the main CSV file with general parameters
     throughout all experiment parts. The main CSV file includes the single task parameter values as well as the dot-motion and calculation task parameters.
 
-    The function takes in a dictionary of results and participant information, and a filename, then appends the results to the respective CSV file
-    (either the main, beep_press, or beep_count file). If the file doesn't exist, it will create the file and add headers.
+    The function takes in a result record and participant information, and a filename, then appends the results to the respective CSV file
+    (the main, beep_count or beep_press file). If the file doesn't exist, it will create the file and add headers. Header and column order are
+    taken from the record type (see dualtask_records).
 
     Args:
-        result (dict): A dictionary containing the data for a single trial.
+        result (Record): A TrialRecord for a single trial, a BeepRecord or a BeepPressRecord for a beep.
         base_filename (str): The base name of the CSV file to which results are appended.
         participant_info (dict): A dictionary containing the participant's information, including experiment name, subjectID, and date.
         type (str, optional): Determines the type of task for which results are being recorded. It can be 'main' for the main trial results,
-        'beep_press' for beep press task results, and 'beep_count' for beep count task results. Defaults to 'main'.
+        'beep_count' for beep count task results and 'beep_press' for beep press task results. Defaults to 'main'.
 
     Returns:
         None. The function directly writes the results to the CSV file.
@@ -271,96 +356,85 @@ def append_result_to_csv(result, base_filename, participant_info, type='main'):
 
     # Define the filename by appending the type of the task to the base filename
     filename = f"{base_filename}_{type}.csv"
+    record_type = RECORD_TYPES[type]
 
-    # Check if the file does not exist to write the header
+    # Check if the file does not exist to write the header (the columns of the record type)
     if not os.path.isfile(filename):
         with open(filename, 'w') as file:
-            if type == 'main':
-                file.write(
-                'experiment,'
-                'subjectID,'
-                'date,'
-                'task,'
-                'main_trial,'
-                'phase,'
-                'stimulus_id,'
-                'stimulus,'
-                'stimulus_rec,'
-                'dot_direction,'
-                'dot_1st_frame,'
-                'dot_last_frame,'
-                'dot_response_key,'
-                'dot_response_accuracy,'
-                'beep_sequence,'
-                'beep_count_trials,'
-                'beep_count_deviant_trials,'
-                'beep_count_normal_trials,'
-                'beep_count_number_selection,'
-                'beep_count_index_correct_count,'            
-                'beep_count_response,'
-                'beep_count_response_accuracy,'
-                'start_time,'
-                'end_time,'
-                'duration \n'
-                )
-            elif type == 'beep_count':
-                file.write(
-                    'experiment,'
-                    'subjectID,'
-                    'date,'
-                    'task,'
-                    'phase,'
-                    'main_trial,'
-                    'beep_count_trial,'
-                    'beep_count_stimulus,'
-                    'presentation,'
-                    'start_time,'
-                    'end_time,'
-                    'duration \n'
-                )
-    # Now append the result data
+            file.write(','.join(record_type.header()) + ' \n')
+    # Now append the result data - the record is turned into text only here
     with open(filename, 'a', newline='') as output_file:
         writer = csv.writer(output_file)
+        writer.writerow(result.export_row(participant_info))
+
+
+# Open SQLite session stores, one per database file
+_session_stores = {}
+
+
+def save_result(result, base_filename, participant_info, type='main'):
+    """
+    Save a result with the configured result backend(s).
+
+    With the 'csv' backend the result is appended to the CSV file (see append_result_to_csv). With the 'sqlite'
+    backend it is inserted into the session database in the subject's results folder; a 'main' result ends a
+    trial, so the rows of the trial are committed together. With session_container switched on the row is also
+    added to the table of the CSV file in the session container.
+
+    Args:
+        result (Record): A TrialRecord for a single trial (or a BeepRecord or BeepPressRecord for a beep).
+        base_filename (str): The base name of the CSV file to which results are appended.
+        participant_info (dict): A dictionary containing the participant's information.
+        type (str, optional): 'main', 'beep_count' or 'beep_press'. Defaults to 'main'.
+
+    Raises:
+        ValueError: If result_backend is not 'csv', 'sqlite' or 'both'.
+    """
+    if result_backend not in ('csv', 'sqlite', 'both'):
+        raise ValueError("Unknown result backend '{}'. Use 'csv', 'sqlite' or 'both'.".format(result_backend))
+    if result_backend in ('csv', 'both'):
+        append_result_to_csv(result, base_filename, participant_info, type)
+    if result_backend in ('sqlite', 'both'):
+        path = session_database(os.path.dirname(base_filename), participant_info)
+        store = _session_stores.get(path)
+        if store is None:
+            store = _session_stores[path] = SessionStore(path, participant_info)
+        store.add_result(result, type)
         if type == 'main':
-            writer.writerow([
-                participant_info['experiment'],
-                participant_info['subject'],
-                participant_info['cur_date'],
-                result['task'],
-                result['main_trial'],
-                result['phase'],
-                result['stimulus_id'],
-                result['stimulus'],
-                result['stimulus_rec'],
-                result['dot_direction'],
-                result['dot_1st_frame'],
-                result['dot_last_frame'],
-                result['dot_response_key'],
-                result['dot_response_accuracy'],
-                result['beep_sequence'],
-                result['beep_count_trials'],
-                result['beep_count_deviant_trials'],
-                result['beep_count_normal_trials'],
-                result['beep_count_number_selection'],
-                result['beep_count_index_correct_count'],
-                result['beep_count_response'],
-                result['beep_count_response_accuracy'],
-                result['start_time'],
-                result['end_time'],
-                result['duration']
-            ])
-        elif type == 'beep_count':
-            writer.writerow([
-                participant_info['experiment'],
-                participant_info['subject'],
-                participant_info['cur_date'],
-                result['task'],
-                result['phase'],
-                result['main_trial'],
-                result['beep_count_trial'],
-                result['beep_count_stimulus'],
-                result['presentation'],
-                result['start_time'],
-                result['end_time'],
-                result['duration']
-            ])
+            store.commit()
+    if session_container:
+        container = get_session_container(os.path.dirname(base_filename), participant_info)
+        container.add_result(os.path.basename(base_filename) + '_' + type, RECORD_TYPES[type].header(),
+                             result.export_row(participant_info))
+
+
+# Open HDF5 session containers, one per container file
+_session_containers = {}
+
+
+def get_session_container(subject_path, participant_info):
+    """
+    Return the session container of a session, opening it on first use.
+
+    Args:
+        subject_path (str): The results directory of the subject.
+        participant_info (dict): The participant's information.
+
+    Returns:
+        SessionContainer: The background writer of the session's container file.
+    """
+    path = session_container_path(subject_path, participant_info)
+    container = _session_containers.get(path)
+    if container is None:
+        container = _session_containers[path] = SessionContainer(path, recording_format)
+    return container
+
+
+def close_result_stores():
+    """Commit and close the SQLite session stores and the session containers at the end of the session."""
+    for store in _session_stores.values():
+        store.close()
+    _session_stores.clear()
+    for container in _session_containers.values():
+        container.close()
+    _session_containers.clear()
@@ -0,0 +1,371 @@
+"""
+Single-file HDF5 container of a session.
+Instead of one audio file per trial and several CSV files per task, a session can be written into one HDF5 file,
+"session_<subject>_<date>.h5" in the subject's results folder - a network share copies and opens one large file
+much faster than hundreds of small ones.
+
+Layout of the file:
+    /recordings/<name>  one dataset per recording (float32, or int16 with recording_format 'int16') with the
+                        attributes task, main_trial, stimulus_id, sample_rate and written. <name> is the file
+                        name of the recording without extension, as written to the stimulus_rec column.
+    /results/<name>     one table per result file (<name> is the CSV file name without '.csv'): a chunked,
+                        growing 2-d dataset of strings with the exported values of the rows and the column names
+                        in the attribute 'columns'.
+
+All writes happen in a background thread (SessionContainer). The recordings are stored contiguously, so a reader
+maps the samples of any trial directly from the file into memory (ContainerReader.recording) without reading the
+other recordings.
+
+Example:
+    from dualtask_container import ContainerReader
+    with ContainerReader('results/<subject>/session_<subject>_<date>.h5') as container:
+        recordings = container.recordings()  # table of all recordings with their attributes
+        samples, fs = container.recording(recordings['name'][0])
+        main = container.results(container.tables()[0])
+"""
+
+# Import necessary libraries
+import datetime
+import glob
+import hashlib
+import logging
+import os
+import queue
+import threading
+import numpy as np
+import pandas
+from dualtask_recording import load_recording
+
+# h5py is only needed for the session container - without it the experiment writes loose files as before
+try:
+    import h5py
+except ImportError:
+    h5py = None
+
+
+# Rows of a result table per HDF5 chunk
+TABLE_CHUNK_ROWS = 64
+
+
+def session_container_path(subject_path, participant_info):
+    """
+    Return the container file of a session.
+
+    Args:
+        subject_path (str): The results directory of the subject.
+        participant_info (dict): The participant's information.
+
+    Returns:
+        str: e.g. 'results/<subject>/session_<subject>_<date>.h5'.
+    """
+    return os.path.join(subject_path, 'session_{}_{}.h5'.format(participant_info['subject'],
+                                                                  participant_info['cur_date']))
+
+
+def stored_sha256(stored):
+    """Return the SHA-256 hash of the stored samples of a recording (its checksum in the manifest)."""
+    return hashlib.sha256(np.ascontiguousarray(stored).tobytes()).hexdigest()
+
+
+def recording_source(csv_file, row, recordings_path):
+    """
+    Find the recording of a result row.
+
+    A recording is read from its file in the recordings directory, or from the session container next to the CSV
+    file if there is no such file.
+
+    Args:
+        csv_file (str): The result CSV file of the row.
+        row (dict): The row with the columns subjectID, date and stimulus_rec.
+        recordings_path (str): The recordings directory (with one folder per subject).
+
+    Returns:
+        tuple: (path of the file, None) or (path of the session container, name of the recording).
+    """
+    path = os.path.join(recordings_path, row['subjectID'], row['stimulus_rec'])
+    if os.path.isfile(path):
+        return path, None
+    return (session_container_path(os.path.dirname(csv_file), {'subject': row['subjectID'], 'cur_date': row['date']}),
+            row['stimulus_rec'])
+
+
+def container_sources(path):
+    """
+    List the recordings of all session containers below a directory.
+
+    Args:
+        path (str): The directory, e.g. results/ or results/<subject>.
+
+    Returns:
+        list: (path of the session container, name of the recording) of every recording.
+    """
+    sources = []
+    for container_file in sorted(glob.glob(os.path.join(path, '**', 'session_*.h5'), recursive=True)):
+        with ContainerReader(container_file) as container:
+            sources += [(container_file, name) for name in container.names()]
+    return sources
+
+
+def describe_source(source):
+    """Return a recording source as text for messages and tables."""
+    path, name = source
+    return path if name is None else '{} in {}'.format(name, path)
+
+
+def read_container_recording(path, name):
+    """
+    Read a recording from a session container and compute the hash of its stored samples.
+
+    Args:
+        path (str): Path of the session container.
+        name (str): Name of the recording in the container.
+
+    Returns:
+        tuple: The samples (float, full scale 1.0), the sample rate and the SHA-256 hash (see stored_sha256).
+    """
+    with ContainerReader(path) as container:
+        stored, fs = container.recording(name, mmap=False)
+    samples = stored / 32767.0 if stored.dtype == np.int16 else stored
+    return samples, fs, stored_sha256(stored)
+
+
+def load_source(source, mmap=False):
+    """
+    Read a recording from its file or its session container.
+
+    Args:
+        source (tuple): (path of the file, None) or (path of the session container, name of the recording).
+        mmap (bool, optional): Map WAV files (and uncompressed container datasets of float32 recordings) instead
+            of reading them. Defaults to False.
+
+    Returns:
+        tuple: The samples (float, full scale 1.0) and the sample rate.
+    """
+    path, name = source
+    if name is None:
+        return load_recording(path, mmap=mmap)
+    with ContainerReader(path) as container:
+        stored, fs = container.recording(name, mmap=mmap)
+    return (stored / 32767.0 if stored.dtype == np.int16 else stored), fs
+
+
+class SessionContainer:
+    """
+    Background writer of the HDF5 container of a session.
+
+    Recordings and result rows are queued and written by one worker thread, which also owns the HDF5 file; the
+    file is flushed whenever the queue runs empty, so a crash loses at most the last queued entries.
+
+    Attributes:
+        path (str): The container file.
+        sample_format (str): 'int16' stores the recordings as 16-bit integers, every other format as float32.
+        recordings_written (int): Number of recordings written so far.
+        rows_written (int): Number of result rows written so far.
+        errors (list): (entry, message) of entries that could not be written.
+    """
+
+    def __init__(self, path, sample_format='float32'):
+        if h5py is None:
+            raise RuntimeError('The session container needs the h5py package. Please install it or switch '
+                               'session_container off.')
+        self.path = path
+        self.sample_format = sample_format
+        self.recordings_written = 0
+        self.rows_written = 0
+        self.errors = []
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = h5py.File(path, 'a')
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='SessionContainer', daemon=True)
+        self._thread.start()
+
+    def add_recording(self, name, data, fs, n_frames=None, metadata=None, release=None, written=None):
+        """
+        Queue a recording for writing.
+
+        Args:
+            name (str): The name of the recording (file name without extension).
+            data (numpy.ndarray): The recording buffer. It must not be changed until it is released.
+            fs (int): The sample rate of the recording.
+            n_frames (int, optional): Number of frames of the buffer to write. Defaults to the whole buffer.
+            metadata (dict, optional): 'task', 'main_trial' and 'stimulus_id' of the recording.
+            release (callable, optional): Called with the buffer once it is written, e.g. to return it to the pool.
+            written (callable, optional): Called with the number of samples, the number of bytes and the hash of
+                the stored samples once they are written, e.g. to add the recording to the manifest.
+        """
+        self._queue.put(('recording', (name, data, fs, n_frames, metadata or {}, release, written)))
+
+    def add_result(self, name, columns, row):
+        """
+        Queue a row of a result table.
+
+        Args:
+            name (str): The name of the table (the CSV file name without '.csv').
+            columns (list): The column names of the table.
+            row (list): The exported values of the row (see Record.export_row).
+        """
+        self._queue.put(('result', (name, columns, row)))
+
+    def _write_recording(self, name, data, fs, n_frames, metadata, release, written):
+        """Write a recording as a contiguous dataset."""
+        try:
+            samples = data if n_frames is None else data[:n_frames]
+            if samples.ndim > 1 and samples.shape[1] == 1:
+                samples = samples[:, 0]
+            if self.sample_format == 'int16':
+                samples = np.round(np.clip(samples, -1.0, 1.0) * 32767).astype(np.int16)
+            recordings = self._file.require_group('recordings')
+            if name in recordings:
+                del recordings[name]  # a repeated trial replaces its recording
+            dataset = recordings.create_dataset(name, data=np.asarray(samples, dtype=samples.dtype))
+            dataset.attrs['sample_rate'] = fs
+            for key in ('task', 'main_trial', 'stimulus_id'):
+                dataset.attrs[key] = str(metadata.get(key, ''))
+            dataset.attrs['written'] = datetime.datetime.now().isoformat(timespec='seconds')
+            self.recordings_written += 1
+            if written is not None:
+                # hash before the buffer is released - float32 samples are a view of the pooled buffer
+                written(len(samples), samples.nbytes, stored_sha256(samples))
+        finally:
+            if release is not None:
+                release(data)
+
+    def _write_row(self, name, columns, row):
+        """Append a row to a result table, creating the table on its first row."""
+        results = self._file.require_group('results')
+        if name not in results:
+            table = results.create_dataset(name, shape=(0, len(columns)), maxshape=(None, len(columns)),
+                                           dtype=h5py.string_dtype(), chunks=(TABLE_CHUNK_ROWS, len(columns)))
+            table.attrs['columns'] = list(columns)
+        table = results[name]
+        table.resize(table.shape[0] + 1, axis=0)
+        table[-1] = [str(value) for value in row]
+        self.rows_written += 1
+
+    def _run(self):
+        """Worker loop: write queued entries until None is received."""
+        while True:
+            try:
+                job = self._queue.get(timeout=1.0)
+            except queue.Empty:
+                # idle - put what was written on disk
+                self._file.flush()
+                continue
+            if job is None:
+                self._queue.task_done()
+                break
+            kind, arguments = job
+            try:
+                if kind == 'recording':
+                    self._write_recording(*arguments)
+                else:
+                    self._write_row(*arguments)
+            except Exception as e:
+                # Never let a failing write stop the worker - remember the error and report it at the end
+                self.errors.append((arguments[0], str(e)))
+                logging.log(level=logging.ERROR,
+                            msg="Fehler beim Schreiben von '{}' in den Container: {}".format(arguments[0], e))
+            finally:
+                self._queue.task_done()
+        self._file.close()
+
+    def flush(self):
+        """Block until all entries queued so far are written."""
+        self._queue.join()
+
+    def close(self):
+        """Write all pending entries and close the file."""
+        self._queue.put(None)
+        self._thread.join()
+
+    def summary(self):
+        """Return the numbers of written recordings, result rows and errors."""
+        return {'path': self.path, 'recordings_written': self.recordings_written, 'rows_written': self.rows_written,
+                'errors': len(self.errors)}
+
+
+class ContainerReader:
+    """
+    Random access to the recordings and result tables of a session container.
+
+    Attributes:
+        path (str): The container file.
+    """
+
+    def __init__(self, path):
+        if h5py is None:
+            raise RuntimeError('Reading a session container needs the h5py package.')
+        self.path = path
+        self._file = h5py.File(path, 'r')
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        """Close the file (mapped recordings stay valid)."""
+        self._file.close()
+
+    def recordings(self):
+        """
+        List the recordings of the session.
+
+        Returns:
+            pandas.DataFrame: One row per recording with its name, attributes and number of samples.
+        """
+        rows = []
+        for name, dataset in self._file.get('recordings', {}).items():
+            rows.append(dict(name=name, n_samples=dataset.shape[0], **{key: dataset.attrs[key]
+                                                                       for key in dataset.attrs}))
+        return pandas.DataFrame(rows)
+
+    def names(self):
+        """Return the names of the recordings."""
+        return list(self._file.get('recordings', {}))
+
+    def recording(self, name, mmap=True):
+        """
+        Return the samples of a recording.
+
+        Args:
+            name (str): The name of the recording (as in the stimulus_rec column).
+            mmap (bool, optional): Map the samples from the file instead of reading them, so only the samples that
+                are used are loaded from disk. Defaults to True.
+
+        Returns:
+            tuple: The samples (1-D numpy array - float32, or int16 for containers written with 'int16') and the
+            sample rate.
+        """
+        dataset = self._file['recordings'][name]
+        fs = int(dataset.attrs['sample_rate'])
+        offset = dataset.id.get_offset()
+        if mmap and offset is not None and dataset.chunks is None and dataset.compression is None:
+            return np.memmap(self.path, mode='r', dtype=dataset.dtype, offset=offset, shape=dataset.shape), fs
+        return dataset[()], fs
+
+    def tables(self):
+        """Return the names of the result tables."""
+        return list(self._file.get('results', {}))
+
+    def results(self, name):
+        """
+        Return a result table with the same values as its CSV file.
+
+        Args:
+            name (str): The name of the table.
+
+        Returns:
+            pandas.DataFrame: The rows of the table; numeric columns are converted to numbers.
+        """
+        table = self._file['results'][name]
+        frame = pandas.DataFrame(table.asstr()[()], columns=list(table.attrs['columns']))
+        for column in frame.columns:
+            try:
+                frame[column] = pandas.to_numeric(frame[column])
+            except (ValueError, TypeError):
+                pass
+        return frame
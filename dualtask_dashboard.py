@@ -0,0 +1,292 @@
+"""
+Live experimenter dashboard.
+The experiment publishes its progress into a small shared-memory status block at every trial boundary: the
+current task and trial, the running accuracy of the dot and beep count responses, dropped frames, the levels
+of the last recording and recording alerts. The dashboard runs in its own process, reads the block and serves it
+as a local web page, so the experimenter can follow the session without looking at the participant's screen.
+
+The block is a seqlock: the writer makes the sequence number odd while it writes and even once it is done, the
+reader retries if the number was odd or changed while it copied the block. Neither side locks or blocks the
+other, and publishing costs a single memory copy - no I/O in the experiment process.
+
+Usage:
+    python dualtask_dashboard.py <block name> [--port 8765]
+        Serves the status of a running experiment at http://127.0.0.1:<port>/ (started by the experiment itself
+        if dashboard_enabled is set in dualtask_configuration.py).
+"""
+
+# Import necessary libraries
+import argparse
+import json
+import multiprocessing
+import struct
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from multiprocessing import shared_memory
+
+
+# Layout of the status block: sequence number followed by the payload
+SEQUENCE = struct.Struct('<Q')
+PAYLOAD = struct.Struct('<d32s32s64s10I3d')
+BLOCK_SIZE = SEQUENCE.size + PAYLOAD.size
+
+# Fields of the payload in the order of PAYLOAD
+FIELDS = ('updated', 'subject', 'task', 'last_alert', 'task_index', 'trial', 'n_trials', 'dot_correct', 'dot_total',
+          'beep_correct', 'beep_total', 'dropped_frames', 'qc_alerts', 'finished', 'peak_dbfs', 'rms_dbfs',
+          'frame_rate')
+TEXT_FIELDS = ('subject', 'task', 'last_alert')
+
+# Level reported for silent (or missing) recordings
+SILENCE_DBFS = -120.0
+
+
+class StatusBlock:
+    """
+    The shared-memory status block of a session.
+
+    The experiment creates the block and is its only writer; the dashboard attaches to it by name and only reads.
+    The writer keeps the current values in a dictionary and publishes all of them at once.
+
+    Attributes:
+        name (str): The name of the shared memory block.
+    """
+
+    def __init__(self, name=None, create=False):
+        self._memory = shared_memory.SharedMemory(name=name, create=create, size=BLOCK_SIZE if create else 0)
+        # a dashboard process started by the experiment shares its resource tracker - only a dashboard started
+        # from the command line has its own
+        if not create and multiprocessing.parent_process() is None:
+            # the experiment owns the block - keep the resource tracker of the reader from removing it at exit
+            try:
+                from multiprocessing import resource_tracker
+                resource_tracker.unregister(self._memory._name, 'shared_memory')
+            except (ImportError, AttributeError, KeyError):
+                pass
+        self.name = self._memory.name
+        self._owner = create
+        self._sequence = 0
+        self._values = {'updated': 0.0, 'subject': '', 'task': '', 'last_alert': '', 'task_index': 0, 'trial': 0,
+                        'n_trials': 0, 'dot_correct': 0, 'dot_total': 0, 'beep_correct': 0, 'beep_total': 0,
+                        'dropped_frames': 0, 'qc_alerts': 0, 'finished': 0, 'peak_dbfs': SILENCE_DBFS,
+                        'rms_dbfs': SILENCE_DBFS, 'frame_rate': 0.0}
+        if create:
+            self._write()
+
+    @classmethod
+    def create(cls):
+        """Create a new status block - done once by the experiment."""
+        return cls(create=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to the status block of a running experiment."""
+        return cls(name=name)
+
+    def _write(self):
+        """Publish the current values (writer only)."""
+        values = dict(self._values, updated=time.time())
+        # text longer than its field is cut off by struct
+        payload = PAYLOAD.pack(*[value.encode('utf-8') if isinstance(value, str) else value
+                                 for value in (values[field] for field in FIELDS)])
+        buffer = self._memory.buf
+        self._sequence += 1  # odd: the payload is being written
+        SEQUENCE.pack_into(buffer, 0, self._sequence)
+        buffer[SEQUENCE.size:BLOCK_SIZE] = payload
+        self._sequence += 1  # even: the payload is consistent
+        SEQUENCE.pack_into(buffer, 0, self._sequence)
+
+    def publish(self, **values):
+        """
+        Update some values and publish the whole status.
+
+        Args:
+            **values: New values of fields in FIELDS.
+        """
+        unknown = set(values) - set(FIELDS)
+        if unknown:
+            raise ValueError("Unknown status fields: {}".format(', '.join(sorted(unknown))))
+        self._values.update(values)
+        self._write()
+
+    def start_task(self, task_name, n_trials, frame_rate=0.0):
+        """Publish the start of a task."""
+        self.publish(task=task_name, task_index=self._values['task_index'] + 1, trial=0, n_trials=n_trials,
+                     frame_rate=frame_rate)
+
+    def trial_done(self, trial, dropped_frames=0, levels=None, alert=None, dot_accuracy=None, beep_accuracy=None):
+        """
+        Publish the end of a trial.
+
+        Args:
+            trial (int): The number of the finished trial (starting at 1).
+            dropped_frames (int, optional): Frames dropped during the trial.
+            levels (tuple, optional): Peak and RMS level of the trial's recording in dBFS.
+            alert (str, optional): The alert of the recording health check, None if the recording is fine.
+            dot_accuracy (str, optional): 'correct' or 'incorrect' for the dot response of a dual task.
+            beep_accuracy (str, optional): 'correct' or 'incorrect' for the beep count response of a dual task.
+        """
+        values = self._values
+        update = {'trial': trial, 'dropped_frames': values['dropped_frames'] + dropped_frames}
+        if levels is not None:
+            update['peak_dbfs'], update['rms_dbfs'] = levels
+        if alert:
+            update['qc_alerts'] = values['qc_alerts'] + 1
+            update['last_alert'] = alert
+        if dot_accuracy is not None:
+            update['dot_total'] = values['dot_total'] + 1
+            update['dot_correct'] = values['dot_correct'] + (dot_accuracy == 'correct')
+        if beep_accuracy is not None:
+            update['beep_total'] = values['beep_total'] + 1
+            update['beep_correct'] = values['beep_correct'] + (beep_accuracy == 'correct')
+        self.publish(**update)
+
+    def read(self):
+        """
+        Read a consistent copy of the status (reader side).
+
+        Returns:
+            dict: The published values, with the running accuracies added.
+        """
+        buffer = self._memory.buf
+        while True:
+            before = SEQUENCE.unpack_from(buffer, 0)[0]
+            if before % 2:
+                time.sleep(0.0001)
+                continue
+            payload = bytes(buffer[SEQUENCE.size:BLOCK_SIZE])
+            if SEQUENCE.unpack_from(buffer, 0)[0] == before:
+                break
+        status = dict(zip(FIELDS, PAYLOAD.unpack(payload)))
+        for field in TEXT_FIELDS:
+            status[field] = status[field].rstrip(b'\0').decode('utf-8', 'replace')
+        status['dot_accuracy'] = status['dot_correct'] / status['dot_total'] if status['dot_total'] else None
+        status['beep_accuracy'] = status['beep_correct'] / status['beep_total'] if status['beep_total'] else None
+        return status
+
+    def close(self):
+        """Detach from the block; the experiment also removes it."""
+        self._memory.close()
+        if self._owner:
+            self._memory.unlink()
+
+
+def start_dashboard(status_block, port=8765, timeout=10.0):
+    """
+    Start the dashboard process of a status block.
+
+    The dashboard runs in a separate process, so serving the page never competes with the frame loop. The address
+    is only printed once the process has bound its port.
+
+    Args:
+        status_block (StatusBlock): The status block created by the experiment.
+        port (int, optional): The local port of the web page. Defaults to 8765.
+        timeout (float, optional): Seconds to wait for the process to bind its port. Defaults to 10.
+
+    Returns:
+        multiprocessing.Process or None: The dashboard process, None if it could not be started (e.g. the port
+        is taken by another program).
+    """
+    ready = multiprocessing.Event()
+    process = multiprocessing.Process(target=serve, args=(status_block.name, port, ready), name='Dashboard',
+                                      daemon=True)
+    process.start()
+    deadline = time.monotonic() + timeout
+    # a process that cannot bind its port ends right away
+    while not ready.wait(0.05) and process.is_alive() and time.monotonic() < deadline:
+        pass
+    if not ready.is_set() or not process.is_alive():
+        process.terminate()
+        print('The experimenter dashboard could not be started on port {} - is the port in use? '
+              'The session runs without it.'.format(port))
+        return None
+    print('Experimenter dashboard: http://127.0.0.1:{}/'.format(port))
+    return process
+
+
+PAGE = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Dual task dashboard</title>
+<style>
+body { font-family: sans-serif; margin: 2em; }
+td { padding: 0.3em 1.5em 0.3em 0; font-size: 1.4em; }
+.warn { color: #c00; }
+</style></head>
+<body><h1>Dual task dashboard</h1><table id="status"></table>
+<script>
+function percent(value) { return value === null ? '-' : (100 * value).toFixed(0) + ' %'; }
+function update() {
+  fetch('/status').then(response => response.json()).then(s => {
+    const age = Date.now() / 1000 - s.updated;
+    const rows = [
+      ['Subject', s.subject],
+      ['Task', s.task + ' (task ' + s.task_index + ')' + (s.finished ? ' - finished' : '')],
+      ['Trial', s.trial + ' / ' + s.n_trials],
+      ['Dot accuracy', percent(s.dot_accuracy) + ' (' + s.dot_correct + ' / ' + s.dot_total + ')'],
+      ['Beep count accuracy', percent(s.beep_accuracy) + ' (' + s.beep_correct + ' / ' + s.beep_total + ')'],
+      ['Dropped frames', '<span class="' + (s.dropped_frames ? 'warn' : '') + '">' + s.dropped_frames + '</span>'],
+      ['Last recording', 'peak ' + s.peak_dbfs.toFixed(1) + ' dBFS, RMS ' + s.rms_dbfs.toFixed(1) + ' dBFS'],
+      ['Recording alerts', '<span class="' + (s.qc_alerts ? 'warn' : '') + '">' + s.qc_alerts +
+        (s.last_alert ? ' - last: ' + s.last_alert : '') + '</span>'],
+      ['Frame rate', s.frame_rate.toFixed(2) + ' Hz'],
+      ['Last update', age.toFixed(0) + ' s ago'],
+    ];
+    document.getElementById('status').innerHTML =
+      rows.map(row => '<tr><td>' + row[0] + '</td><td>' + row[1] + '</td></tr>').join('');
+  }).catch(() => {});
+}
+update();
+setInterval(update, 1000);
+</script></body></html>
+"""
+
+
+def serve(block_name, port=8765, ready=None):
+    """
+    Serve the status of a running experiment as a local web page until the experiment removes the block.
+
+    Args:
+        block_name (str): The name of the status block.
+        port (int, optional): The local port of the web page. Defaults to 8765.
+        ready (multiprocessing.Event, optional): Set once the port is bound.
+    """
+    status_block = StatusBlock.attach(block_name)
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == '/status':
+                body = json.dumps(status_block.read()).encode('utf-8')
+                content_type = 'application/json'
+            else:
+                body = PAGE.encode('utf-8')
+                content_type = 'text/html; charset=utf-8'
+            self.send_response(200)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', port), Handler)
+    if ready is not None:
+        ready.set()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        status_block.close()
+
+
+def main():
+    """Command line interface of the dashboard."""
+    parser = argparse.ArgumentParser(description='Live experimenter dashboard of a running dual task session.')
+    parser.add_argument('block_name', help='name of the shared memory status block of the experiment')
+    parser.add_argument('--port', type=int, default=8765, help='local port of the web page')
+    args = parser.parse_args()
+    serve(args.block_name, args.port)
+
+
+if __name__ == '__main__':
+    main()
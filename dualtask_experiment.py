@@ -15,123 +15,275 @@ Detailed inline comments have been added to help understand the flow and functio
 
 # Import necessary PsychoPy libraries
 from dualtask_stimuli_load_path_check import check_config_paths, load_and_randomize
-from dualtask_configuration import get_participant_info, initialize_stimuli, create_window, stim_path, output_path, pics_path, record_path
+from dualtask_configuration import get_participant_info, initialize_stimuli, create_window, stim_path, output_path, pics_path, record_path, recording_format, vad_threshold_db, vad_hangover, \
+    calibration_file, monitor_key, calibration_revalidation_days, dashboard_enabled, dashboard_port, close_result_stores, \
+    stimulus_lists_file, log_enabled, log_repeat_interval, beep_press_enabled, session_container, get_session_container, \
+    dot_coherence_mode, marker_enabled, marker_host, marker_port
+from dualtask_calibration import start_revalidation, finish_revalidation
+from dualtask_dashboard import StatusBlock, start_dashboard
+from dualtask_log import LogSink
+from dualtask_markers import MarkerOutlet
+from dualtask_recording import RecordingWriter, Recorder
+from dualtask_rng import SessionRNG
+from dualtask_staircase import CoherenceStaircase
 from dualtask_task_setup import execute_task, display_and_wait, display_text_and_wait
 from psychopy import core
 from dualtask_instructions import *
+import multiprocessing
+import os
 
-# Checking validity of paths for stimuli and output
-check_config_paths(stim_path, output_path, pics_path, record_path)
-# Loading and randomizing the stimulus types
-stimuli_single = load_and_randomize(stim_path, 'single')
-stimuli_dual_beep_count_dots = load_and_randomize(stim_path, 'dual_beep_count_dots')
-
-# Get participant information
-participant_info = get_participant_info()
-# Creating the display window
-window = create_window()
-# Initializing all stimuli
-werKommt, fixation, item, prompt, feedback, fs, rec_seconds, movementDirections, responseList, dots, arrows, arrows_small, number_prompts = initialize_stimuli(window)
-
-# Starting the experiment by displaying the instruction for the single task
-display_text_and_wait(instructSingleTask1, window)
-if display_text_and_wait(instructSingleTask2, window):
-    display_text_and_wait(instructPracticeSingleTaskStart, window)
-
-# Running the single task practice session
-# practice items = stimuli_single[0]
-execute_task(window=window,
-             task_name='practice_single',
-             participant_info=participant_info,
-             stimuli=stimuli_single[0],
-             werKommt=werKommt,
-             fixation=fixation,
-             item=item,
-             prompt=prompt,
-             feedback=feedback,
-             fs=fs,
-             rec_seconds=rec_seconds,
-             movementDirections=movementDirections,
-             responseList=responseList,
-             dots=dots,
-             arrows=arrows,
-             arrows_small = arrows_small,
-             number_prompts=number_prompts,
-             )
-
-# Running the single task test session
-# test items = stimuli_single[1]
-execute_task(window=window,
-             task_name='test_single',
-             participant_info=participant_info,
-             stimuli=stimuli_single[1],
-             werKommt=werKommt,
-             fixation=fixation,
-             item=item,
-             prompt=prompt,
-             feedback=feedback,
-             fs=fs,
-             rec_seconds=rec_seconds,
-             movementDirections=movementDirections,
-             responseList=responseList,
-             dots=dots,
-             arrows=arrows,
-             arrows_small = arrows_small,
-             number_prompts=number_prompts,
-             )
-
-# Displaying the instruction for the dot motion, calculation and beep deviation dual task
-if display_text_and_wait(instructDualTask_beep_count_dots_1, window):
-    display_text_and_wait(instructDualTask_beep_count_dots_2, window)
-
-# Running the dual task - beep count and dots - practice session
-# practice items = stimuli_dual_beep_count_dots[0]
-execute_task(window=window,
-             task_name='practice_beep_count_dots',
-             participant_info=participant_info,
-             stimuli=stimuli_dual_beep_count_dots[0],
-             werKommt=werKommt,
-             fixation=fixation,
-             item=item,
-             prompt=prompt,
-             feedback=feedback,
-             fs=fs,
-             rec_seconds=rec_seconds,
-             movementDirections=movementDirections,
-             responseList=responseList,
-             dots=dots,
-             arrows=arrows,
-             arrows_small = arrows_small,
-             number_prompts=number_prompts,
-             dual_task=True
-             )
-
-# Running the dual task - beep count and dots - test session
-# randomized coordinates = stimuli_dual_beep_count_dots[1]
-execute_task(window=window,
-             task_name='test_beep_count_dots',
-             participant_info=participant_info,
-             stimuli=stimuli_dual_beep_count_dots[1],
-             werKommt=werKommt,
-             fixation=fixation,
-             item=item,
-             prompt=prompt,
-             feedback=feedback,
-             fs=fs,
-             rec_seconds=rec_seconds,
-             movementDirections=movementDirections,
-             responseList=responseList,
-             dots=dots,
-             arrows=arrows,
-             arrows_small = arrows_small,
-             number_prompts=number_prompts,
-             dual_task=True  # or True if you want to execute a dual task
-             )
-
-# Show last prompt to end experiment with keypress
-prompt.setText('Geschafft! \n Vielen Dank! \n Drücken Sie die Eingabetaste (Enter), um das Experiment zu beenden.')
-prompt.height = 0.2
-prompt.pos = [0, 0]
-display_and_wait(prompt, window)
-window.close()
-core.quit()
\ No newline at end of file
+
+def main():
+    """Run the experiment session."""
+    # Checking validity of paths for stimuli and output
+    check_config_paths(stim_path, output_path, pics_path, record_path)
+
+    # Get participant information
+    participant_info = get_participant_info()
+    # All random numbers of the session are derived from the session seed - store the seeds with the results
+    session_rng = SessionRNG(participant_info['session_seed'])
+    session_rng.save_seed_record(os.path.join(output_path, participant_info['subject'],
+                                              'seeds_' + participant_info['subject'] + '_' + participant_info['cur_date'] + '.json'),
+                                 ['single', 'dual_beep_count_dots', 'practice_beep_count_dots', 'test_beep_count_dots'] +
+                                 (['dual_number_beep_press', 'practice_number_beep_press', 'test_number_beep_press']
+                                  if beep_press_enabled else []))
+    # The psychopy log entries are filtered and written to the session's log file in a background thread
+    log_sink = None
+    if log_enabled:
+        log_sink = LogSink(os.path.join(output_path, participant_info['subject'],
+                                        'log_' + participant_info['subject'] + '_' + participant_info['cur_date'] + '.log'),
+                           repeat_interval=log_repeat_interval)
+        log_sink.install()
+
+    # Loading the stimulus types in the pre-generated order of the subject (or randomizing them)
+    stimuli_single = load_and_randomize(stim_path, 'single', session_rng.stream('single', 'ordering'),
+                                        participant_info['subject'], stimulus_lists_file)
+    stimuli_dual_beep_count_dots = load_and_randomize(stim_path, 'dual_beep_count_dots',
+                                                      session_rng.stream('dual_beep_count_dots', 'ordering'),
+                                                      participant_info['subject'], stimulus_lists_file)
+    if beep_press_enabled:
+        stimuli_dual_number_beep_press = load_and_randomize(stim_path, 'dual_number_beep_press',
+                                                            session_rng.stream('dual_number_beep_press', 'ordering'),
+                                                            participant_info['subject'], stimulus_lists_file)
+    # Creating the display window
+    window = create_window()
+    # Initializing all stimuli
+    werKommt, fixation, item, prompt, feedback, fs, rec_seconds, movementDirections, responseList, dots, arrows, arrows_small, number_prompts, frame_rate = initialize_stimuli(window)
+    # Revalidate the stored refresh rate with the flips of this session if it is due
+    start_revalidation(window, calibration_file, monitor_key, calibration_revalidation_days)
+    # One background writer encodes and saves all recordings of the session - or stores them in the session container
+    container = None
+    if session_container:
+        container = get_session_container(os.path.join('results', participant_info['subject']), participant_info)
+    recording_writer = RecordingWriter(recording_format, container=container)
+    # Allocate the recording buffers once for the whole session - they are reused across trials
+    recording_writer.buffer_pool.preallocate(int(rec_seconds * fs))
+    # The input stream stays open for the whole session, recordings only switch the target buffer
+    recorder = Recorder(fs, threshold_db=vad_threshold_db, hangover=vad_hangover)
+    recorder.open()
+    # The staircase of the dot coherence runs through the practice (and test) trials of the dot task
+    dot_staircase = CoherenceStaircase(dot_coherence_mode) if dot_coherence_mode != 'fixed' else None
+    # The events of the trials are sent to the external recording systems by a sender thread
+    marker_outlet = MarkerOutlet(marker_host, marker_port, clock=core.getTime) if marker_enabled else None
+    # The experimenter dashboard reads the progress from a shared status block in its own process
+    status = None
+    if dashboard_enabled:
+        status = StatusBlock.create()
+        status.publish(subject=participant_info['subject'])
+        dashboard = start_dashboard(status, dashboard_port)
+
+    # Starting the experiment by displaying the instruction for the single task
+    display_text_and_wait(instructSingleTask1, window)
+    if display_text_and_wait(instructSingleTask2, window):
+        display_text_and_wait(instructPracticeSingleTaskStart, window)
+
+    # Running the single task practice session
+    # practice items = stimuli_single[0]
+    execute_task(window=window,
+                 task_name='practice_single',
+                 participant_info=participant_info,
+                 stimuli=stimuli_single[0],
+                 werKommt=werKommt,
+                 fixation=fixation,
+                 item=item,
+                 prompt=prompt,
+                 feedback=feedback,
+                 fs=fs,
+                 rec_seconds=rec_seconds,
+                 frame_rate=frame_rate,
+                 movementDirections=movementDirections,
+                 responseList=responseList,
+                 dots=dots,
+                 arrows=arrows,
+                 arrows_small = arrows_small,
+                 number_prompts=number_prompts,
+                 recording_writer=recording_writer,
+                 recorder=recorder,
+                 status=status,
+                 markers=marker_outlet
+                 )
+
+    # Running the single task test session
+    # test items = stimuli_single[1]
+    execute_task(window=window,
+                 task_name='test_single',
+                 participant_info=participant_info,
+                 stimuli=stimuli_single[1],
+                 werKommt=werKommt,
+                 fixation=fixation,
+                 item=item,
+                 prompt=prompt,
+                 feedback=feedback,
+                 fs=fs,
+                 rec_seconds=rec_seconds,
+                 frame_rate=frame_rate,
+                 movementDirections=movementDirections,
+                 responseList=responseList,
+                 dots=dots,
+                 arrows=arrows,
+                 arrows_small = arrows_small,
+                 number_prompts=number_prompts,
+                 recording_writer=recording_writer,
+                 recorder=recorder,
+                 status=status,
+                 markers=marker_outlet
+                 )
+
+    # Displaying the instruction for the dot motion, calculation and beep deviation dual task
+    if display_text_and_wait(instructDualTask_beep_count_dots_1, window):
+        display_text_and_wait(instructDualTask_beep_count_dots_2, window)
+
+    # Running the dual task - beep count and dots - practice session
+    # practice items = stimuli_dual_beep_count_dots[0]
+    execute_task(window=window,
+                 task_name='practice_beep_count_dots',
+                 participant_info=participant_info,
+                 stimuli=stimuli_dual_beep_count_dots[0],
+                 werKommt=werKommt,
+                 fixation=fixation,
+                 item=item,
+                 prompt=prompt,
+                 feedback=feedback,
+                 fs=fs,
+                 rec_seconds=rec_seconds,
+                 frame_rate=frame_rate,
+                 movementDirections=movementDirections,
+                 responseList=responseList,
+                 dots=dots,
+                 arrows=arrows,
+                 arrows_small = arrows_small,
+                 number_prompts=number_prompts,
+                 dual_task=True,
+                 recording_writer=recording_writer,
+                 recorder=recorder,
+                 status=status,
+                 staircase=dot_staircase,
+                 markers=marker_outlet
+                 )
+
+    # Running the dual task - beep count and dots - test session
+    # randomized coordinates = stimuli_dual_beep_count_dots[1]
+    execute_task(window=window,
+                 task_name='test_beep_count_dots',
+                 participant_info=participant_info,
+                 stimuli=stimuli_dual_beep_count_dots[1],
+                 werKommt=werKommt,
+                 fixation=fixation,
+                 item=item,
+                 prompt=prompt,
+                 feedback=feedback,
+                 fs=fs,
+                 rec_seconds=rec_seconds,
+                 frame_rate=frame_rate,
+                 movementDirections=movementDirections,
+                 responseList=responseList,
+                 dots=dots,
+                 arrows=arrows,
+                 arrows_small = arrows_small,
+                 number_prompts=number_prompts,
+                 dual_task=True,  # or True if you want to execute a dual task
+                 recording_writer=recording_writer,
+                 recorder=recorder,
+                 status=status,
+                 staircase=dot_staircase,
+                 markers=marker_outlet
+                 )
+
+    if beep_press_enabled:
+        # Displaying the instruction for the number and beep press dual task
+        if display_text_and_wait(instructDualTask_number_beep_press_1, window):
+            if display_text_and_wait(instructDualTask_number_beep_press_2, window):
+                display_text_and_wait(instructPracticeDualTask_number_beep_press_Start, window)
+
+        # Running the dual task - number and beep press - practice and test session
+        # practice items = stimuli_dual_number_beep_press[0], test items = stimuli_dual_number_beep_press[1]
+        for task_name, task_stimuli in (('practice_number_beep_press', stimuli_dual_number_beep_press[0]),
+                                        ('test_number_beep_press', stimuli_dual_number_beep_press[1])):
+            execute_task(window=window,
+                         task_name=task_name,
+                         participant_info=participant_info,
+                         stimuli=task_stimuli,
+                         werKommt=werKommt,
+                         fixation=fixation,
+                         item=item,
+                         prompt=prompt,
+                         feedback=feedback,
+                         fs=fs,
+                         rec_seconds=rec_seconds,
+                         frame_rate=frame_rate,
+                         movementDirections=movementDirections,
+                         responseList=responseList,
+                         dots=dots,
+                         arrows=arrows,
+                         arrows_small=arrows_small,
+                         number_prompts=number_prompts,
+                         dual_task=True,
+                         recording_writer=recording_writer,
+                         recorder=recorder,
+                         status=status,
+                         markers=marker_outlet
+                         )
+
+    # Show last prompt to end experiment with keypress
+    prompt.setText('Geschafft! \n Vielen Dank! \n Drücken Sie die Eingabetaste (Enter), um das Experiment zu beenden.')
+    prompt.height = 0.2
+    prompt.pos = [0, 0]
+    display_and_wait(prompt, window)
+    finish_revalidation(window, calibration_file, monitor_key)
+    window.close()
+    if status is not None:
+        status.publish(finished=1)
+
+    # Wait for the last recordings to be written and report the storage saved by the recording format
+    recorder.close()
+    recording_writer.close()
+    close_result_stores()
+    recording_summary = recording_writer.summary()
+    print("Recordings: {files_written} files in '{recording_format}' format, {bytes_written} bytes written, "
+          "{bytes_saved} bytes saved compared to float32 WAV, {files_hashed} in the manifest ({errors} errors)".format(
+              **recording_summary))
+    if marker_outlet is not None:
+        marker_outlet.close()
+        print("Markers: {markers_sent} markers sent to {address} ({errors} errors)".format(**marker_outlet.summary()))
+    if dot_staircase is not None:
+        print("Dot coherence: threshold {dot_threshold} (log10 sd {dot_threshold_sd}), lapse rate {dot_lapse}".format(
+            **dot_staircase.estimate()))
+    if container is not None:
+        print("Session container: {recordings_written} recordings and {rows_written} result rows written to "
+              "'{path}' ({errors} errors)".format(**container.summary()))
+    if log_sink is not None:
+        log_sink.close()
+        print("Log: {entries_written} lines written, {entries_summarized} repeated entries summarized".format(
+            **log_sink.summary()))
+    if status is not None:
+        if dashboard is not None:
+            dashboard.terminate()
+        status.close()
+    core.quit()
+
+
+if __name__ == '__main__':
+    # the experimenter dashboard runs in a child process - in a frozen build the child starts this executable,
+    # which has to hand over to the dashboard here instead of running another session
+    multiprocessing.freeze_support()
+    main()
@@ -97,4 +97,46 @@ Das waren die Übungsbeispiele. \n
 Falls Sie noch Fragen haben, geben Sie bitte der Versuchsleiterin Bescheid.
 Dieser Teil dauert ca. 15 Minuten - Sie sehen wieder 24 verschiedene Namenssequenzen. \n
 Drücken Sie die Eingabetaste (Enter), um mit dem Experiment zu starten.
-"""
\ No newline at end of file
+"""
+
+# instructions for end of beep count dual task and intro to dual task with number and beep press
+instructDualTask_number_beep_press_1 = """
+Zweiter Teil - geschafft! \n
+Im dritten Teil ändern sich die zusätzlichen Aufgaben. 
+Zu Beginn erscheint nun eine Zahl zwischen 100-999. 
+Merken Sie sich die Zahl gut.
+Danach kommt die Frage - Wer kommt? - und das Fixationskreuz.
+Bevor und nachdem diesmal die Namenssequenz erscheint hören Sie Töne.
+Alle Töne haben dieselbe Tonhöhe, aber hin und wieder hören Sie einen Ton, der höher ist, als die anderen.
+Bitte drücken Sie so schnell wie möglich auf die Leertaste, wenn Sie den hohen Ton hören.
+Wenn zwischendurch die Namenssequenz erscheint, lesen Sie die Namenssequenz so vor wie im ersten Teil.  \n 
+Drücken Sie die Eingabetaste (Enter), um zur nächsten Seite zu gelangen.
+"""
+
+# instructions dual task with number and beep press second screen
+instructDualTask_number_beep_press_2 = """
+Nachdem Sie auf die hohen Töne reagiert und die Namenssequenz vorgelesen haben, sehen Sie vier Zahlen.
+Klicken Sie auf die Pfeiltaste der Tastatur, die auf die Zahl zeigt, die Sie sich merken sollten. \n 
+Lesen Sie die Namenssequenz wieder so vor, dass man so genau wie möglich versteht, wer gemeinsam kommt.
+Und lösen Sie die zusätzlichen Aufgaben so akkurat wie möglich. \n
+Drücken Sie die Eingabetaste (Enter), um zur nächsten Seite zu gelangen.
+"""
+
+# reminder instruction dual task with number and beep press and intro practice trials
+instructPracticeDualTask_number_beep_press_Start = """
+Nochmal zur Erinnerung:
+Merken Sie sich die Zahl, die zu Beginn erscheint.
+Nach der Frage und dem Fixationskreuz hören Sie Töne.
+Drücke Sie so schnell wie möglich die Leertaste, wenn Sie einen hohen Ton hören.
+Lesen Sie zwischendurch die Namenssequenz laut vor.
+Schließlich klicken Sie auf die Pfeiltaste der Tastatur, die zu der Zahl zeigt, die Sie sich gemerkt haben. \n
+Drücken Sie die Eingabetaste (Enter), um mit den Übungsbeispielen zu beginnen.
+"""
+
+# end practice trials dual task with number and beep press - begin test dual task
+instructPracticeDualTask_number_beep_press_End = """
+Das waren die Übungsbeispiele. \n
+Falls Sie noch Fragen haben, geben Sie bitte der Versuchsleiterin Bescheid.
+Dieser Teil dauert ca. 10 Minuten - Sie sehen wieder 24 verschiedene Namenssequenzen. \n
+Drücken Sie die Eingabetaste (Enter), um mit dem Experiment zu starten.
+"""
@@ -0,0 +1,298 @@
+"""
+Pre-generated, counterbalanced stimulus lists.
+Instead of shuffling the test items at the start of every session (and retrying until the run-length constraints
+hold), the orders of all planned participants are generated beforehand. For every participant and task
+('single', 'dual_beep_count_dots' and 'dual_number_beep_press') a number of candidate orders satisfying the constraints is drawn in a
+process pool; one of them is then picked per participant so that items and conditions are spread as evenly as
+possible over the list positions. The balance across participants is reported and the lists are stored in an
+SQLite file with one row per subject and task, so the experiment loads the list of the entered subject ID with a
+single key lookup (see load_and_randomize).
+
+The lists belong to one version of stimuli/conditions.xlsx - its checksum is stored with them, and lists of a
+changed stimulus file are not used.
+
+Usage:
+    python dualtask_lists.py 40 [--out stimuli/stimulus_lists.db] [--id-format "{:02d}"] [--seed 1234]
+        Generates the lists of subjects 01 to 40 and prints the balance of item position and condition.
+    python dualtask_lists.py --subjects VP01 VP02 ...
+        Generates the lists of the given subject IDs.
+"""
+
+# Import necessary libraries
+import argparse
+import json
+import os
+import sqlite3
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas
+from scipy.stats import chi2_contingency
+from dualtask_recording import file_sha256
+from dualtask_rng import new_session_seed, task_key
+
+
+# Tasks with a randomized order of the test items
+LIST_TASKS = ('single', 'dual_beep_count_dots', 'dual_number_beep_press')
+# Candidate orders drawn per participant and task - more candidates give a better balance
+N_CANDIDATES = 32
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS lists (
+    subject TEXT NOT NULL,
+    task TEXT NOT NULL,
+    stimulus_order TEXT NOT NULL,
+    PRIMARY KEY (subject, task)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS settings (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def split_stimuli(stimuli):
+    """
+    Split the rows of conditions.xlsx into the practice items and the test items.
+
+    Args:
+        stimuli (pandas.DataFrame): All rows of conditions.xlsx.
+
+    Returns:
+        tuple: The practice items and the test items (coordinates).
+    """
+    return stimuli[:4], stimuli[6:]
+
+
+def satisfies_run_constraints(conditions, names):
+    """
+    Check the run-length constraints of a stimulus order.
+
+    No condition may occur in four consecutive rows and no first name in three consecutive rows. As in the
+    original check, runs are only tested from rows that are followed by at least three more rows.
+
+    Args:
+        conditions (numpy.ndarray): The condition of every row in presentation order - or one order per row of a
+            2-d array, to check many orders at once.
+        names (numpy.ndarray): The first name ('name1') of every row in presentation order (same shape).
+
+    Returns:
+        bool: True if the order satisfies the constraints (a boolean array with one entry per order for 2-d input).
+    """
+    conditions = np.asarray(conditions)
+    names = np.asarray(names)
+    n = conditions.shape[-1] - 3
+    if n <= 0:
+        return True if conditions.ndim == 1 else np.ones(conditions.shape[:-1], dtype=bool)
+    condition_run = (conditions[..., :n] == conditions[..., 1:n + 1]) & \
+        (conditions[..., :n] == conditions[..., 2:n + 2]) & (conditions[..., :n] == conditions[..., 3:n + 3])
+    name_run = (names[..., :n] == names[..., 1:n + 1]) & (names[..., :n] == names[..., 2:n + 2])
+    violated = condition_run.any(axis=-1) | name_run.any(axis=-1)
+    return not violated if conditions.ndim == 1 else ~violated
+
+
+def candidate_orders(job):
+    """
+    Draw constraint-satisfying orders of the test items (runs in a worker process).
+
+    Args:
+        job (tuple): Seed entropy of the participant's stream, conditions and first names of the test items and
+            the number of orders to draw.
+
+    Returns:
+        numpy.ndarray: The orders as row positions of the test items, shape (n_candidates, n_items).
+    """
+    entropy, conditions, names, n_candidates = job
+    rng = np.random.default_rng(np.random.SeedSequence(entropy))
+    orders = []
+    while len(orders) < n_candidates:
+        order = rng.permutation(len(conditions))
+        if satisfies_run_constraints(conditions[order], names[order]):
+            orders.append(order)
+    return np.array(orders)
+
+
+def pick_balanced(candidates, conditions):
+    """
+    Pick one order per participant so that items and conditions are spread evenly over the list positions.
+
+    The participants are processed in turn; each gets the candidate that adds least to the sum of squared
+    item-position and condition-position counts so far.
+
+    Args:
+        candidates (list): One array of candidate orders (n_candidates, n_items) per participant.
+        conditions (numpy.ndarray): The condition of every test item.
+
+    Returns:
+        numpy.ndarray: The picked orders, shape (n_participants, n_items).
+    """
+    n_items = candidates[0].shape[1]
+    condition_codes = np.unique(conditions, return_inverse=True)[1]
+    positions = np.arange(n_items)
+    item_counts = np.zeros((n_items, n_items))
+    condition_counts = np.zeros((condition_codes.max() + 1, n_items))
+    picked = []
+    for orders in candidates:
+        # adding 1 to a count c adds 2c + 1 to its square - so the cost of an order is the sum of its counts
+        cost = item_counts[orders, positions].sum(axis=1) + \
+            condition_counts[condition_codes[orders], positions].sum(axis=1)
+        order = orders[int(np.argmin(cost))]
+        item_counts[order, positions] += 1
+        condition_counts[condition_codes[order], positions] += 1
+        picked.append(order)
+    return np.array(picked)
+
+
+def balance_report(orders, conditions):
+    """
+    Measure the balance of item position and condition across participants.
+
+    Args:
+        orders (numpy.ndarray): The orders of all participants, shape (n_participants, n_items).
+        conditions (numpy.ndarray): The condition of every test item.
+
+    Returns:
+        dict: 'item_position_range' - smallest and largest number of participants that saw an item at a position,
+            'expected' - the number expected with perfect balance, 'condition_position_p' - p-value of the
+            chi-square test of condition x position (high values: no association), 'mean_position' - the mean
+            position of every condition.
+    """
+    n_participants, n_items = orders.shape
+    positions = np.arange(n_items)
+    item_counts = np.zeros((n_items, n_items), dtype=int)
+    np.add.at(item_counts, (orders, np.broadcast_to(positions, orders.shape)), 1)
+    labels, condition_codes = np.unique(conditions, return_inverse=True)
+    condition_counts = np.zeros((len(labels), n_items), dtype=int)
+    np.add.at(condition_counts, (condition_codes[orders], np.broadcast_to(positions, orders.shape)), 1)
+    p_value = float('nan')
+    if len(labels) > 1 and n_participants > 1:
+        p_value = float(chi2_contingency(condition_counts)[1])
+    mean_position = {str(label): float((condition_counts[index] * positions).sum() / condition_counts[index].sum())
+                     for index, label in enumerate(labels)}
+    return {
+        'item_position_range': (int(item_counts.min()), int(item_counts.max())),
+        'expected': n_participants / n_items,
+        'condition_position_p': p_value,
+        'mean_position': mean_position,
+    }
+
+
+def generate_lists(stim_path, subjects, seed, n_candidates=N_CANDIDATES, workers=None):
+    """
+    Generate the stimulus lists of the planned participants.
+
+    Args:
+        stim_path (str): The stimulus directory with conditions.xlsx.
+        subjects (list): The subject IDs, in the order in which the balance is built up.
+        seed (int): The seed of the list generation.
+        n_candidates (int, optional): Candidate orders drawn per participant and task.
+        workers (int, optional): Number of worker processes.
+
+    Returns:
+        tuple: The orders per task ({task: array (n_subjects, n_items)}) and the balance reports per task.
+    """
+    _, coordinates = split_stimuli(pandas.read_excel(os.path.join(stim_path, 'conditions.xlsx')))
+    conditions = coordinates['condition'].to_numpy()
+    names = coordinates['name1'].to_numpy()
+    jobs = [([seed, task_key(task), index], conditions, names, n_candidates)
+            for task in LIST_TASKS for index in range(len(subjects))]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        candidates = list(executor.map(candidate_orders, jobs, chunksize=max(1, len(jobs) // 64)))
+
+    lists, reports = {}, {}
+    for number, task in enumerate(LIST_TASKS):
+        task_candidates = candidates[number * len(subjects):(number + 1) * len(subjects)]
+        lists[task] = pick_balanced(task_candidates, conditions)
+        reports[task] = balance_report(lists[task], conditions)
+    return lists, reports
+
+
+def write_lists(path, subjects, lists, stimuli_sha256, seed):
+    """
+    Store the lists in the SQLite list file (replacing the lists of the same subjects).
+
+    Args:
+        path (str): The list file.
+        subjects (list): The subject IDs.
+        lists (dict): The orders per task, one row per subject.
+        stimuli_sha256 (str): The checksum of the conditions.xlsx the lists were generated from.
+        seed (int): The seed of the list generation.
+    """
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.executescript(SCHEMA)
+        stored = connection.execute("SELECT value FROM settings WHERE key = 'stimuli_sha256'").fetchone()
+        if stored is not None and stored[0] != stimuli_sha256:
+            # lists of an older stimulus file can not be mixed with the new ones
+            connection.execute('DELETE FROM lists')
+        connection.executemany(
+            'INSERT OR REPLACE INTO lists VALUES (?, ?, ?)',
+            [(str(subject), task, json.dumps(lists[task][index].tolist()))
+             for task in LIST_TASKS for index, subject in enumerate(subjects)])
+        connection.executemany('INSERT OR REPLACE INTO settings VALUES (?, ?)',
+                               [('stimuli_sha256', stimuli_sha256), ('seed', str(seed))])
+    connection.close()
+
+
+def stored_order(path, subject, task, stimuli_sha256):
+    """
+    Look up the pre-generated list of a subject.
+
+    Args:
+        path (str): The list file.
+        subject (str): The subject ID.
+        task (str): One of LIST_TASKS.
+        stimuli_sha256 (str): The checksum of the current conditions.xlsx.
+
+    Returns:
+        list or None: The order as row positions of the test items, None if the file has no list for the subject
+        or the lists were generated from a different stimulus file.
+    """
+    if not os.path.isfile(path):
+        return None
+    connection = sqlite3.connect('file:{}?mode=ro'.format(path), uri=True)
+    try:
+        stored = connection.execute("SELECT value FROM settings WHERE key = 'stimuli_sha256'").fetchone()
+        if stored is None or stored[0] != stimuli_sha256:
+            return None
+        row = connection.execute('SELECT stimulus_order FROM lists WHERE subject = ? AND task = ?',
+                                 (str(subject), task)).fetchone()
+    finally:
+        connection.close()
+    return None if row is None else json.loads(row[0])
+
+
+def main():
+    """Command line interface of the list generation."""
+    parser = argparse.ArgumentParser(description='Pre-generate counterbalanced stimulus lists for N participants.')
+    parser.add_argument('participants', type=int, nargs='?', default=0, help='number of planned participants')
+    parser.add_argument('--subjects', nargs='*', default=None, help='subject IDs (instead of a number)')
+    parser.add_argument('--id-format', default='{:02d}', help='format of the generated subject IDs 1..N')
+    parser.add_argument('--stimuli', default='stimuli', help='stimulus directory with conditions.xlsx')
+    parser.add_argument('--out', default=os.path.join('stimuli', 'stimulus_lists.db'), help='list file')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the list generation (default: random)')
+    parser.add_argument('--candidates', type=int, default=N_CANDIDATES,
+                        help='candidate orders per participant and task')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    subjects = args.subjects or [args.id_format.format(number) for number in range(1, args.participants + 1)]
+    if not subjects:
+        parser.error('give the number of participants or --subjects')
+    seed = new_session_seed() if args.seed is None else args.seed
+
+    start = time.perf_counter()
+    lists, reports = generate_lists(args.stimuli, subjects, seed, args.candidates, args.workers)
+    write_lists(args.out, subjects, lists, file_sha256(os.path.join(args.stimuli, 'conditions.xlsx')), seed)
+    print('{} lists per task generated in {:.1f} s (seed {}) and written to {}'.format(
+        len(subjects), time.perf_counter() - start, seed, args.out))
+    for task, report in reports.items():
+        print('{}: participants per item and position {}-{} (expected {:.2f}), condition x position p = {:.3f}, '
+              'mean position {}'.format(task, *report['item_position_range'], report['expected'],
+                                        report['condition_position_p'],
+                                        ', '.join('{} {:.2f}'.format(condition, position)
+                                                  for condition, position in report['mean_position'].items())))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""
+Asynchronous psychopy log file of a session.
+psychopy logs every change of a stimulus attribute on the next flip (e.g. 'dots: dir = 90' on every frame of the
+dot presentation) and formats and writes its entries when it is flushed. The LogSink takes the entries from
+psychopy's logger instead: the frame loop only puts the raw entry (time, level, message) into a queue, formatting,
+filtering and writing happen in a background thread.
+
+Repeated attribute changes of a stimulus are summarized: a new value is written with the time of its first flip,
+repetitions of the same value and further changes within repeat_interval seconds are counted and written as one
+line ('... (249 repeats since 12.3450)') when the run ends. The stimulus names set for the log file (werKommt,
+fixation, item_<ID>) and the onsets and offsets of the stimuli stay in the log, the per-frame entries do not.
+"""
+
+# Import necessary libraries
+import os
+import queue
+import threading
+from psychopy import logging
+
+
+# Levels that are also passed on to psychopy's own targets (e.g. warnings on the console)
+FORWARD_LEVEL = logging.WARNING
+
+
+class LogSink:
+    """
+    Background writer of the psychopy log entries of a session.
+
+    Attributes:
+        path (str): The log file.
+        level (int): Lowest psychopy level written to the file (default logging.EXP).
+        repeat_interval (float): Seconds within which changes of the same stimulus attribute are summarized.
+        entries_written (int): Number of lines written so far.
+        entries_summarized (int): Number of entries counted in summary lines instead of being written.
+    """
+
+    def __init__(self, path, level=logging.EXP, repeat_interval=0.5):
+        self.path = path
+        self.level = level
+        self.repeat_interval = repeat_interval
+        self.entries_written = 0
+        self.entries_summarized = 0
+        self._logger = None
+        self._runs = {}  # (stimulus, attribute) -> [time written, value written, repeats, time last, value last]
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', encoding='utf-8')
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='LogSink', daemon=True)
+        self._thread.start()
+
+    def install(self, logger=logging.root):
+        """
+        Take over the entries of psychopy's logger.
+
+        Entries from FORWARD_LEVEL on are also passed on to the logger, so its own targets keep receiving warnings
+        and errors; all other entries only go to the sink (and no longer pile up in the logger until it is flushed).
+
+        Args:
+            logger (optional): The psychopy logger, defaults to psychopy.logging.root.
+        """
+        forward = logger.log
+        sink_level = self.level
+        put = self._queue.put
+
+        def log(message, level, t=None, obj=None, levelname=None):
+            # runs in the frame loop - no formatting here
+            # (newer psychopy versions pass the level name from exp(), warning() etc., older ones do not know it)
+            if level >= FORWARD_LEVEL:
+                if levelname is None:
+                    forward(message, level, t, obj)
+                else:
+                    forward(message, level, t, obj, levelname=levelname)
+            if level < sink_level:
+                return
+            put((logging.defaultClock.getTime() if t is None else t, level, message, obj is not None))
+
+        logger.log = log
+        self._logger = logger
+
+    def uninstall(self):
+        """Give the entries back to psychopy's logger."""
+        if self._logger is not None:
+            del self._logger.log
+            self._logger = None
+
+    def _write(self, t, level, message):
+        """Write one line of the log file."""
+        self._file.write('{:.4f}\t{}\t{}\n'.format(t, logging.getLevel(level), message))
+        self.entries_written += 1
+
+    def _end_run(self, key, level=logging.EXP):
+        """Write the summary line of an attribute run with repeats and forget the run."""
+        t_written, _, repeats, t_last, value_last = self._runs.pop(key)
+        if repeats:
+            self._write(t_last, level, '{}: {} = {} ({} repeats since {:.4f})'.format(
+                key[0], key[1], value_last, repeats, t_written))
+            self.entries_summarized += repeats
+
+    def _add(self, t, level, message, is_attribute):
+        """Filter an entry: write it, or count it in the run of its stimulus attribute."""
+        # runs that were not continued within repeat_interval are over (e.g. the dots of the last trial)
+        for key in [key for key, run in self._runs.items() if t - run[3] > self.repeat_interval]:
+            self._end_run(key)
+        name, separator, change = message.partition(': ')
+        attribute, equals, value = change.partition(' = ')
+        if not (is_attribute and separator and equals):
+            self._write(t, level, message)
+            return
+        key = (name, attribute)
+        run = self._runs.get(key)
+        if run is not None and (value == run[1] or t - run[0] < self.repeat_interval):
+            run[2] += 1
+            run[3] = t
+            run[4] = value
+            return
+        if run is not None:
+            self._end_run(key, level)
+        self._write(t, level, message)
+        self._runs[key] = [t, value, 0, t, value]
+
+    def _run(self):
+        """Worker loop: write queued entries until None is received."""
+        while True:
+            try:
+                entry = self._queue.get(timeout=self.repeat_interval)
+            except queue.Empty:
+                # idle - end all runs and put the lines on disk
+                for key in list(self._runs):
+                    self._end_run(key)
+                self._file.flush()
+                continue
+            if entry is None:
+                break
+            self._add(*entry)
+        for key in list(self._runs):
+            self._end_run(key)
+        self._file.close()
+
+    def close(self):
+        """Stop taking psychopy's entries, write all pending entries and close the log file."""
+        self.uninstall()
+        self._queue.put(None)
+        self._thread.join()
+
+    def summary(self):
+        """Return the number of written and summarized entries."""
+        return {'entries_written': self.entries_written, 'entries_summarized': self.entries_summarized}
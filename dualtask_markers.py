@@ -0,0 +1,278 @@
+"""
+Event markers for external recording systems.
+To align physiological recordings (run by a separate acquisition program) with the experiment, the events of
+the trials are sent as small binary UDP datagrams: the trial start, the item onset, every beep with its type, the
+onset and offset of the dots, the key presses of the beep press task and the responses.
+
+The frame loop only puts a marker into a queue (MarkerOutlet.push); a sender thread packs and sends it. The time
+of an event is taken where it happens - the flip time of the frame that shows a stimulus, the play time of a beep,
+the key-down time of a press - on the clock of core.getTime(), so the markers can be aligned with the psychopy
+log. Every marker also carries the time it was queued on the clock of time.perf_counter(), which the receiver on
+the same computer uses to measure the latency and jitter of the transport.
+
+A marker is 28 bytes, little-endian (MARKER_STRUCT):
+    magic (2 bytes, b'DT'), event code (uint8, see MarkerEvent), value (uint8), sequence number (uint32),
+    trial (uint16), frame (uint16), event time (float64, seconds), queue time (float64, seconds)
+
+Usage:
+    python dualtask_markers.py receive [--port 15000]  prints the received markers and their latency
+    python dualtask_markers.py test [--markers 5000 --rate 500]  sends test markers to a receiver in a separate
+                                                                   process and reports latency, jitter and losses
+"""
+
+# Import necessary libraries
+import argparse
+import itertools
+import multiprocessing
+import queue
+import socket
+import struct
+import threading
+import time
+from enum import IntEnum
+import numpy as np
+
+
+MARKER_STRUCT = struct.Struct('<2sBBIHHdd')
+MARKER_MAGIC = b'DT'
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 15000
+
+
+class MarkerEvent(IntEnum):
+    """Event codes of the markers. The value of a marker depends on the event (see the comments)."""
+    trial_start = 1
+    item_onset = 2
+    beep = 3  # value: 1 normal, 2 deviant
+    dot_onset = 4  # value: index of the movement direction
+    dot_offset = 5
+    dot_response = 6  # value: 1 correct, 0 incorrect (also for the other responses)
+    beep_count_response = 7
+    number_response = 8
+    key_press = 9
+    session_end = 255
+
+
+def pack_marker(event, value, sequence, trial, frame, event_time, queued):
+    """Pack a marker into its 28 bytes."""
+    return MARKER_STRUCT.pack(MARKER_MAGIC, int(event), int(value), sequence, int(trial), max(int(frame), 0),
+                              event_time, queued)
+
+
+def unpack_marker(data):
+    """
+    Unpack a marker.
+
+    Args:
+        data (bytes): The datagram.
+
+    Returns:
+        dict: event (MarkerEvent or int for unknown codes), value, sequence, trial, frame, event_time and queued.
+
+    Raises:
+        ValueError: If the datagram is not a marker.
+    """
+    if len(data) != MARKER_STRUCT.size or data[:2] != MARKER_MAGIC:
+        raise ValueError('Not a marker: {!r}'.format(data[:32]))
+    _, event, value, sequence, trial, frame, event_time, queued = MARKER_STRUCT.unpack(data)
+    try:
+        event = MarkerEvent(event)
+    except ValueError:
+        pass
+    return {'event': event, 'value': value, 'sequence': sequence, 'trial': trial, 'frame': frame,
+            'event_time': event_time, 'queued': queued}
+
+
+class MarkerOutlet:
+    """
+    Sends markers over UDP from a background thread.
+
+    Attributes:
+        address (tuple): Host and port of the receiver.
+        clock (callable): Returns the time of the markers that are pushed without an event time - core.getTime in
+            the experiment, so they are on the clock of the psychopy log like all other markers.
+        markers_sent (int): Number of markers sent.
+        errors (int): Number of markers that could not be sent (e.g. no receiver on a connected socket).
+    """
+
+    def __init__(self, host=DEFAULT_HOST, port=DEFAULT_PORT, clock=time.perf_counter):
+        self.address = (host, port)
+        self.clock = clock
+        self.markers_sent = 0
+        self.errors = 0
+        self._sequence = itertools.count()
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._run, name='MarkerOutlet', daemon=True)
+        self._thread.start()
+
+    def push(self, event, value=0, trial=0, frame=0, event_time=None):
+        """
+        Queue a marker - this is all the frame loop does.
+
+        Args:
+            event (MarkerEvent): The event.
+            value (int, optional): The value of the event (0-255).
+            trial (int, optional): The trial number.
+            frame (int, optional): The frame of the trial the event belongs to.
+            event_time (float, optional): The time of the event on the clock of core.getTime(). Defaults to the
+                current time of the outlet's clock.
+        """
+        if event_time is None:
+            event_time = self.clock()
+        self._queue.put((event, value, next(self._sequence), trial, frame, event_time, time.perf_counter()))
+
+    def _run(self):
+        """Sender loop: pack and send queued markers until None is received."""
+        while True:
+            marker = self._queue.get()
+            if marker is None:
+                break
+            try:
+                self._socket.sendto(pack_marker(*marker), self.address)
+                self.markers_sent += 1
+            except OSError:
+                self.errors += 1
+
+    def close(self):
+        """Send the pending markers and the session end marker and stop the sender thread."""
+        self.push(MarkerEvent.session_end)
+        self._queue.put(None)
+        self._thread.join()
+        self._socket.close()
+
+    def summary(self):
+        """Return the receiver address and the numbers of sent and failed markers."""
+        return {'address': '{}:{}'.format(*self.address), 'markers_sent': self.markers_sent, 'errors': self.errors}
+
+
+def latency_statistics(latencies, sequences):
+    """
+    Summarize the transport latency of received markers.
+
+    Args:
+        latencies (numpy.ndarray): Receive time minus queue time of every marker in seconds.
+        sequences (numpy.ndarray): The sequence numbers in the order of arrival.
+
+    Returns:
+        dict: Number of markers, lost and reordered markers, mean, median, 95th and 99th percentile and maximum of
+        the latency and its jitter (standard deviation), all in milliseconds.
+    """
+    if len(latencies) == 0:
+        return {'markers': 0}
+    latencies_ms = np.asarray(latencies) * 1000
+    sequences = np.asarray(sequences)
+    p50, p95, p99 = np.percentile(latencies_ms, [50, 95, 99])
+    return {
+        'markers': len(latencies_ms),
+        'lost': int(sequences.max() - sequences.min() + 1 - len(np.unique(sequences))),
+        'reordered': int(np.sum(np.diff(sequences) < 0)),
+        'mean_ms': round(float(latencies_ms.mean()), 3),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'max_ms': round(float(latencies_ms.max()), 3),
+        'jitter_ms': round(float(latencies_ms.std()), 3),
+    }
+
+
+def receive_markers(host=DEFAULT_HOST, port=DEFAULT_PORT, ready=None, timeout=None, verbose=True):
+    """
+    Receive markers until the session end marker (a stand-in for the acquisition program).
+
+    Args:
+        host (str, optional): The address to listen on.
+        port (int, optional): The port to listen on.
+        ready (multiprocessing.Event, optional): Set once the socket is bound.
+        timeout (float, optional): Stop after this many seconds without a marker.
+        verbose (bool, optional): Print every marker.
+
+    Returns:
+        dict: The latency statistics (see latency_statistics).
+    """
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+    receiver.bind((host, port))
+    receiver.settimeout(timeout)
+    if ready is not None:
+        ready.set()
+    latencies, sequences = [], []
+    try:
+        while True:
+            try:
+                data = receiver.recv(64)
+            except (socket.timeout, KeyboardInterrupt):
+                break
+            received = time.perf_counter()
+            try:
+                marker = unpack_marker(data)
+            except ValueError:
+                continue
+            if marker['event'] == MarkerEvent.session_end:
+                break
+            latencies.append(received - marker['queued'])
+            sequences.append(marker['sequence'])
+            if verbose:
+                print('{sequence:7d} trial {trial:3d} frame {frame:5d} {event!s:30} value {value:3d} '
+                      't={event_time:.4f}'.format(**marker) + '  latency {:.3f} ms'.format(latencies[-1] * 1000))
+    finally:
+        receiver.close()
+    return latency_statistics(latencies, sequences)
+
+
+def _receiver_process(host, port, ready, results):
+    """Run the receiver in a separate process and return its statistics."""
+    results.put(receive_markers(host, port, ready, timeout=5.0, verbose=False))
+
+
+def test_transport(n_markers=5000, rate=500.0, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """
+    Measure the end-to-end latency of the markers with a receiver in a separate process.
+
+    Args:
+        n_markers (int, optional): Number of test markers.
+        rate (float, optional): Markers per second.
+        host (str, optional): The receiver address.
+        port (int, optional): The receiver port.
+
+    Returns:
+        dict: The latency statistics of the receiver and the summary of the outlet.
+    """
+    ready = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    receiver = multiprocessing.Process(target=_receiver_process, args=(host, port, ready, results), daemon=True)
+    receiver.start()
+    ready.wait(10)
+    outlet = MarkerOutlet(host, port)
+    start = time.perf_counter()
+    for index in range(n_markers):
+        # spaced like the events of a frame loop, which waits for the flips with the GIL released - a busy loop
+        # would hold the GIL and delay the sender thread by the switch interval (5 ms)
+        time.sleep(max(0.0, start + index / rate - time.perf_counter()))
+        outlet.push(MarkerEvent.beep, value=1 + index % 2, trial=index // 100, frame=index % 100)
+    outlet.close()
+    statistics = results.get(timeout=30)
+    receiver.join()
+    return dict(statistics, **outlet.summary())
+
+
+def main():
+    """Command line interface of the marker receiver and the transport test."""
+    parser = argparse.ArgumentParser(description='UDP event markers of the dual task experiment.')
+    parser.add_argument('command', choices=['receive', 'test'], help='receive markers or test the transport')
+    parser.add_argument('--host', default=DEFAULT_HOST, help='receiver address')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help='receiver port')
+    parser.add_argument('--markers', type=int, default=5000, help='number of test markers')
+    parser.add_argument('--rate', type=float, default=500.0, help='test markers per second')
+    args = parser.parse_args()
+
+    if args.command == 'receive':
+        print('Waiting for markers on {}:{} (Ctrl+C to stop)'.format(args.host, args.port))
+        statistics = receive_markers(args.host, args.port)
+    else:
+        statistics = test_transport(args.markers, args.rate, args.host, args.port)
+    print(', '.join('{}: {}'.format(key, value) for key, value in statistics.items()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,429 @@
+"""
+Preflight check of the lab computer before a session.
+A session on a computer that drops frames, plays the beeps late or writes the recordings slowly (background
+updates, a virus scan, a full disk, another program holding the audio device) is only noticed in the results.
+This check runs in well under a minute before the participant arrives and measures, on the configured window:
+    - the frame times of a synthetic dual task trial: the frame engine with the real item, dot and beep components
+      of the first practice trial, and the 500 moving dots drawn on every frame (the worst case of the loop)
+    - the time sound.Sound and play() block the frame loop for a beep, and - if the microphone picks up the
+      loudspeaker - the loopback latency from play() to the tone in the recording (output plus input latency)
+    - the time from the start of a recording to its first samples
+    - the time to write a recording in the configured format and the write throughput of the disk to recordings/
+
+Every measurement is compared with an absolute limit and with the baseline of this computer and display setup
+(stored in preflight_baseline_file); it fails if it is worse than the baseline by more than preflight_tolerance.
+The first passing run on a computer is stored as its baseline; --save-baseline replaces the baseline, e.g. after
+new hardware or drivers. The files written by the check are removed afterwards.
+
+Usage:
+    python dualtask_preflight.py [--save-baseline] [--tolerance 1.5]
+"""
+
+# Import necessary libraries
+import argparse
+import datetime
+import os
+import shutil
+import socket
+import sys
+import time
+import numpy as np
+import pandas
+from dualtask_configuration import create_window, initialize_stimuli, record_path, recording_format, monitor_key, \
+    vad_threshold_db, vad_hangover, preflight_baseline_file, preflight_tolerance
+# dualtask_task_setup sets the audio library preference before psychopy's sound module is imported
+from dualtask_task_setup import ReadAloud
+from psychopy import sound, core
+from dualtask_calibration import load_calibration, save_calibration
+from dualtask_components import Component, FrameEngine, TrialState, BeepStream, DotField
+from dualtask_recording import RecordingWriter, Recorder, write_recording, recording_extension
+from dualtask_rng import SessionRNG
+from dualtask_schedule import BEEP_DURATION, BEEP_NOTES, FrameGrid, FrameClock
+
+
+# The synthetic trial uses the item onset, dot timing and beeps of the first trial of this task
+PREFLIGHT_TASK = 'practice_beep_count_dots'
+PREFLIGHT_ITEM = 'Lena und Tom und Mia'
+
+# Number of repetitions of the audio and disk measurements
+TONE_COUNT = 8
+TONE_SPACING = 0.4  # seconds between the tones - the tail of a tone must not reach the next one
+RECORDING_STARTS = 10
+DISK_RECORDINGS = 5
+DISK_MEGABYTES = 64
+
+# label, whether higher values are better, and the absolute slack added to the tolerance of the baseline, so
+# tiny values (a beep call of 0.2 instead of 0.1 ms) do not fail
+METRICS = {
+    'frame_p50_ms': ('frame time median (ms)', False, 0.5),
+    'frame_p95_ms': ('frame time 95th percentile (ms)', False, 0.5),
+    'frame_p99_ms': ('frame time 99th percentile (ms)', False, 1.0),
+    'frame_max_ms': ('frame time maximum (ms)', False, 5.0),
+    'dropped_frames': ('dropped frames', False, 2),
+    'tone_call_p95_ms': ('sound.Sound + play() 95th pct (ms)', False, 1.0),
+    'tone_loopback_ms': ('tone loopback latency (ms)', False, 5.0),
+    'recording_open_ms': ('input stream open (ms)', False, 50.0),
+    'recording_start_p95_ms': ('recording start 95th pct (ms)', False, 5.0),
+    'recording_write_p95_ms': ('recording write 95th pct (ms)', False, 20.0),
+    'disk_mb_s': ('disk write throughput (MB/s)', True, 0.0),
+}
+
+
+def absolute_limits(frame_rate, rec_seconds):
+    """
+    Return the absolute limits of the measurements - a machine beyond them is not fit for a session.
+
+    Args:
+        frame_rate (float): The refresh rate of the window.
+        rec_seconds (float): The maximum duration of a recording.
+
+    Returns:
+        dict: The limit of every measurement that has one (minimum for higher-is-better measurements).
+    """
+    period = 1000.0 / frame_rate
+    return {
+        'frame_p50_ms': 1.1 * period,
+        'frame_p99_ms': 1.5 * period,
+        'dropped_frames': 3,  # of 1200 frames at 60 Hz
+        'tone_call_p95_ms': period,  # a beep that blocks longer than a frame drops it
+        'recording_start_p95_ms': 50.0,
+        # the writer gets one recording per trial and must never fall behind
+        'recording_write_p95_ms': 200.0 * rec_seconds,
+        'disk_mb_s': 10.0,
+    }
+
+
+class DotLoad(Component):
+    """Draws the dots on every frame the dot field does not show them - the worst case of the frame loop."""
+
+    def __init__(self, dots, dot_field):
+        self.dots = dots
+        self.dot_field = dot_field
+
+    def frame_spans(self, trial):
+        return [(0, self.dot_field.first_frame, self._draw),
+                (self.dot_field.last_frame, trial.frame_grid.trial_frames, self._draw)]
+
+    def _draw(self, frame):
+        self.dots.draw()
+
+
+def frame_statistics(intervals, dropped):
+    """
+    Summarize the flip intervals of the synthetic trial.
+
+    Args:
+        intervals (numpy.ndarray): The intervals between the flips in seconds.
+        dropped (int): The frames the frame clock skipped.
+
+    Returns:
+        dict: Median, 95th and 99th percentile and maximum of the frame time in ms and the dropped frames.
+    """
+    if len(intervals) == 0:
+        return {'dropped_frames': int(dropped)}
+    intervals_ms = np.asarray(intervals) * 1000
+    p50, p95, p99 = np.percentile(intervals_ms, [50, 95, 99])
+    return {
+        'frame_p50_ms': round(float(p50), 3),
+        'frame_p95_ms': round(float(p95), 3),
+        'frame_p99_ms': round(float(p99), 3),
+        'frame_max_ms': round(float(intervals_ms.max()), 3),
+        'dropped_frames': int(dropped),
+    }
+
+
+def measure_trial(window, item, dots, movement_directions, response_keys, fs, rec_seconds, frame_rate, recorder,
+                  recording_writer, directory):
+    """
+    Run one synthetic dual task trial and measure its frame times.
+
+    The trial runs the frame engine with the read-aloud item (recorded and written like in a session), the dot
+    field and the beep stream; the dots are additionally drawn on all other frames. Nothing is saved and no
+    responses are asked.
+
+    Args:
+        window (psychopy.visual.Window): The experiment window.
+        item (psychopy.visual.TextStim): The item stimulus.
+        dots (psychopy.visual.DotStim): The dot stimulus.
+        movement_directions (list): The directions of the dots.
+        response_keys (list): The response keys belonging to the directions.
+        fs (int): The sample rate of the recordings.
+        rec_seconds (float): The maximum duration of a recording.
+        frame_rate (float): The refresh rate of the window.
+        recorder (Recorder): The open recorder.
+        recording_writer (RecordingWriter): The writer of the recording of the trial.
+        directory (str): The directory the recording is written to.
+
+    Returns:
+        dict: The frame statistics (see frame_statistics).
+    """
+    stimuli = pandas.DataFrame({'ID': ['preflight'], 'item': [PREFLIGHT_ITEM], 'condition': ['preflight']})
+    dot_field = DotField(dots, movement_directions, None, None, None, response_keys)
+    components = [
+        ReadAloud(item, stimuli, directory, {'subject': 'preflight'}, fs, rec_seconds, recording_writer, recorder),
+        dot_field,
+        BeepStream(None, None, None, None, response_keys, BEEP_DURATION),
+        DotLoad(dots, dot_field),
+    ]
+    frame_grid = FrameGrid(frame_rate)
+    engine = FrameEngine(components)
+    session_rng = SessionRNG(0)
+    for component in components:
+        component.start_task(session_rng, PREFLIGHT_TASK, 1)
+
+    start_time = time.time()
+    start_time_str = datetime.datetime.fromtimestamp(start_time).strftime('%H:%M:%S')
+    trial = TrialState(0, PREFLIGHT_TASK, frame_grid, start_time, start_time_str, lambda record, type: None)
+    for component in components:
+        component.start_trial(trial)
+
+    frame_clock = FrameClock(frame_rate)
+    window.recordFrameIntervals = True
+    first = len(window.frameIntervals)
+    engine.run(window, trial, frame_grid.trial_frames, frame_clock)
+    window.recordFrameIntervals = False
+    # the first interval runs from switching the recording on to the first flip
+    intervals = window.frameIntervals[first + 1:]
+    # end_presentation is skipped - nothing is saved, and the health check of a recording without speech would
+    # only report silence
+    window.flip()
+    return frame_statistics(intervals, frame_clock.dropped)
+
+
+def loopback_latency(samples, positions, fs, search_seconds=0.25, block_seconds=0.001, min_dbfs=-50.0):
+    """
+    Find the tones in a recording made while they were played.
+
+    Args:
+        samples (numpy.ndarray): The recorded samples (1-D).
+        positions (list): The number of recorded frames when each tone was played.
+        fs (int): The sample rate.
+        search_seconds (float, optional): How long after play() a tone is searched.
+        block_seconds (float, optional): The resolution of the onset detection.
+        min_dbfs (float, optional): The minimal level of a detected tone.
+
+    Returns:
+        float or None: The median time from play() to the tone onset in ms, None if fewer than half of the tones
+        were found (the microphone does not pick up the loudspeaker).
+    """
+    block = max(int(block_seconds * fs), 1)
+    search = int(search_seconds * fs)
+    latencies = []
+    for position in positions:
+        noise = samples[max(position - search // 5, 0):position]
+        segment = samples[position:position + search]
+        n_blocks = len(segment) // block
+        if len(noise) == 0 or n_blocks == 0:
+            continue
+        levels = np.sqrt(np.mean(np.square(segment[:n_blocks * block].reshape(n_blocks, block)), axis=1))
+        # 20 dB above the noise before the tone
+        threshold = max(10 * np.sqrt(np.mean(np.square(noise))), 10 ** (min_dbfs / 20))
+        onsets = np.flatnonzero(levels > threshold)
+        if len(onsets):
+            latencies.append(onsets[0] * block / fs * 1000)
+    if len(latencies) < len(positions) / 2:
+        return None
+    return round(float(np.median(latencies)), 1)
+
+
+def measure_tones(recorder, fs, n_tones=TONE_COUNT, spacing=TONE_SPACING):
+    """
+    Play beeps like the beep stream does and measure how long they block and when they are heard.
+
+    Args:
+        recorder (Recorder): The open recorder - records the tones for the loopback latency.
+        fs (int): The sample rate of the recorder.
+        n_tones (int, optional): Number of tones.
+        spacing (float, optional): Seconds between the tones.
+
+    Returns:
+        dict: 95th percentile of the time sound.Sound and play() take in ms and the loopback latency in ms
+        (None without loopback). The loopback latency is only accurate to about one audio block (10 ms).
+    """
+    buffer = np.zeros((int((n_tones * spacing + 0.5) * fs), 1), dtype='float32')
+    recorder.start(buffer)
+    core.wait(0.2)
+    calls, positions = [], []
+    for index in range(n_tones):
+        started = time.perf_counter()
+        beep = sound.Sound(BEEP_NOTES['deviant' if index % 2 else 'normal'], octave=5, secs=BEEP_DURATION)
+        positions.append(recorder.frames_recorded)
+        beep.play()
+        calls.append(time.perf_counter() - started)
+        core.wait(spacing)
+    n_frames = recorder.stop()
+    return {
+        'tone_call_p95_ms': round(float(np.percentile(np.asarray(calls) * 1000, 95)), 3),
+        'tone_loopback_ms': loopback_latency(buffer[:n_frames, 0], positions, fs),
+    }
+
+
+def measure_recording_start(recorder, fs, repeats=RECORDING_STARTS):
+    """
+    Open the input stream and measure the time from the start of a recording to its first samples.
+
+    Args:
+        recorder (Recorder): The recorder, not opened yet.
+        fs (int): The sample rate of the recorder.
+        repeats (int, optional): Number of recording starts.
+
+    Returns:
+        dict: The time to open the input stream and the 95th percentile of the start latency in ms (None if no
+        samples arrived).
+    """
+    started = time.perf_counter()
+    recorder.open()
+    open_ms = (time.perf_counter() - started) * 1000
+    buffer = np.zeros((fs, 1), dtype='float32')
+    latencies = []
+    for index in range(repeats):
+        started = time.perf_counter()
+        recorder.start(buffer)
+        while recorder.frames_recorded == 0 and time.perf_counter() - started < 1.0:
+            time.sleep(0.0005)
+        if recorder.frames_recorded:
+            latencies.append(time.perf_counter() - started)
+        recorder.stop()
+        # start at different positions within the audio blocks
+        time.sleep(0.013 * (index % 3 + 1))
+    return {
+        'recording_open_ms': round(open_ms, 1),
+        'recording_start_p95_ms': round(float(np.percentile(np.asarray(latencies) * 1000, 95)), 3)
+        if len(latencies) == repeats else None,
+    }
+
+
+def measure_disk(directory, fs, rec_seconds, sample_format, n_recordings=DISK_RECORDINGS,
+                 megabytes=DISK_MEGABYTES):
+    """
+    Measure how fast recordings and raw data are written to the recordings directory.
+
+    Args:
+        directory (str): A scratch directory below the recordings directory.
+        fs (int): The sample rate of the recordings.
+        rec_seconds (float): The duration of a recording.
+        sample_format (str): The recording format.
+        n_recordings (int, optional): Number of recordings written.
+        megabytes (int, optional): Size of the raw write in MB.
+
+    Returns:
+        dict: The 95th percentile of the time to write a recording in ms and the throughput of a raw write
+        (flushed to the disk) in MB/s.
+    """
+    rng = np.random.default_rng(0)
+    # noise at about -26 dBFS - compresses about as badly as speech
+    data = (rng.standard_normal(int(rec_seconds * fs)) * 0.05).astype('float32')
+    times = []
+    for index in range(n_recordings):
+        started = time.perf_counter()
+        write_recording(os.path.join(directory, 'preflight_{:02d}{}'.format(index, recording_extension(sample_format))),
+                        data, fs, sample_format)
+        times.append(time.perf_counter() - started)
+
+    chunk = rng.integers(0, 256, 4 << 20, dtype=np.uint8).tobytes()
+    started = time.perf_counter()
+    with open(os.path.join(directory, 'preflight.bin'), 'wb') as file:
+        for _ in range(megabytes // 4):
+            file.write(chunk)
+        file.flush()
+        os.fsync(file.fileno())
+    elapsed = time.perf_counter() - started
+    return {
+        'recording_write_p95_ms': round(float(np.percentile(np.asarray(times) * 1000, 95)), 1),
+        'disk_mb_s': round((megabytes // 4) * 4 / elapsed, 1),
+    }
+
+
+def evaluate(metrics, baseline, limits, tolerance):
+    """
+    Compare the measurements with the absolute limits and the baseline.
+
+    A measurement fails if it is beyond its limit, or worse than the baseline by more than the tolerance factor
+    (plus the slack of the measurement). A measurement with a limit that could not be taken fails as well.
+
+    Args:
+        metrics (dict): The measurements.
+        baseline (dict or None): The stored baseline of this computer.
+        limits (dict): The absolute limits (see absolute_limits).
+        tolerance (float): Allowed factor between measurement and baseline.
+
+    Returns:
+        tuple: The rows (label, value, baseline, limit, verdict) and whether all measurements passed.
+    """
+    rows = []
+    for name, (label, higher_is_better, slack) in METRICS.items():
+        value = metrics.get(name)
+        reference = baseline.get(name) if baseline else None
+        limit = limits.get(name)
+        if value is None:
+            verdict = 'FAIL (not measured)' if limit is not None else 'n/a'
+        elif limit is not None and (value < limit if higher_is_better else value > limit):
+            verdict = 'FAIL (limit)'
+        elif reference is not None and (value < reference / tolerance - slack if higher_is_better
+                                        else value > reference * tolerance + slack):
+            verdict = 'FAIL (baseline)'
+        else:
+            verdict = 'ok'
+        rows.append((label, value, reference, limit, verdict))
+    return rows, all(not row[-1].startswith('FAIL') for row in rows)
+
+
+def print_report(rows, passed, key):
+    """Print the measurements with their baseline, limit and verdict."""
+    def cell(value):
+        return '-' if value is None else '{:g}'.format(round(value, 3))
+
+    print('Preflight check of {}'.format(key))
+    print('{:38} {:>10} {:>10} {:>10}  {}'.format('measurement', 'value', 'baseline', 'limit', 'verdict'))
+    for label, value, reference, limit, verdict in rows:
+        print('{:38} {:>10} {:>10} {:>10}  {}'.format(label, cell(value), cell(reference), cell(limit), verdict))
+    print('PREFLIGHT ' + ('PASSED' if passed else 'FAILED'))
+
+
+def main():
+    """Run the preflight check, print the verdict and exit with 1 if it failed."""
+    parser = argparse.ArgumentParser(description='Preflight check of the lab computer before a session.')
+    parser.add_argument('--save-baseline', action='store_true',
+                        help='store this run as the baseline of the computer (also if it failed)')
+    parser.add_argument('--tolerance', type=float, default=preflight_tolerance,
+                        help='allowed factor between a measurement and its baseline')
+    args = parser.parse_args()
+
+    checked = time.perf_counter()
+    key = '{}_{}'.format(socket.gethostname(), monitor_key)
+    baseline = load_calibration(preflight_baseline_file, key)
+
+    window = create_window()
+    (werKommt, fixation, item, prompt, feedback, fs, rec_seconds, movementDirections, responseList, dots, arrows,
+     arrows_small, number_prompts, frame_rate) = initialize_stimuli(window)
+    # scratch directory of the recordings and disk measurements - removed after the check
+    directory = os.path.join(record_path, '_preflight')
+    os.makedirs(directory, exist_ok=True)
+    recorder = Recorder(fs, threshold_db=vad_threshold_db, hangover=vad_hangover)
+    recording_writer = RecordingWriter(recording_format)
+    metrics = {}
+    try:
+        metrics.update(measure_recording_start(recorder, fs))
+        metrics.update(measure_trial(window, item, dots, movementDirections, responseList, fs, rec_seconds,
+                                     frame_rate, recorder, recording_writer, directory))
+        metrics.update(measure_tones(recorder, fs))
+        recording_writer.close()
+        metrics.update(measure_disk(directory, fs, rec_seconds, recording_format))
+    finally:
+        recorder.close()
+        window.close()
+        shutil.rmtree(directory, ignore_errors=True)
+
+    rows, passed = evaluate(metrics, baseline, absolute_limits(frame_rate, rec_seconds), args.tolerance)
+    print_report(rows, passed, key)
+    if args.save_baseline or (baseline is None and passed):
+        save_calibration(preflight_baseline_file, key,
+                         dict(metrics, frame_rate=frame_rate,
+                              measured=datetime.datetime.now().isoformat(timespec='seconds')))
+        print('Stored as the baseline of {} in {}'.format(key, preflight_baseline_file))
+    print('Preflight check took {:.1f} s'.format(time.perf_counter() - checked))
+    sys.exit(0 if passed else 1)
+
+
+if __name__ == '__main__':
+    main()
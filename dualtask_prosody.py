@@ -0,0 +1,382 @@
+"""
+Prosodic features of the recorded name sequences.
+The recordings show how participants mark the grouping of the names, e.g. "(Lotte und Laura) und Lisa" (grouped)
+versus "Lotte und Laura und Lisa" (ungrouped). For every recording listed in the main CSV files this module
+computes the F0 contour (YIN, vectorized over all analysis frames), the intensity contour and the speech segments
+with their durations, summarizes them per recording and joins them to the stimulus ID and condition of
+conditions.xlsx.
+
+The recordings are analysed in a process pool. The contours and summary of every recording are cached per file
+hash (and analysis settings), so re-running the extraction on a growing study only analyses new recordings.
+Recordings in a session container are read from the container and cached per hash of their stored samples.
+
+Usage:
+    python dualtask_prosody.py results/ --recordings recordings/ --out prosody_features.csv [--workers 4]
+"""
+
+# Import necessary libraries
+import argparse
+import json
+import os
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas
+from scipy.signal import resample_poly
+from dualtask_container import describe_source, read_container_recording
+from dualtask_recording import load_recording, file_sha256
+from dualtask_replay import recording_rows
+
+
+# Analysis settings - part of the cache key, so changing them re-analyses all recordings
+ANALYSIS_FS = 16000  # recordings are resampled to this rate before the analysis
+FRAME_SECONDS = 0.04  # analysis window (long enough for two periods of 60 Hz)
+HOP_SECONDS = 0.01  # step between analysis frames
+F0_MIN = 60.0
+F0_MAX = 500.0
+YIN_THRESHOLD = 0.15  # threshold of the cumulative mean normalized difference
+SPEECH_THRESHOLD_DB = -45.0  # frames from this intensity (dBFS) on count as speech
+MIN_PAUSE = 0.05  # shorter silences do not split a speech segment
+MIN_SPEECH = 0.05  # shorter speech segments are discarded
+LEVEL_FLOOR_DB = -120.0
+
+
+def analysis_settings(threshold_db=SPEECH_THRESHOLD_DB, min_pause=MIN_PAUSE, min_speech=MIN_SPEECH):
+    """Return the analysis settings as dictionary (used for the cache key and stored with the cache)."""
+    return {
+        'analysis_fs': ANALYSIS_FS, 'frame_seconds': FRAME_SECONDS, 'hop_seconds': HOP_SECONDS,
+        'f0_min': F0_MIN, 'f0_max': F0_MAX, 'yin_threshold': YIN_THRESHOLD,
+        'threshold_db': threshold_db, 'min_pause': min_pause, 'min_speech': min_speech,
+    }
+
+
+def frame_signal(samples, frame_length, hop_length):
+    """
+    Split a signal into overlapping frames without copying.
+
+    Args:
+        samples (numpy.ndarray): The mono signal.
+        frame_length (int): Samples per frame.
+        hop_length (int): Samples between the starts of consecutive frames.
+
+    Returns:
+        numpy.ndarray: Read-only view of shape (n_frames, frame_length).
+    """
+    if len(samples) < frame_length:
+        samples = np.pad(samples, (0, frame_length - len(samples)))
+    return np.lib.stride_tricks.sliding_window_view(samples, frame_length)[::hop_length]
+
+
+def intensity_contour(frames):
+    """
+    Compute the intensity of every frame.
+
+    Args:
+        frames (numpy.ndarray): Frames of shape (n_frames, frame_length).
+
+    Returns:
+        numpy.ndarray: The RMS level of every frame in dBFS.
+    """
+    power = np.mean(np.square(frames, dtype=np.float64), axis=1)
+    return 10 * np.log10(np.maximum(power, 10 ** (LEVEL_FLOOR_DB / 10)))
+
+
+def yin_f0(frames, fs, f0_min=F0_MIN, f0_max=F0_MAX, threshold=YIN_THRESHOLD):
+    """
+    Estimate the F0 of every frame with the YIN algorithm, vectorized over all frames.
+
+    The difference function of all frames is computed from their autocorrelation (via FFT) and running energies,
+    normalized cumulatively, and the first lag below the threshold is refined to its local minimum and by
+    parabolic interpolation.
+
+    Args:
+        frames (numpy.ndarray): Frames of shape (n_frames, frame_length).
+        fs (int): Sample rate of the frames.
+        f0_min (float, optional): Lowest F0 searched in Hz.
+        f0_max (float, optional): Highest F0 searched in Hz.
+        threshold (float, optional): Threshold of the cumulative mean normalized difference.
+
+    Returns:
+        numpy.ndarray: F0 of every frame in Hz, NaN for unvoiced frames.
+    """
+    n_frames, frame_length = frames.shape
+    tau_min = int(fs / f0_max)
+    tau_max = min(int(np.ceil(fs / f0_min)), frame_length - 2)
+    taus = np.arange(tau_max + 2)
+
+    # difference function d(tau) = E(0..W-tau) + E(tau..W) - 2 r(tau)
+    frames = np.asarray(frames, dtype=np.float64)
+    n_fft = 1 << int(np.ceil(np.log2(2 * frame_length)))
+    spectrum = np.fft.rfft(frames, n_fft, axis=1)
+    autocorrelation = np.fft.irfft(spectrum * np.conj(spectrum), n_fft, axis=1)[:, :tau_max + 2]
+    energy = np.cumsum(np.square(frames), axis=1)
+    head_energy = energy[:, frame_length - 1 - taus]
+    tail_energy = energy[:, -1:] - np.concatenate([np.zeros((n_frames, 1)), energy[:, taus[1:] - 1]], axis=1)
+    difference = np.maximum(head_energy + tail_energy - 2 * autocorrelation, 0)
+    difference[:, 0] = 0
+
+    # cumulative mean normalized difference
+    cumulative = np.cumsum(difference[:, 1:], axis=1)
+    normalized = np.ones_like(difference)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized[:, 1:] = np.where(cumulative > 0, difference[:, 1:] * taus[1:] / cumulative, 1.0)
+
+    # first lag below the threshold ...
+    below = normalized[:, tau_min:tau_max + 1] < threshold
+    voiced = below.any(axis=1)
+    lag = np.argmax(below, axis=1) + tau_min
+    # ... followed down to its local minimum
+    rows = np.arange(n_frames)
+    for _ in range(tau_max - tau_min):
+        step = voiced & (lag < tau_max) & (normalized[rows, np.minimum(lag + 1, tau_max)] < normalized[rows, lag])
+        if not step.any():
+            break
+        lag = lag + step
+
+    # parabolic interpolation around the minimum
+    previous = normalized[rows, lag - 1]
+    current = normalized[rows, lag]
+    following = normalized[rows, lag + 1]
+    curvature = previous - 2 * current + following
+    with np.errstate(divide='ignore', invalid='ignore'):
+        shift = np.where(np.abs(curvature) > 1e-12, 0.5 * (previous - following) / curvature, 0.0)
+    shift = np.clip(shift, -1, 1)
+    f0 = fs / (lag + shift)
+    f0[~voiced] = np.nan
+    return f0
+
+
+def speech_intervals(intensity_db, hop_seconds, threshold_db=SPEECH_THRESHOLD_DB, min_pause=MIN_PAUSE,
+                     min_speech=MIN_SPEECH):
+    """
+    Find the speech segments of a recording from its intensity contour.
+
+    Args:
+        intensity_db (numpy.ndarray): Intensity of every frame in dBFS.
+        hop_seconds (float): Time between consecutive frames.
+        threshold_db (float, optional): Intensity from which a frame counts as speech.
+        min_pause (float, optional): Silences shorter than this (seconds) do not split a segment.
+        min_speech (float, optional): Segments shorter than this (seconds) are discarded.
+
+    Returns:
+        numpy.ndarray: Start and end time (seconds) of every speech segment, shape (n_segments, 2).
+    """
+    active = np.concatenate([[0], (intensity_db >= threshold_db).astype(np.int8), [0]])
+    changes = np.diff(active)
+    starts = np.flatnonzero(changes == 1)
+    ends = np.flatnonzero(changes == -1)
+    if len(starts) == 0:
+        return np.zeros((0, 2))
+    # merge segments separated by short silences
+    keep = np.concatenate([[True], (starts[1:] - ends[:-1]) * hop_seconds >= min_pause])
+    starts = starts[keep]
+    ends = ends[np.concatenate([keep[1:], [True]])]
+    segments = np.stack([starts, ends], axis=1) * hop_seconds
+    return segments[segments[:, 1] - segments[:, 0] >= min_speech]
+
+
+def analyse_recording(samples, fs, settings=None):
+    """
+    Compute the contours and speech segments of a recording.
+
+    Args:
+        samples (numpy.ndarray): The mono recording.
+        fs (int): Its sample rate.
+        settings (dict, optional): The analysis settings (see analysis_settings).
+
+    Returns:
+        dict: 'times', 'f0' and 'intensity' (one value per frame) and 'segments' (start and end in seconds).
+    """
+    settings = settings or analysis_settings()
+    analysis_fs = settings['analysis_fs']
+    if fs != analysis_fs:
+        divisor = np.gcd(int(fs), int(analysis_fs))
+        samples = resample_poly(samples, analysis_fs // divisor, int(fs) // divisor)
+    frame_length = int(settings['frame_seconds'] * analysis_fs)
+    hop_length = int(settings['hop_seconds'] * analysis_fs)
+    frames = frame_signal(np.asarray(samples, dtype=np.float64), frame_length, hop_length)
+
+    intensity = intensity_contour(frames)
+    f0 = yin_f0(frames, analysis_fs, settings['f0_min'], settings['f0_max'], settings['yin_threshold'])
+    # pitch is only meaningful where the participant speaks
+    f0[intensity < settings['threshold_db']] = np.nan
+    times = (np.arange(len(frames)) * hop_length + frame_length / 2) / analysis_fs
+    segments = speech_intervals(intensity, settings['hop_seconds'], settings['threshold_db'],
+                                settings['min_pause'], settings['min_speech'])
+    return {'times': times, 'f0': f0, 'intensity': intensity, 'segments': segments}
+
+
+def summarize(analysis):
+    """
+    Summarize the contours and segments of a recording.
+
+    Args:
+        analysis (dict): The result of analyse_recording.
+
+    Returns:
+        dict: The prosodic features of the recording (NaN where a feature is undefined, e.g. no speech).
+    """
+    f0 = analysis['f0'][~np.isnan(analysis['f0'])]
+    segments = analysis['segments']
+    intensity = analysis['intensity']
+    features = {
+        'f0_mean': np.nan, 'f0_median': np.nan, 'f0_sd': np.nan, 'f0_min': np.nan, 'f0_max': np.nan,
+        'f0_range_st': np.nan,
+        'voiced_fraction': round(len(f0) / len(analysis['f0']), 3) if len(analysis['f0']) else np.nan,
+        'intensity_mean_db': np.nan, 'intensity_max_db': round(float(intensity.max()), 2) if len(intensity) else np.nan,
+        'speech_onset': np.nan, 'speech_offset': np.nan, 'speech_duration': np.nan, 'articulation_time': np.nan,
+        'n_segments': len(segments), 'n_pauses': max(len(segments) - 1, 0), 'pause_total': 0.0,
+        'pause_longest': 0.0,
+    }
+    if len(f0):
+        features.update({
+            'f0_mean': round(float(f0.mean()), 2), 'f0_median': round(float(np.median(f0)), 2),
+            'f0_sd': round(float(f0.std()), 2), 'f0_min': round(float(f0.min()), 2),
+            'f0_max': round(float(f0.max()), 2),
+            # range between the 5th and 95th percentile in semitones - robust against octave errors
+            'f0_range_st': round(float(12 * np.log2(np.percentile(f0, 95) / np.percentile(f0, 5))), 2),
+        })
+    if len(segments):
+        in_speech = (analysis['times'] >= segments[0, 0]) & (analysis['times'] < segments[-1, 1])
+        pauses = segments[1:, 0] - segments[:-1, 1]
+        features.update({
+            'intensity_mean_db': round(float(intensity[in_speech].mean()), 2) if in_speech.any() else np.nan,
+            'speech_onset': round(float(segments[0, 0]), 3), 'speech_offset': round(float(segments[-1, 1]), 3),
+            'speech_duration': round(float(segments[-1, 1] - segments[0, 0]), 3),
+            'articulation_time': round(float(np.sum(segments[:, 1] - segments[:, 0])), 3),
+            'pause_total': round(float(pauses.sum()), 3),
+            'pause_longest': round(float(pauses.max()), 3) if len(pauses) else 0.0,
+        })
+    return features
+
+
+def cache_file(cache_path, sha256, settings):
+    """Return the cache file of a recording hash and analysis settings."""
+    settings_key = '{:08x}'.format(zlib.crc32(json.dumps(settings, sort_keys=True).encode('utf-8')))
+    return os.path.join(cache_path, sha256[:2], '{}_{}.npz'.format(sha256, settings_key))
+
+
+def extract_file(job):
+    """
+    Extract the features of one recording, using the cache if possible (runs in a worker process).
+
+    Args:
+        job (tuple): The source of the recording - (path of the file, None) or (path of the session container,
+            name of the recording) -, the cache directory (or None) and the analysis settings.
+
+    Returns:
+        tuple: The source, the features (None if the recording could not be read) and whether the cache was used.
+    """
+    source, cache_path, settings = job
+    path, name = source
+    samples = None
+    try:
+        if name is None:
+            # a file is hashed first, so cached features do not need the samples at all
+            sha256 = file_sha256(path)
+        else:
+            samples, fs, sha256 = read_container_recording(path, name)
+    except (OSError, RuntimeError, ValueError, KeyError):
+        return source, None, False
+    cached = cache_file(cache_path, sha256, settings) if cache_path else None
+    if cached and os.path.isfile(cached):
+        with np.load(cached) as data:
+            return source, dict(json.loads(str(data['summary'])), sha256=sha256), True
+
+    if samples is None:
+        try:
+            samples, fs = load_recording(path)
+        except (OSError, RuntimeError, ValueError):
+            return source, None, False
+    analysis = analyse_recording(samples, fs, settings)
+    features = summarize(analysis)
+    if cached:
+        os.makedirs(os.path.dirname(cached), exist_ok=True)
+        temporary_file = cached[:-len('.npz')] + '.tmp.npz'
+        np.savez_compressed(temporary_file, summary=np.array(json.dumps(features)), **analysis)
+        os.replace(temporary_file, cached)
+    return source, dict(features, sha256=sha256), False
+
+
+def load_contours(cache_path, sha256, settings=None):
+    """
+    Load the cached contours of a recording.
+
+    Args:
+        cache_path (str): The cache directory.
+        sha256 (str): The hash of the recording (column 'sha256' of the feature table).
+        settings (dict, optional): The analysis settings the contours were computed with.
+
+    Returns:
+        dict or None: 'times', 'f0', 'intensity' and 'segments', None if the recording is not cached.
+    """
+    cached = cache_file(cache_path, sha256, settings or analysis_settings())
+    if not os.path.isfile(cached):
+        return None
+    with np.load(cached) as data:
+        return {key: data[key] for key in ('times', 'f0', 'intensity', 'segments')}
+
+
+def extract_features(results_path, recordings_path, conditions_file, cache_path=None, workers=None,
+                     settings=None):
+    """
+    Extract the prosodic features of all recordings of a study in parallel.
+
+    Args:
+        results_path (str): The results directory.
+        recordings_path (str): The recordings directory.
+        conditions_file (str): Path of conditions.xlsx - provides the condition of every stimulus ID.
+        cache_path (str, optional): Directory of the feature cache. None disables the cache.
+        workers (int, optional): Number of worker processes.
+        settings (dict, optional): The analysis settings (see analysis_settings).
+
+    Returns:
+        pandas.DataFrame: One row per recording with the trial columns, the condition and the features.
+    """
+    settings = settings or analysis_settings()
+    rows = recording_rows(results_path, recordings_path)
+    start = time.perf_counter()
+    features = {}
+    n_cached = 0
+    jobs = [(row['source'], cache_path, settings) for row in rows if os.path.isfile(row['source'][0])]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for source, result, from_cache in executor.map(extract_file, jobs, chunksize=4):
+            if result is None:
+                print('Could not read ' + describe_source(source))
+                continue
+            features[source] = result
+            n_cached += from_cache
+    print('{} recordings ({} from the cache, {} missing) in {:.1f} s'.format(
+        len(features), n_cached, len(rows) - len(jobs), time.perf_counter() - start))
+
+    table = pandas.DataFrame([dict(row, source=describe_source(row['source']), **features[row['source']])
+                              for row in rows if row['source'] in features])
+    if table.empty:
+        return table
+    conditions = pandas.read_excel(conditions_file)[['ID', 'condition']].drop_duplicates('ID')
+    return table.merge(conditions.rename(columns={'ID': 'stimulus_id'}), on='stimulus_id', how='left')
+
+
+def main():
+    """Command line interface of the feature extraction."""
+    parser = argparse.ArgumentParser(description='Prosodic features of the recordings of the dual task study.')
+    parser.add_argument('results', help='results directory, e.g. results/ or results/<subject>')
+    parser.add_argument('--recordings', default='recordings', help='recordings directory')
+    parser.add_argument('--conditions', default=os.path.join('stimuli', 'conditions.xlsx'),
+                        help='stimulus list with the condition of every stimulus ID')
+    parser.add_argument('--cache', default='prosody_cache', help="feature cache directory ('' disables the cache)")
+    parser.add_argument('--out', default='prosody_features.csv', help='output CSV file')
+    parser.add_argument('--threshold-db', type=float, default=SPEECH_THRESHOLD_DB,
+                        help='intensity (dBFS) from which a frame counts as speech')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    table = extract_features(args.results, args.recordings, args.conditions, args.cache or None, args.workers,
+                             analysis_settings(threshold_db=args.threshold_db))
+    table.to_csv(args.out, index=False)
+    print('Features written to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,376 @@
+"""
+Visual quality check of the recordings.
+Listening to or opening every recording in an audio editor is the slowest part of checking a session. This module
+computes a compact preview of every recording listed in the main CSV files once, in a process pool, and keeps it
+in a cache:
+    - a min/max waveform pyramid: the minimum and maximum of blocks of 64 samples, and of 4 times larger blocks on
+      every further level, quantized to 8 bit - any zoom level is drawn from the nearest level without the samples
+    - a spectrogram downsampled to 64 frequency bands up to 8 kHz and 20 ms steps, as 8-bit levels from -100 to 0 dB
+
+The previews are cached per recording hash (like the prosodic features), so a re-run only decodes new recordings.
+From the cache the contact sheets of every subject are rendered: pages with one tile per recording (spectrogram
+with the waveform on top, task, trial and stimulus ID below); recordings whose health check failed (rec_qc column)
+get a red frame. An index.html per subject shows the pages and lists the flagged recordings.
+
+Recordings stored in a session container (session_container = True) are read from the container.
+
+Usage:
+    python dualtask_qc.py results/ --recordings recordings/ --out qc/ [--workers 4]
+"""
+
+# Import necessary libraries
+import argparse
+import html
+import json
+import os
+import time
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from PIL import Image, ImageDraw
+from scipy.signal import resample_poly
+from dualtask_container import describe_source, read_container_recording
+from dualtask_prosody import cache_file, frame_signal
+from dualtask_recording import load_recording, file_sha256
+from dualtask_replay import recording_rows
+
+
+# Preview settings - part of the cache key, so changing them recomputes all previews
+PYRAMID_BLOCK = 64  # samples per min/max pair on the finest level
+PYRAMID_FACTOR = 4  # blocks per min/max pair of the next level
+PYRAMID_MIN_COLUMNS = 128  # the coarsest level has at most this many min/max pairs
+SPECTRUM_FS = 16000  # recordings are resampled to this rate for the spectrogram
+SPECTRUM_FRAME = 512  # analysis window (32 ms)
+SPECTRUM_HOP = 320  # step between spectrogram columns (20 ms)
+SPECTRUM_BANDS = 64  # frequency bands up to SPECTRUM_FS / 2
+SPECTRUM_FLOOR_DB = -100.0  # level of spectrogram value 0; 255 is 0 dB
+
+# Layout of the contact sheets
+TILE_WIDTH = 240
+WAVEFORM_HEIGHT = 48
+SPECTRUM_HEIGHT = 64
+LABEL_HEIGHT = 14
+TILE_MARGIN = 4
+SHEET_COLUMNS = 6
+SHEET_ROWS = 10
+# Colour map of the spectrogram (from silence to 0 dB)
+COLOUR_STOPS = np.array([[0, 0, 4], [59, 15, 112], [140, 41, 129], [222, 73, 104], [254, 159, 109], [252, 253, 191]])
+
+
+def preview_settings():
+    """Return the preview settings as dictionary (used for the cache key and stored with the cache)."""
+    return {
+        'pyramid_block': PYRAMID_BLOCK, 'pyramid_factor': PYRAMID_FACTOR, 'pyramid_min_columns': PYRAMID_MIN_COLUMNS,
+        'spectrum_fs': SPECTRUM_FS, 'spectrum_frame': SPECTRUM_FRAME, 'spectrum_hop': SPECTRUM_HOP,
+        'spectrum_bands': SPECTRUM_BANDS, 'spectrum_floor_db': SPECTRUM_FLOOR_DB,
+    }
+
+
+def waveform_pyramid(samples):
+    """
+    Compute the min/max waveform pyramid of a recording.
+
+    Args:
+        samples (numpy.ndarray): The mono signal (float, full scale 1.0).
+
+    Returns:
+        tuple: The minima and maxima of every level (lists of int8 arrays, full scale 127), finest level first.
+    """
+    n_blocks = max(1, -(-len(samples) // PYRAMID_BLOCK))
+    blocks = np.zeros(n_blocks * PYRAMID_BLOCK, dtype=np.float32)
+    blocks[:len(samples)] = samples
+    blocks = blocks.reshape(n_blocks, PYRAMID_BLOCK)
+    minimum, maximum = blocks.min(axis=1), blocks.max(axis=1)
+    minima, maxima = [], []
+    while True:
+        minima.append(np.round(np.clip(minimum, -1.0, 1.0) * 127).astype(np.int8))
+        maxima.append(np.round(np.clip(maximum, -1.0, 1.0) * 127).astype(np.int8))
+        if len(minimum) <= PYRAMID_MIN_COLUMNS:
+            return minima, maxima
+        # the next level combines PYRAMID_FACTOR blocks - the last group may be shorter
+        starts = np.arange(0, len(minimum), PYRAMID_FACTOR)
+        minimum, maximum = np.minimum.reduceat(minimum, starts), np.maximum.reduceat(maximum, starts)
+
+
+def spectrogram(samples, fs):
+    """
+    Compute the downsampled spectrogram of a recording.
+
+    Args:
+        samples (numpy.ndarray): The mono signal (float, full scale 1.0).
+        fs (int): The sample rate.
+
+    Returns:
+        numpy.ndarray: uint8 levels of shape (SPECTRUM_BANDS, n_frames), lowest band first; 0 is SPECTRUM_FLOOR_DB
+        or less, 255 is a full scale sine.
+    """
+    if fs != SPECTRUM_FS:
+        samples = resample_poly(samples, SPECTRUM_FS, fs)
+    window = np.hanning(SPECTRUM_FRAME).astype(np.float32)
+    frames = frame_signal(np.asarray(samples, dtype=np.float32), SPECTRUM_FRAME, SPECTRUM_HOP)
+    power = np.abs(np.fft.rfft(frames * window, axis=1)) ** 2 / (window.sum() / 2) ** 2
+    bins_per_band = (SPECTRUM_FRAME // 2) // SPECTRUM_BANDS
+    bands = power[:, :SPECTRUM_BANDS * bins_per_band].reshape(len(power), SPECTRUM_BANDS, bins_per_band).mean(axis=2)
+    level_db = 10 * np.log10(np.maximum(bands, 1e-20))
+    scaled = (level_db - SPECTRUM_FLOOR_DB) / -SPECTRUM_FLOOR_DB * 255
+    return np.round(np.clip(scaled, 0, 255)).astype(np.uint8).T
+
+
+def compute_preview(samples, fs):
+    """
+    Compute the preview of a recording.
+
+    Args:
+        samples (numpy.ndarray): The mono signal (float, full scale 1.0).
+        fs (int): The sample rate.
+
+    Returns:
+        dict: The arrays stored in the cache: 'min_<level>' and 'max_<level>' of the pyramid, 'spectrogram' and
+        'summary' (JSON with sample rate, number of samples, duration, peak level and the lengths of the levels).
+    """
+    samples = np.asarray(samples, dtype=np.float32)
+    minima, maxima = waveform_pyramid(samples)
+    peak = float(np.max(np.abs(samples))) if len(samples) else 0.0
+    summary = {'sample_rate': int(fs), 'n_samples': len(samples), 'duration': round(len(samples) / fs, 3),
+               'peak_dbfs': round(20 * np.log10(max(peak, 1e-6)), 1),
+               'level_lengths': [len(minimum) for minimum in minima]}
+    preview = {'summary': np.array(json.dumps(summary)), 'spectrogram': spectrogram(samples, fs)}
+    for level, (minimum, maximum) in enumerate(zip(minima, maxima)):
+        preview['min_{}'.format(level)] = minimum
+        preview['max_{}'.format(level)] = maximum
+    return preview
+
+
+def cache_preview(job):
+    """
+    Compute the preview of one recording unless it is cached (runs in a worker process).
+
+    Args:
+        job (tuple): The source of the recording - (path of the file, None) or (path of the session container,
+            name of the recording) -, the cache directory and the preview settings.
+
+    Returns:
+        tuple: The source, the cache file (None if the recording could not be read) and whether it was cached.
+    """
+    source, cache_path, settings = job
+    path, name = source
+    try:
+        if name is None:
+            # a file is hashed first, so a cached preview does not need the samples at all
+            cached = cache_file(cache_path, file_sha256(path), settings)
+            if os.path.isfile(cached):
+                return source, cached, True
+            samples, fs = load_recording(path)
+        else:
+            samples, fs, sha256 = read_container_recording(path, name)
+            cached = cache_file(cache_path, sha256, settings)
+            if os.path.isfile(cached):
+                return source, cached, True
+    except (OSError, RuntimeError, ValueError, KeyError):
+        return source, None, False
+    os.makedirs(os.path.dirname(cached), exist_ok=True)
+    temporary_file = cached[:-len('.npz')] + '.tmp.npz'
+    np.savez_compressed(temporary_file, **compute_preview(samples, fs))
+    os.replace(temporary_file, cached)
+    return source, cached, False
+
+
+def build_cache(rows, cache_path, workers=None, settings=None):
+    """
+    Compute the previews of all recordings that are not cached yet, in parallel.
+
+    Args:
+        rows (list): The recordings (see recording_rows).
+        cache_path (str): The cache directory.
+        workers (int, optional): Number of worker processes.
+        settings (dict, optional): The preview settings (see preview_settings).
+
+    Returns:
+        dict: The cache file of every source that could be read.
+    """
+    settings = settings or preview_settings()
+    start = time.perf_counter()
+    sources = list(dict.fromkeys(row['source'] for row in rows))
+    jobs = [(source, cache_path, settings) for source in sources if os.path.isfile(source[0])]
+    cached_files = {}
+    n_cached = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for source, cached, from_cache in executor.map(cache_preview, jobs, chunksize=4):
+            if cached is None:
+                print('Could not read ' + describe_source(source))
+                continue
+            cached_files[source] = cached
+            n_cached += from_cache
+    print('{} previews ({} from the cache, {} missing) in {:.1f} s'.format(
+        len(cached_files), n_cached, len(sources) - len(jobs), time.perf_counter() - start))
+    return cached_files
+
+
+def waveform_columns(preview, width):
+    """
+    Reduce the waveform pyramid of a preview to a number of columns.
+
+    Only the level that is needed is loaded: the coarsest one that still has a min/max pair per column.
+
+    Args:
+        preview: The loaded cache file of the recording.
+        width (int): Number of columns.
+
+    Returns:
+        tuple: The minimum and maximum of every column (int8 scale).
+    """
+    level_lengths = json.loads(str(preview['summary']))['level_lengths']
+    level = 0
+    while level + 1 < len(level_lengths) and level_lengths[level + 1] >= width:
+        level += 1
+    minimum, maximum = preview['min_{}'.format(level)], preview['max_{}'.format(level)]
+    starts = np.unique(np.linspace(0, len(minimum), width, endpoint=False).astype(int))
+    columns = np.minimum(np.arange(width) * len(starts) // width, len(starts) - 1)
+    return np.minimum.reduceat(minimum, starts)[columns], np.maximum.reduceat(maximum, starts)[columns]
+
+
+def colour_map():
+    """Return the 256 colours of the spectrogram levels."""
+    positions = np.linspace(0, 255, len(COLOUR_STOPS))
+    return np.stack([np.interp(np.arange(256), positions, COLOUR_STOPS[:, channel]) for channel in range(3)],
+                    axis=1).astype(np.uint8)
+
+
+COLOURS = colour_map()
+
+
+def render_tile(preview, width=TILE_WIDTH):
+    """
+    Render the spectrogram and waveform of a cached preview.
+
+    Args:
+        preview: The loaded cache file of the recording.
+        width (int, optional): Width of the tile in pixels.
+
+    Returns:
+        numpy.ndarray: RGB image of shape (WAVEFORM_HEIGHT + SPECTRUM_HEIGHT, width, 3).
+    """
+    image = np.full((WAVEFORM_HEIGHT + SPECTRUM_HEIGHT, width, 3), 255, dtype=np.uint8)
+
+    # waveform: a vertical line from the minimum to the maximum of every column
+    minimum, maximum = waveform_columns(preview, width)
+    half = (WAVEFORM_HEIGHT - 1) / 2
+    top = np.round(half - maximum.astype(np.float32) / 127 * half)
+    bottom = np.round(half - minimum.astype(np.float32) / 127 * half)
+    rows = np.arange(WAVEFORM_HEIGHT)[:, None]
+    image[:WAVEFORM_HEIGHT][(rows >= top) & (rows <= bottom)] = (31, 78, 121)
+
+    # spectrogram: nearest column and band, lowest band at the bottom
+    levels = preview['spectrogram']
+    frame_index = np.minimum(np.arange(width) * levels.shape[1] // width, levels.shape[1] - 1)
+    band_index = (SPECTRUM_HEIGHT - 1 - np.arange(SPECTRUM_HEIGHT)) * levels.shape[0] // SPECTRUM_HEIGHT
+    image[WAVEFORM_HEIGHT:] = COLOURS[levels[band_index][:, frame_index]]
+    return image
+
+
+def contact_sheets(rows, cached_files, out_path, subject, columns=SHEET_COLUMNS, rows_per_sheet=SHEET_ROWS):
+    """
+    Render the contact sheets of a subject from the cache.
+
+    Args:
+        rows (list): The recordings of the subject (see recording_rows).
+        cached_files (dict): The cache file of every source (see build_cache).
+        out_path (str): The output directory.
+        subject (str): The subject ID (used in the file names).
+        columns (int, optional): Tiles per row.
+        rows_per_sheet (int, optional): Rows of tiles per sheet.
+
+    Returns:
+        list: The file names of the sheets.
+    """
+    tile_height = WAVEFORM_HEIGHT + SPECTRUM_HEIGHT + LABEL_HEIGHT
+    per_sheet = columns * rows_per_sheet
+    sheets = []
+    for first in range(0, len(rows), per_sheet):
+        page = rows[first:first + per_sheet]
+        n_rows = -(-len(page) // columns)
+        sheet = Image.new('RGB', (columns * (TILE_WIDTH + TILE_MARGIN) + TILE_MARGIN,
+                                  n_rows * (tile_height + TILE_MARGIN) + TILE_MARGIN), (230, 230, 230))
+        draw = ImageDraw.Draw(sheet)
+        for index, row in enumerate(page):
+            x = TILE_MARGIN + (index % columns) * (TILE_WIDTH + TILE_MARGIN)
+            y = TILE_MARGIN + (index // columns) * (tile_height + TILE_MARGIN)
+            label = '{} {} #{}'.format(row['task'], row['main_trial'], row['stimulus_id'])
+            cached = cached_files.get(row['source'])
+            if cached is None:
+                draw.rectangle([x, y, x + TILE_WIDTH - 1, y + tile_height - 1], fill=(255, 255, 255))
+                draw.text((x + 4, y + 4), 'missing', fill=(200, 0, 0))
+            else:
+                with np.load(cached) as preview:
+                    sheet.paste(Image.fromarray(render_tile(preview)), (x, y))
+                    label += '  {:.1f} s'.format(json.loads(str(preview['summary']))['duration'])
+            draw.text((x + 2, y + WAVEFORM_HEIGHT + SPECTRUM_HEIGHT + 1), label, fill=(0, 0, 0))
+            if row['rec_qc'] not in ('ok', 'NA'):
+                draw.rectangle([x - 2, y - 2, x + TILE_WIDTH + 1, y + tile_height + 1], outline=(220, 0, 0), width=2)
+        filename = 'qc_{}_{:02d}.png'.format(subject, first // per_sheet + 1)
+        # fast PNG compression - the sheets are rendered on every run and are only looked at
+        sheet.save(os.path.join(out_path, filename), compress_level=1)
+        sheets.append(filename)
+    return sheets
+
+
+def write_index(out_path, subject, rows, sheets):
+    """
+    Write the overview page of a subject: the flagged recordings and the contact sheets.
+
+    Args:
+        out_path (str): The output directory.
+        subject (str): The subject ID.
+        rows (list): The recordings of the subject.
+        sheets (list): The file names of the contact sheets.
+
+    Returns:
+        str: The path of the page.
+    """
+    flagged = [row for row in rows if row['rec_qc'] not in ('ok', 'NA')]
+    lines = ['<!DOCTYPE html>', '<html><head><meta charset="utf-8"><title>QC {}</title></head><body>'.format(
+        html.escape(subject)), '<h1>Recordings of {}</h1>'.format(html.escape(subject)),
+        '<p>{} recordings, {} flagged by the health check</p>'.format(len(rows), len(flagged))]
+    if flagged:
+        lines.append('<table border="1"><tr><th>task</th><th>trial</th><th>stimulus</th><th>recording</th>'
+                     '<th>rec_qc</th></tr>')
+        for row in flagged:
+            lines.append('<tr>' + ''.join('<td>{}</td>'.format(html.escape(str(row[column])))
+                                          for column in ('task', 'main_trial', 'stimulus_id', 'stimulus_rec',
+                                                         'rec_qc')) + '</tr>')
+        lines.append('</table>')
+    lines += ['<p><img src="{}"></p>'.format(html.escape(sheet)) for sheet in sheets]
+    lines.append('</body></html>')
+    path = os.path.join(out_path, 'qc_{}.html'.format(subject))
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+    return path
+
+
+def main():
+    """Command line interface of the recording check."""
+    parser = argparse.ArgumentParser(description='Waveform and spectrogram contact sheets of the recordings.')
+    parser.add_argument('results', help='results directory, e.g. results/ or results/<subject>')
+    parser.add_argument('--recordings', default='recordings', help='recordings directory')
+    parser.add_argument('--cache', default='qc_cache', help='preview cache directory')
+    parser.add_argument('--out', default='qc', help='output directory of the contact sheets')
+    parser.add_argument('--columns', type=int, default=SHEET_COLUMNS, help='tiles per row of a contact sheet')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    rows = recording_rows(args.results, args.recordings)
+    cached_files = build_cache(rows, args.cache, args.workers)
+    os.makedirs(args.out, exist_ok=True)
+    by_subject = defaultdict(list)
+    for row in rows:
+        by_subject[row['subject']].append(row)
+    start = time.perf_counter()
+    for subject, subject_rows in sorted(by_subject.items()):
+        sheets = contact_sheets(subject_rows, cached_files, args.out, subject, args.columns)
+        print('{}: {} recordings on {} sheets - {}'.format(subject, len(subject_rows), len(sheets),
+                                                            write_index(args.out, subject, subject_rows, sheets)))
+    print('Contact sheets rendered in {:.1f} s'.format(time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main()
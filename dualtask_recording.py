@@ -0,0 +1,697 @@
+"""
+Recording output for the single and dual task.
+The recordings returned by sounddevice are float32 arrays which are large when written as they are.
+This module converts them to the configured sample format (16-bit or 24-bit PCM WAV, or lossless FLAC)
+and writes them in a background thread, so encoding and disk access never happen inside the frame loop.
+The RecordingWriter also keeps track of how many bytes the chosen format saved compared to float32 WAV files.
+The recording buffers come from a RecordingBufferPool: they are allocated once per session, handed to sounddevice
+and returned to the pool by the writer once the recording is saved.
+Every written recording is added with its checksum to the manifest of its directory by a RecordingManifest.
+The Recorder fills these buffers from a sounddevice input stream and runs a simple voice activity detection
+in the audio callback, which the trial functions use to adapt the item presentation to the participant's speech.
+"""
+
+# Import necessary libraries
+import csv
+import datetime
+import hashlib
+import os
+import queue
+import threading
+import warnings
+import logging
+import numpy as np
+from scipy.io.wavfile import read, write, WavFileWarning
+
+# soundfile is installed together with psychopy and is needed for 24-bit PCM and FLAC output
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+# sounddevice is only needed to record - offline tools can use this module without PortAudio
+try:
+    import sounddevice as sd
+except (ImportError, OSError):
+    sd = None
+
+
+# Supported recording formats: file extension, soundfile container and soundfile subtype
+RECORDING_FORMATS = {
+    'float32': ('.wav', 'WAV', 'FLOAT'),
+    'int16': ('.wav', 'WAV', 'PCM_16'),
+    'int24': ('.wav', 'WAV', 'PCM_24'),
+    'flac': ('.flac', 'FLAC', 'PCM_24'),
+}
+
+# Size of a canonical WAV header in bytes - used to estimate the size of the uncompressed float32 file
+WAV_HEADER_BYTES = 44
+
+# Manifest of the recordings in every recordings directory
+MANIFEST_FILENAME = 'manifest.csv'
+MANIFEST_COLUMNS = ['file', 'task', 'main_trial', 'stimulus_id', 'sample_rate', 'n_samples', 'duration', 'bytes',
+                    'sha256', 'written']
+
+
+def recording_extension(sample_format):
+    """
+    Return the file extension used for recordings in the given sample format.
+
+    Args:
+        sample_format (str): One of the keys of RECORDING_FORMATS.
+
+    Returns:
+        str: The file extension including the leading dot, e.g. '.wav' or '.flac'.
+
+    Raises:
+        ValueError: If the sample format is unknown.
+    """
+    if sample_format not in RECORDING_FORMATS:
+        raise ValueError("Unknown recording format '{}'. Use one of: {}".format(
+            sample_format, ', '.join(RECORDING_FORMATS)))
+    return RECORDING_FORMATS[sample_format][0]
+
+
+def float_to_int16(data):
+    """
+    Convert float samples in the range [-1, 1] to 16-bit integer PCM samples.
+
+    Args:
+        data (numpy.ndarray): The float recording.
+
+    Returns:
+        numpy.ndarray: The recording as int16 array, clipped to the valid range.
+    """
+    return (np.clip(data, -1.0, 1.0) * 32767).astype(np.int16)
+
+
+def recording_levels(data, floor_db=-120.0):
+    """
+    Compute the peak and RMS level of a recording.
+
+    Args:
+        data (numpy.ndarray): The float recording.
+        floor_db (float, optional): Level reported for silent or empty recordings. Defaults to -120 dBFS.
+
+    Returns:
+        tuple: Peak and RMS level in dBFS, rounded to 0.1 dB.
+    """
+    if len(data) == 0:
+        return floor_db, floor_db
+    peak = float(np.max(np.abs(data)))
+    rms = float(np.sqrt(np.mean(np.square(data, dtype=np.float64))))
+    floor = 10 ** (floor_db / 20)
+    return round(20 * float(np.log10(max(peak, floor))), 1), round(20 * float(np.log10(max(rms, floor))), 1)
+
+
+def recording_qc(data, fs, clip_level=0.999, silence_db=-50.0, block_seconds=0.01):
+    """
+    Check the health of a recording right after it was stopped.
+
+    All measures are computed on the whole buffer at once, which takes about a millisecond for a trial.
+
+    Args:
+        data (numpy.ndarray): The float recording of shape (frames,) or (frames, channels).
+        fs (int): The sample rate of the recording.
+        clip_level (float, optional): Absolute sample value from which a sample counts as clipped. Defaults to 0.999.
+        silence_db (float, optional): Block level in dBFS below which a block counts as silent. Defaults to -50 dBFS.
+        block_seconds (float, optional): Length of the blocks for the silence fraction. Defaults to 10 ms.
+
+    Returns:
+        dict: 'peak_dbfs', 'rms_dbfs', 'clipping_ratio' (fraction of clipped samples) and 'silence_fraction'
+        (fraction of silent blocks).
+    """
+    peak_dbfs, rms_dbfs = recording_levels(data)
+    if len(data) == 0:
+        return {'peak_dbfs': peak_dbfs, 'rms_dbfs': rms_dbfs, 'clipping_ratio': 0.0, 'silence_fraction': 1.0}
+    clipping_ratio = np.count_nonzero(np.abs(data) >= clip_level) / data.size
+    # mean square of consecutive blocks (the last incomplete block is left out)
+    block_size = max(1, int(block_seconds * fs))
+    n_blocks = len(data) // block_size
+    if n_blocks:
+        blocks = np.square(data[:n_blocks * block_size], dtype=np.float64).reshape(n_blocks, -1)
+        silence_fraction = np.count_nonzero(blocks.mean(axis=1) < 10 ** (silence_db / 10)) / n_blocks
+    else:
+        silence_fraction = 1.0
+    return {
+        'peak_dbfs': peak_dbfs,
+        'rms_dbfs': rms_dbfs,
+        'clipping_ratio': round(float(clipping_ratio), 6),
+        'silence_fraction': round(float(silence_fraction), 3),
+    }
+
+
+def write_recording(path, data, fs, sample_format):
+    """
+    Write a single recording to disk in the given sample format.
+
+    soundfile is used for all formats if it is available. Without soundfile only the 'float32' and 'int16'
+    formats can be written (with scipy), since scipy has no 24-bit or FLAC support.
+
+    Args:
+        path (str): The full path of the output file including the extension.
+        data (numpy.ndarray): The recorded samples as returned by sounddevice (float32).
+        fs (int): The sample rate of the recording.
+        sample_format (str): One of the keys of RECORDING_FORMATS.
+
+    Returns:
+        int: The size of the written file in bytes.
+
+    Raises:
+        RuntimeError: If the format needs soundfile and it is not installed.
+    """
+    extension, container, subtype = RECORDING_FORMATS[sample_format]
+
+    if soundfile is not None:
+        soundfile.write(path, data, fs, format=container, subtype=subtype)
+    elif sample_format == 'float32':
+        write(path, fs, data)
+    elif sample_format == 'int16':
+        write(path, fs, float_to_int16(data))
+    else:
+        raise RuntimeError("The recording format '{}' needs the soundfile package. "
+                           "Please install it or use 'int16' or 'float32'.".format(sample_format))
+
+    return os.path.getsize(path)
+
+
+def load_recording(path, mmap=False):
+    """
+    Read a recording (WAV or FLAC) as mono float samples.
+
+    Args:
+        path (str): Path of the recording.
+        mmap (bool, optional): Map 16-bit and float32 WAV files into memory instead of reading them, so only the
+            samples that are used are loaded from disk. Other files are read with soundfile. Defaults to False.
+
+    Returns:
+        tuple: The samples (1-D numpy.ndarray, float32 or float64) and the sample rate.
+
+    Raises:
+        RuntimeError: If the file needs soundfile (FLAC, 24-bit WAV) and it is not installed.
+    """
+    samples = None
+    if mmap and path.lower().endswith('.wav'):
+        try:
+            with warnings.catch_warnings():
+                # extra chunks (e.g. written by soundfile) are skipped by scipy
+                warnings.simplefilter('ignore', WavFileWarning)
+                fs, samples = read(path, mmap=True)
+        except ValueError:
+            samples = None  # e.g. 24-bit PCM, which scipy cannot map
+    if samples is None:
+        if soundfile is not None:
+            samples, fs = soundfile.read(path, dtype='float32')
+        elif path.lower().endswith('.wav'):
+            fs, samples = read(path)
+        else:
+            raise RuntimeError("Reading '{}' needs the soundfile package.".format(path))
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if samples.dtype.kind in 'iu':
+        samples = samples / float(np.iinfo(samples.dtype).max)
+    return samples, fs
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """
+    Compute the SHA-256 checksum of a file, reading it in chunks.
+
+    Args:
+        path (str): Path of the file.
+        chunk_size (int, optional): Bytes read at a time. Defaults to 1 MiB.
+
+    Returns:
+        str: The hex digest.
+    """
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for chunk in iter(lambda: file.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class RecordingBufferPool:
+    """
+    Pool of preallocated recording buffers that are reused across trials.
+
+    Buffers are kept per shape (frames, channels). acquire() hands out a free buffer and only allocates a new one
+    if all buffers of that shape are still in use (e.g. while the writer is busy), so after the first trials the
+    memory use of a session stays flat. Released buffers are cleared, so a recording that is stopped early never
+    contains samples of an earlier trial.
+
+    Attributes:
+        dtype (str): The sample type of the buffers - float32 as used by sounddevice.
+        allocated (int): Number of buffers allocated so far.
+    """
+
+    def __init__(self, dtype='float32'):
+        self.dtype = dtype
+        self.allocated = 0
+        self._free = {}
+        self._lock = threading.Lock()
+
+    def _allocate(self, frames, channels):
+        """Allocate a new zeroed buffer - zeros also touch all pages, so no page faults occur while recording."""
+        self.allocated += 1
+        return np.zeros((frames, channels), dtype=self.dtype)
+
+    def preallocate(self, frames, channels=1, count=3):
+        """
+        Allocate buffers at the start of the session.
+
+        Args:
+            frames (int): Number of sample frames per buffer.
+            channels (int, optional): Number of channels per buffer. Defaults to 1.
+            count (int, optional): Number of buffers to allocate. Defaults to 3.
+        """
+        buffers = [self._allocate(frames, channels) for _ in range(count)]
+        with self._lock:
+            self._free.setdefault((frames, channels), []).extend(buffers)
+
+    def acquire(self, frames, channels=1):
+        """
+        Take a buffer of the given shape out of the pool.
+
+        Args:
+            frames (int): Number of sample frames.
+            channels (int, optional): Number of channels. Defaults to 1.
+
+        Returns:
+            numpy.ndarray: A zeroed buffer of shape (frames, channels).
+        """
+        with self._lock:
+            free = self._free.get((frames, channels))
+            if free:
+                return free.pop()
+        return self._allocate(frames, channels)
+
+    def release(self, buffer):
+        """
+        Clear a buffer and give it back to the pool.
+
+        Args:
+            buffer (numpy.ndarray): A buffer obtained from acquire().
+        """
+        buffer.fill(0)
+        with self._lock:
+            self._free.setdefault(buffer.shape, []).append(buffer)
+
+
+class RecordingManifest:
+    """
+    Index of the recordings of a session with their checksums.
+
+    For every written recording a row with file name, trial, stimulus ID, sample count, duration, size and SHA-256
+    checksum is appended to manifest.csv in the recording's directory. The checksum is computed in a background
+    thread from the written file, so neither the frame loop nor the recording writer waits for it. Recordings in a
+    session container are listed by their name in the container, with the size and hash of their stored samples. Later tools
+    (archiving, transfer, analysis) check completeness and integrity with the manifest instead of decoding every
+    recording.
+
+    Attributes:
+        filename (str): Name of the manifest file in every recordings directory.
+        files_hashed (int): Number of recordings added to a manifest so far.
+        errors (list): (file, message) of recordings that could not be hashed.
+    """
+
+    def __init__(self, filename=MANIFEST_FILENAME):
+        self.filename = filename
+        self.files_hashed = 0
+        self.errors = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='RecordingManifest', daemon=True)
+        self._thread.start()
+
+    def add(self, path, fs, n_samples, metadata=None, n_bytes=None, sha256=None):
+        """
+        Queue a written recording for hashing and adding to the manifest of its directory.
+
+        Args:
+            path (str): Path of the written recording.
+            fs (int): Its sample rate.
+            n_samples (int): Number of samples (frames) of the recording.
+            metadata (dict, optional): 'task', 'main_trial' and 'stimulus_id' of the recording.
+            n_bytes (int, optional): Size of the recording. Taken from the file if not given.
+            sha256 (str, optional): Checksum of the recording. Computed from the file if not given.
+        """
+        self._queue.put((path, fs, n_samples, metadata or {}, n_bytes, sha256))
+
+    def _run(self):
+        """Worker loop: hash queued recordings and append them to their manifest until None is received."""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            path, fs, n_samples, metadata, n_bytes, sha256 = job
+            try:
+                row = {
+                    'file': os.path.basename(path),
+                    'task': metadata.get('task', ''),
+                    'main_trial': metadata.get('main_trial', ''),
+                    'stimulus_id': metadata.get('stimulus_id', ''),
+                    'sample_rate': fs,
+                    'n_samples': n_samples,
+                    'duration': round(n_samples / fs, 4),
+                    'bytes': os.path.getsize(path) if n_bytes is None else n_bytes,
+                    'sha256': file_sha256(path) if sha256 is None else sha256,
+                    'written': datetime.datetime.now().isoformat(timespec='seconds'),
+                }
+                manifest_file = os.path.join(os.path.dirname(path), self.filename)
+                new_file = not os.path.isfile(manifest_file)
+                with open(manifest_file, 'a', newline='') as file:
+                    writer = csv.DictWriter(file, fieldnames=MANIFEST_COLUMNS)
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerow(row)
+                self.files_hashed += 1
+            except Exception as e:
+                self.errors.append((path, str(e)))
+                logging.log(level=logging.ERROR,
+                            msg="Fehler beim Eintragen der Aufnahme '{}' ins Manifest: {}".format(path, e))
+            finally:
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until all recordings queued so far are in their manifest."""
+        self._queue.join()
+
+    def close(self):
+        """Hash all pending recordings and stop the worker thread."""
+        self._queue.put(None)
+        self._thread.join()
+
+
+def read_manifest(directory, filename=MANIFEST_FILENAME):
+    """
+    Read the manifest of a recordings directory.
+
+    If a recording was written more than once (e.g. a repeated session), its last row is used.
+
+    Args:
+        directory (str): The recordings directory, e.g. recordings/<subject>.
+        filename (str, optional): Name of the manifest file.
+
+    Returns:
+        dict: File name -> manifest row, empty if the directory has no manifest.
+    """
+    manifest_file = os.path.join(directory, filename)
+    if not os.path.isfile(manifest_file):
+        return {}
+    with open(manifest_file, newline='') as file:
+        return {row['file']: row for row in csv.DictReader(file)}
+
+
+def check_manifest(directory, verify_hashes=True, filename=MANIFEST_FILENAME):
+    """
+    Check a recordings directory against its manifest.
+
+    Only the recording files are checked - recordings of a session container (listed without extension) are
+    checked against the container by the archive (see dualtask_archive.verify_containers).
+
+    Args:
+        directory (str): The recordings directory.
+        verify_hashes (bool, optional): Recompute the checksums (reads every file). If False only the presence and
+            size of the files are checked. Defaults to True.
+        filename (str, optional): Name of the manifest file.
+
+    Returns:
+        dict: Lists of file names: 'missing' (in the manifest, not on disk), 'unlisted' (recordings on disk that
+        are not in the manifest) and 'corrupt' (size or checksum differs).
+    """
+    manifest = {name: row for name, row in read_manifest(directory, filename).items()
+                if os.path.splitext(name)[1] in ('.wav', '.flac')}
+    on_disk = {name for name in os.listdir(directory)
+               if os.path.splitext(name)[1] in ('.wav', '.flac')} if os.path.isdir(directory) else set()
+    corrupt = []
+    for name in sorted(on_disk & set(manifest)):
+        path = os.path.join(directory, name)
+        if os.path.getsize(path) != int(manifest[name]['bytes']) or \
+                (verify_hashes and file_sha256(path) != manifest[name]['sha256']):
+            corrupt.append(name)
+    return {
+        'missing': sorted(set(manifest) - on_disk),
+        'unlisted': sorted(on_disk - set(manifest)),
+        'corrupt': corrupt,
+    }
+
+
+class RecordingWriter:
+    """
+    Writes recordings in a background thread.
+
+    The trial functions take a buffer from buffer_pool, hand it over with submit() and continue immediately.
+    A single worker thread converts and writes the recordings in the order they were submitted and then returns
+    the buffers to the pool. Written recordings are passed on to the manifest, which hashes them in its own thread.
+    close() waits until all pending recordings are written and added to the manifest.
+    With a session container the buffers are handed to the container instead - no files are written, and the
+    container returns the buffers to the pool once their samples are stored and adds them to the manifest.
+
+    Attributes:
+        sample_format (str): The configured recording format.
+        extension (str): The file extension belonging to the format.
+        buffer_pool (RecordingBufferPool): The pool the recording buffers are taken from and returned to.
+        files_written (int): Number of recordings written so far.
+        bytes_uncompressed (int): Size the recordings would have had as float32 WAV files.
+        bytes_written (int): Size of the recordings actually written.
+        manifest (RecordingManifest): The manifest the written recordings are added to.
+        container (SessionContainer): The session container the recordings are written to, or None for files.
+    """
+
+    def __init__(self, sample_format='flac', buffer_pool=None, manifest=None, container=None):
+        self.sample_format = sample_format
+        self.container = container
+        self.extension = recording_extension(sample_format)
+        self.buffer_pool = buffer_pool if buffer_pool is not None else RecordingBufferPool()
+        self.manifest = manifest if manifest is not None else RecordingManifest()
+        self.files_written = 0
+        self.bytes_uncompressed = 0
+        self.bytes_written = 0
+        self.errors = []
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, name='RecordingWriter', daemon=True)
+        self._thread.start()
+
+    def submit(self, path, data, fs, n_frames=None, pooled=True, metadata=None):
+        """
+        Queue a recording for writing.
+
+        Args:
+            path (str): The output path without extension - the extension of the format is added.
+            data (numpy.ndarray): The recording buffer. It must not be changed after submitting.
+            fs (int): The sample rate of the recording.
+            n_frames (int, optional): Number of frames of the buffer to write. Defaults to the whole buffer.
+            pooled (bool, optional): Whether the buffer is returned to buffer_pool after writing. Defaults to True.
+            metadata (dict, optional): 'task', 'main_trial' and 'stimulus_id' of the recording for the manifest.
+
+        Returns:
+            str: The file name (without directory) the recording will be written to - with a session container the
+            name of the recording in the container (without extension).
+        """
+        if self.container is not None:
+            name = os.path.basename(path)
+            self.container.add_recording(
+                name, data, fs, n_frames, metadata, release=self.buffer_pool.release if pooled else None,
+                written=lambda n_samples, n_bytes, sha256: self.manifest.add(path, fs, n_samples, metadata,
+                                                                             n_bytes, sha256))
+            return name
+        filename = path + self.extension
+        self._queue.put((filename, data, fs, n_frames, pooled, metadata))
+        return os.path.basename(filename)
+
+    def _run(self):
+        """Worker loop: write queued recordings until the stop marker (None) is received."""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                break
+            filename, data, fs, n_frames, pooled, metadata = job
+            samples = data if n_frames is None else data[:n_frames]
+            try:
+                size = write_recording(filename, samples, fs, self.sample_format)
+                self.bytes_uncompressed += samples.size * np.dtype(np.float32).itemsize + WAV_HEADER_BYTES
+                self.bytes_written += size
+                self.files_written += 1
+                self.manifest.add(filename, fs, len(samples), metadata)
+            except Exception as e:
+                # Never let a failing write stop the worker - remember the error and report it at the end
+                self.errors.append((filename, str(e)))
+                logging.log(level=logging.ERROR, msg="Fehler beim Schreiben der Aufnahme '{}': {}".format(filename, e))
+            finally:
+                if pooled:
+                    self.buffer_pool.release(data)
+                self._queue.task_done()
+
+    def flush(self):
+        """Block until all recordings submitted so far are written and in the manifest."""
+        self._queue.join()
+        self.manifest.flush()
+
+    def close(self):
+        """Write all pending recordings, complete the manifest and stop the worker threads."""
+        self._queue.put(None)
+        self._thread.join()
+        self.manifest.close()
+
+    @property
+    def bytes_saved(self):
+        """Number of bytes saved compared to writing float32 WAV files."""
+        return self.bytes_uncompressed - self.bytes_written
+
+    def summary(self):
+        """
+        Summarize the storage used by the recordings of this session.
+
+        Returns:
+            dict: Format, number of files, uncompressed and written size, the saved bytes and the number of
+            recordings in the manifest.
+        """
+        return {
+            'recording_format': self.sample_format,
+            'files_written': self.files_written,
+            'bytes_uncompressed': self.bytes_uncompressed,
+            'bytes_written': self.bytes_written,
+            'bytes_saved': self.bytes_saved,
+            'files_hashed': self.manifest.files_hashed,
+            'errors': len(self.errors) + len(self.manifest.errors),
+        }
+
+
+class Recorder:
+    """
+    Records the participant's responses into pool buffers and detects speech while recording.
+
+    The input stream is opened once per session and keeps running; start() and stop() only switch the target buffer,
+    so starting a recording costs nothing inside the frame loop. For every audio block the callback copies the
+    samples into the buffer and compares the block level with the speech threshold. Switching the buffer and
+    storing a block hold a lock, so a block that arrives while a recording is started or stopped belongs entirely
+    to one recording; the resulting speech state is read by the frame loop without locking.
+
+    Attributes:
+        fs (int): The sample rate of the recordings.
+        threshold_db (float): Block level in dBFS from which a block counts as speech.
+        hangover (float): Seconds a short silence may last and still count as continued speech.
+        speech_onset (int or None): First sample of the current recording that was classified as speech.
+        speech_offset (int or None): Sample after the last block classified as speech.
+        input_overflows (int): Audio blocks of the current recording with an input overflow (lost samples).
+        input_underflows (int): Audio blocks of the current recording with an input underflow.
+    """
+
+    def __init__(self, fs, channels=1, threshold_db=-45.0, hangover=0.3, block_seconds=0.01):
+        self.fs = fs
+        self.channels = channels
+        self.threshold_db = threshold_db
+        # compare mean squares instead of dB values - saves the logarithm in the audio callback
+        self._threshold_power = 10 ** (threshold_db / 10)
+        self._hangover_frames = int(hangover * fs)
+        self._block_size = int(block_seconds * fs)
+        self._stream = None
+        self._lock = threading.Lock()
+        self._buffer = None
+        self._n_frames = 0
+        self.speech_onset = None
+        self.speech_offset = None
+        self.input_overflows = 0
+        self.input_underflows = 0
+
+    def open(self):
+        """Open and start the input stream. Called once at the start of the session."""
+        if sd is None:
+            raise RuntimeError("Recording needs the sounddevice package and PortAudio.")
+        self._stream = sd.InputStream(samplerate=self.fs, channels=self.channels, dtype='float32',
+                                      blocksize=self._block_size, callback=self._callback)
+        self._stream.start()
+
+    def close(self):
+        """Stop and close the input stream at the end of the session."""
+        if self._stream is not None:
+            self._stream.stop()
+            self._stream.close()
+            self._stream = None
+
+    def start(self, buffer):
+        """
+        Start a new recording into the given buffer, discarding the state of a running recording.
+
+        Args:
+            buffer (numpy.ndarray): The buffer of shape (frames, channels) the samples are written to.
+        """
+        if self._stream is None:
+            self.open()
+        # a block the callback is storing finishes before the state is reset
+        with self._lock:
+            self._n_frames = 0
+            self.speech_onset = None
+            self.speech_offset = None
+            self.input_overflows = 0
+            self.input_underflows = 0
+            self._buffer = buffer
+
+    def stop(self):
+        """
+        Stop the current recording.
+
+        Returns:
+            int: The number of frames recorded into the buffer.
+        """
+        # a block the callback is storing is complete when the number of frames is read
+        with self._lock:
+            self._buffer = None
+            return self._n_frames
+
+    def _callback(self, indata, frames, time_info, status):
+        """Audio callback: store the block, collect the stream status and update the speech state."""
+        # the level is computed outside the lock - it does not depend on the recording
+        power = np.mean(np.square(indata))
+        with self._lock:
+            buffer = self._buffer
+            if buffer is None:
+                return
+            if status:
+                self.input_overflows += bool(status.input_overflow)
+                self.input_underflows += bool(status.input_underflow)
+            position = self._n_frames
+            n = min(frames, len(buffer) - position)
+            if n <= 0:
+                return
+            buffer[position:position + n] = indata[:n]
+            if power >= self._threshold_power:
+                if self.speech_onset is None:
+                    self.speech_onset = position
+                self.speech_offset = position + n
+            self._n_frames = position + n
+
+    @property
+    def frames_recorded(self):
+        """Number of frames recorded into the current buffer so far."""
+        return self._n_frames
+
+    @property
+    def speech_active(self):
+        """True while speech was detected within the hangover time."""
+        return self.speech_offset is not None and self._n_frames - self.speech_offset < self._hangover_frames
+
+    def trailing_silence(self):
+        """
+        Return the silence after the last speech of the current recording.
+
+        Returns:
+            float or None: Seconds since the end of the last speech block, None if no speech was detected yet.
+        """
+        if self.speech_offset is None:
+            return None
+        return (self._n_frames - self.speech_offset) / self.fs
+
+    def speech_span(self):
+        """
+        Return the detected speech span of the current recording.
+
+        Returns:
+            tuple: Onset and offset in seconds relative to the start of the recording, or (None, None)
+            if no speech was detected.
+        """
+        if self.speech_onset is None:
+            return None, None
+        return round(self.speech_onset / self.fs, 3), round(self.speech_offset / self.fs, 3)
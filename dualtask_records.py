@@ -0,0 +1,196 @@
+"""
+Result records of the experiment and the schema of the result files.
+A trial result and a beep row are compact objects with fixed slots instead of dictionaries of strings. Coded
+fields (phase, presentation, beep type, accuracy, reaction to a beep) are enums, numbers stay numbers and missing
+values are None. They are only turned into text when a result is exported, with the same values as in the CSV
+files so far ('NA' for missing values, lists as python lists).
+
+The column lists below are the single schema of the result files: the CSV writer takes its header and column order
+from them, and readers can rely on the same names.
+"""
+
+# Import necessary libraries
+from enum import Enum
+
+
+class Phase(str, Enum):
+    """Phase of a task."""
+    practice = 'practice'
+    test = 'test'
+
+    @classmethod
+    def of_task(cls, task_name):
+        """Return the phase of a task from its name, e.g. 'practice_single' -> Phase.practice."""
+        return cls.practice if task_name.startswith('practice') else cls.test
+
+
+class Presentation(str, Enum):
+    """Whether a beep was played alone, during the item presentation, or marks the pause of the item presentation."""
+    single = 'single'
+    dual = 'dual'
+    pause = 'name_coordinate and dots'
+
+
+class BeepType(str, Enum):
+    """Type of a beep - 'none' marks the pause of the item presentation."""
+    normal = 'normal'
+    deviant = 'deviant'
+    none = 'none'
+
+
+class Accuracy(str, Enum):
+    """Accuracy of a response."""
+    correct = 'correct'
+    incorrect = 'incorrect'
+
+
+class PressResponse(str, Enum):
+    """Reaction to a beep of the beep press task."""
+    hit = 'hit'
+    miss = 'miss'
+    false_alarm = 'false_alarm'
+    none = 'none'
+
+
+# Columns written from the participant's information before the record's own columns
+PARTICIPANT_COLUMNS = {
+    'main': ['experiment', 'subjectID', 'date', 'session_seed'],
+    'beep_count': ['experiment', 'subjectID', 'date'],
+    'beep_press': ['experiment', 'subjectID', 'date'],
+}
+PARTICIPANT_KEYS = {'experiment': 'experiment', 'subjectID': 'subject', 'date': 'cur_date',
+                    'session_seed': 'session_seed'}
+
+# Text written for missing values
+MISSING = 'NA'
+
+
+def _plain(value):
+    """Return a python value for an enum or numpy scalar."""
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def export_value(value):
+    """
+    Turn a field value into the value written to a result file.
+
+    Args:
+        value: The field value.
+
+    Returns:
+        The exported value: 'NA' for None, the value of an enum, lists as their python representation.
+    """
+    if value is None:
+        return MISSING
+    if isinstance(value, (list, tuple)):
+        return str([_plain(item) for item in value])
+    return _plain(value)
+
+
+class Record:
+    """
+    Base class of the result records.
+
+    Subclasses define FIELDS (the slots) and COLUMNS (the exported fields in file order). Fields that are not
+    given are None and exported as 'NA'.
+    """
+    __slots__ = ()
+    FIELDS = ()
+    COLUMNS = ()
+    TYPE = None
+
+    def __init__(self, **values):
+        unknown = set(values) - set(self.FIELDS)
+        if unknown:
+            raise TypeError('{} has no fields {}'.format(type(self).__name__, ', '.join(sorted(unknown))))
+        for field in self.FIELDS:
+            setattr(self, field, values.get(field))
+
+    @classmethod
+    def header(cls):
+        """Return the header of the record's result file (participant columns and own columns)."""
+        return PARTICIPANT_COLUMNS[cls.TYPE] + list(cls.COLUMNS)
+
+    def export_row(self, participant_info):
+        """
+        Return the row of the record in its result file.
+
+        Args:
+            participant_info (dict): The participant's information.
+
+        Returns:
+            list: The exported values in the order of header().
+        """
+        row = [participant_info[PARTICIPANT_KEYS[column]] for column in PARTICIPANT_COLUMNS[self.TYPE]]
+        for column in self.COLUMNS:
+            value = getattr(self, column)
+            if column == 'main_trial' and isinstance(value, int):
+                value = '{:02d}'.format(value)
+            row.append(export_value(value))
+        return row
+
+    def __repr__(self):
+        return '{}({})'.format(type(self).__name__, ', '.join(
+            '{}={!r}'.format(field, getattr(self, field)) for field in self.FIELDS if getattr(self, field) is not None))
+
+
+class TrialRecord(Record):
+    """
+    The result of a main trial (one row of the main CSV file).
+
+    main_trial is the trial number (starting at 1). The single task leaves the dot, beep and number fields None,
+    a dual task those of the secondary tasks it does not include.
+    condition is not written to the CSV file, it is kept for the session store.
+    """
+    COLUMNS = (
+        'task', 'main_trial', 'phase', 'stimulus_id', 'stimulus', 'stimulus_rec', 'frame_rate',
+        'item_1st_frame', 'item_last_frame', 'speech_onset', 'speech_offset',
+        'rec_peak_dbfs', 'rec_rms_dbfs', 'rec_clipping_ratio', 'rec_silence_fraction', 'rec_input_overflows', 'rec_qc',
+        'dot_direction', 'dot_1st_frame', 'dot_last_frame', 'dot_response_key', 'dot_response_accuracy',
+        'dot_coherence', 'dot_threshold', 'dot_threshold_sd', 'dot_lapse',
+        'beep_sequence', 'beep_count_trials', 'beep_count_deviant_trials', 'beep_count_normal_trials',
+        'beep_count_number_selection', 'beep_count_index_correct_count', 'beep_count_response',
+        'beep_count_response_accuracy', 'rand_nr', 'number_selection', 'index_rand_nr', 'index_number_response',
+        'number_response_accuracy', 'beep_press_trials', 'beep_press_deviant_trials', 'beep_press_normal_trials',
+        'beep_press_hits', 'beep_press_misses', 'beep_press_false_alarms', 'beep_press_unmatched',
+        'beep_press_rt_correct', 'beep_press_rt_incorrect', 'beep_press_accuracy', 'start_time', 'end_time', 'duration',
+    )
+    FIELDS = COLUMNS + ('condition',)
+    TYPE = 'main'
+    __slots__ = FIELDS
+
+
+class BeepRecord(Record):
+    """
+    A beep of a beep count trial, or the pause of the beeps during the item presentation (one row of the
+    beep count CSV file). beep_count_trial is the number of the beep, or a text describing the pause.
+    """
+    COLUMNS = (
+        'task', 'phase', 'main_trial', 'beep_count_trial', 'beep_count_stimulus', 'presentation',
+        'start_time', 'end_time', 'duration',
+    )
+    FIELDS = COLUMNS
+    TYPE = 'beep_count'
+    __slots__ = FIELDS
+
+
+class BeepPressRecord(Record):
+    """
+    A beep of a beep press trial with the reaction to it, or the pause of the beeps during the item presentation
+    (one row of the beep press CSV file). beep_press_rt is the time from the beep onset to the key press in seconds.
+    """
+    COLUMNS = (
+        'task', 'phase', 'main_trial', 'beep_press_trial', 'beep_press_stimulus', 'beep_press_rt',
+        'beep_press_response_type', 'beep_press_accuracy', 'presentation', 'start_time', 'end_time', 'duration',
+    )
+    FIELDS = COLUMNS
+    TYPE = 'beep_press'
+    __slots__ = FIELDS
+
+
+# The record class of every result file type
+RECORD_TYPES = {record_type.TYPE: record_type for record_type in (TrialRecord, BeepRecord, BeepPressRecord)}
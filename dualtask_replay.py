@@ -0,0 +1,363 @@
+"""
+Headless replay of completed dual task sessions.
+From the session seed and the logged item presentation of each trial, the replay reconstructs what the participant
+saw and heard: item and dot frames, the dot direction and the complete beep sequence with its timing.
+No window or sound device is needed, so whole results trees are checked much faster than real time.
+
+Usage:
+    python dualtask_replay.py verify results/ [--workers 4]
+        Replays every dual task session under results/ in parallel and compares the reconstruction with the logged
+        fields of the main and beep count CSV files.
+    python dualtask_replay.py render results/<subject>/<task>_<subject>_<timestamp>_main.csv --trial 03 --out trial.wav
+        Renders the beeps the participant heard in a trial to a WAV file (optionally with the recording mixed in)
+        and can write the frame-by-frame timeline of the trial to a CSV file.
+"""
+
+# Import necessary libraries
+import argparse
+import csv
+import glob
+import os
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from scipy.io.wavfile import write
+from dualtask_container import load_source, recording_source
+from dualtask_rng import SessionRNG, TASK_SEEDS
+from dualtask_schedule import beep_schedule, select_and_replace_number, FrameGrid, TRIAL_MS, \
+    MOVEMENT_DIRECTIONS, BEEP_DURATION, BEEP_FREQUENCIES
+
+
+# Frame rate assumed for sessions that did not log their frame rate
+DEFAULT_FRAME_RATE = 60.0
+
+# The reconstructed course of one trial
+TrialTimeline = namedtuple('TrialTimeline', ['task', 'main_trial', 'stimulus_id', 'stimulus_rec', 'frame_rate',
+                                             'item_frames', 'dot_frames', 'dot_direction', 'beeps',
+                                             'number_selection', 'correct_index'])
+
+
+def read_csv_rows(filename):
+    """
+    Read a result CSV file into a list of dictionaries.
+
+    The headers written by append_result_to_csv end with a blank ('duration '), so keys are stripped.
+
+    Args:
+        filename (str): Path of the CSV file.
+
+    Returns:
+        list: One dictionary per row.
+    """
+    with open(filename, newline='') as file:
+        reader = csv.reader(file)
+        header = [column.strip() for column in next(reader)]
+        return [dict(zip(header, row)) for row in reader]
+
+
+def find_sessions(results_path):
+    """
+    Find all main CSV files of dual tasks below a results directory.
+
+    Args:
+        results_path (str): The results directory (or the directory of a single subject).
+
+    Returns:
+        list: Paths of the main CSV files of the beep count and dots tasks.
+    """
+    main_files = glob.glob(os.path.join(results_path, '**', '*_main.csv'), recursive=True)
+    return sorted(path for path in main_files
+                  if any(os.path.basename(path).startswith(task + '_') for task in TASK_SEEDS))
+
+
+def recording_rows(results_path, recordings_path):
+    """
+    Collect the recordings of all main CSV files below a results directory.
+
+    Args:
+        results_path (str): The results directory.
+        recordings_path (str): The recordings directory (with one folder per subject).
+
+    Returns:
+        list: One dictionary per recording with the trial columns, the result of the health check and its source
+        (see dualtask_container.recording_source).
+    """
+    rows = []
+    for main_csv in sorted(glob.glob(os.path.join(results_path, '**', '*_main.csv'), recursive=True)):
+        for row in read_csv_rows(main_csv):
+            if not row.get('stimulus_rec'):
+                continue
+            rows.append({
+                'subject': row['subjectID'],
+                'task': row['task'],
+                'phase': row['phase'],
+                'main_trial': row['main_trial'],
+                'stimulus_id': row['stimulus_id'],
+                'stimulus_rec': row['stimulus_rec'],
+                'rec_qc': row.get('rec_qc', 'NA'),
+                'source': recording_source(main_csv, row, recordings_path),
+            })
+    return rows
+
+
+def replay_task(rows, frame_rate=None):
+    """
+    Reconstruct all trials of one dual task from its main CSV rows.
+
+    The trials must be given in the order they were run, since the number options are drawn from one stream.
+
+    Args:
+        rows (list): The rows of the task's main CSV file.
+        frame_rate (float, optional): Frame rate to use if the rows have no 'frame_rate' column.
+
+    Returns:
+        list: One TrialTimeline per row.
+
+    Raises:
+        KeyError: If the rows were written before session seeds and item frames were logged.
+    """
+    task_name = rows[0]['task']
+    session_rng = SessionRNG(int(rows[0]['session_seed']))
+    parameters = session_rng.draw_beep_count_dots_parameters(task_name, len(rows))
+    numbers_rng = session_rng.stream(task_name, 'numbers')
+
+    timelines = []
+    for x, row in enumerate(rows):
+        # the draws are reference frames at 60 Hz, mapped to the frame grid the trial was shown on
+        row_frame_rate = float(row.get('frame_rate') or frame_rate or DEFAULT_FRAME_RATE)
+        frame_grid = FrameGrid(row_frame_rate)
+        reference_start = int(parameters['start_offset'][x])
+        start_offset = frame_grid.from_reference(reference_start)
+        # the end of the item presentation depends on the participant's speech and is taken from the log
+        end_offset = int(row['item_last_frame']) + 1
+        dot_first = frame_grid.from_reference(reference_start + int(parameters['dot_delay'][x]))
+        beeps = beep_schedule(start_offset, end_offset, parameters['beep_draws'][x], frame_grid)
+        deviants = sum(1 for beep in beeps if beep.played and beep.beep_type == 'deviant')
+        number_selection, correct_index = select_and_replace_number(deviants, numbers_rng)
+        timelines.append(TrialTimeline(
+            task=task_name,
+            main_trial=row['main_trial'],
+            stimulus_id=row['stimulus_id'],
+            stimulus_rec=row['stimulus_rec'],
+            frame_rate=row_frame_rate,
+            item_frames=(start_offset, end_offset - 1),
+            dot_frames=(dot_first, dot_first + frame_grid.dot_frames),
+            dot_direction=MOVEMENT_DIRECTIONS[parameters['movement_index'][x]],
+            beeps=beeps,
+            number_selection=number_selection,
+            correct_index=correct_index,
+        ))
+    return timelines
+
+
+def expected_fields(timeline):
+    """
+    Return the main CSV fields that follow from a reconstructed trial.
+
+    Args:
+        timeline (TrialTimeline): The reconstructed trial.
+
+    Returns:
+        dict: Column name -> expected value as written to the CSV file.
+    """
+    played = [beep.beep_type for beep in timeline.beeps if beep.played]
+    deviants = played.count('deviant')
+    return {
+        'item_1st_frame': str(timeline.item_frames[0]),
+        'dot_direction': str(timeline.dot_direction),
+        'dot_1st_frame': str(timeline.dot_frames[0]),
+        'dot_last_frame': str(timeline.dot_frames[1]),
+        'beep_sequence': str(played),
+        'beep_count_trials': str(len(played)),
+        'beep_count_deviant_trials': str(deviants),
+        'beep_count_normal_trials': str(len(played) - deviants),
+        'beep_count_number_selection': str(timeline.number_selection),
+        'beep_count_index_correct_count': str(timeline.correct_index),
+    }
+
+
+def verify_session(main_csv):
+    """
+    Replay one dual task session and compare it with its logged results.
+
+    Args:
+        main_csv (str): Path of the task's main CSV file. The beep count CSV is expected next to it.
+
+    Returns:
+        tuple: The path, the number of replayed trials and a list of mismatch descriptions.
+    """
+    rows = read_csv_rows(main_csv)
+    if not rows:
+        return main_csv, 0, []
+    if 'session_seed' not in rows[0] or 'item_1st_frame' not in rows[0]:
+        return main_csv, 0, ['written before session seeds and item frames were logged - cannot be replayed']
+
+    timelines = replay_task(rows)
+    mismatches = []
+    for row, timeline in zip(rows, timelines):
+        for column, expected in expected_fields(timeline).items():
+            if row[column] != expected:
+                mismatches.append('trial {} {}: logged {!r}, replayed {!r}'.format(
+                    row['main_trial'], column, row[column], expected))
+
+    # compare the beep rows of the beep count CSV file
+    beep_csv = main_csv[:-len('_main.csv')] + '_beep_count.csv'
+    if os.path.isfile(beep_csv):
+        logged_beeps = {}
+        for beep_row in read_csv_rows(beep_csv):
+            if beep_row['beep_count_stimulus'] != 'none':
+                logged_beeps.setdefault(beep_row['main_trial'], []).append(beep_row['beep_count_stimulus'])
+        for timeline in timelines:
+            played = [beep.beep_type for beep in timeline.beeps if beep.played]
+            if logged_beeps.get(timeline.main_trial, []) != played:
+                mismatches.append('trial {} beep count rows differ from the replayed beeps'.format(timeline.main_trial))
+    else:
+        mismatches.append('beep count file missing: {}'.format(beep_csv))
+
+    return main_csv, len(timelines), mismatches
+
+
+def frame_timeline(timeline):
+    """
+    Expand a reconstructed trial into one row per frame.
+
+    Args:
+        timeline (TrialTimeline): The reconstructed trial.
+
+    Returns:
+        dict: Arrays with one entry per frame of the trial (longer if the item was shown until later):
+            'frame', 'time' (seconds), 'item' and 'dots' (visible or not) and 'beep' (beep type played or '').
+    """
+    n_frames = max(FrameGrid(timeline.frame_rate).trial_frames, timeline.item_frames[1] + 1)
+    frames = np.arange(n_frames)
+    beep = np.full(n_frames, '', dtype=object)
+    for event in timeline.beeps:
+        if event.played:
+            beep[event.frame] = event.beep_type
+    return {
+        'frame': frames,
+        'time': frames / timeline.frame_rate,
+        'item': (frames >= timeline.item_frames[0]) & (frames <= timeline.item_frames[1]),
+        'dots': (frames >= timeline.dot_frames[0]) & (frames < timeline.dot_frames[1]),
+        'beep': beep,
+    }
+
+
+def render_trial_audio(timeline, fs=48000, recording=None):
+    """
+    Render the beeps a participant heard in a trial as an audio track.
+
+    The tones are sine waves at the frequencies of psychopy's notes C5 and A5 with short raised-cosine ramps.
+
+    Args:
+        timeline (TrialTimeline): The reconstructed trial.
+        fs (int, optional): Sample rate of the rendered track. Defaults to 48000.
+        recording (numpy.ndarray, optional): The participant's recording, mixed in at the item onset.
+
+    Returns:
+        numpy.ndarray: The rendered mono track as float32 samples.
+    """
+    n_frames = max(FrameGrid(timeline.frame_rate).trial_frames, timeline.item_frames[1] + 1)
+    track = np.zeros(int(np.ceil(n_frames / timeline.frame_rate * fs)) + int(BEEP_DURATION * fs), dtype=np.float32)
+
+    t = np.arange(int(BEEP_DURATION * fs)) / fs
+    ramp = int(0.01 * fs)
+    envelope = np.ones_like(t)
+    envelope[:ramp] = 0.5 - 0.5 * np.cos(np.pi * np.arange(ramp) / ramp)
+    envelope[-ramp:] = envelope[:ramp][::-1]
+    tones = {beep_type: (0.5 * envelope * np.sin(2 * np.pi * frequency * t)).astype(np.float32)
+             for beep_type, frequency in BEEP_FREQUENCIES.items()}
+
+    for event in timeline.beeps:
+        if event.played:
+            onset = int(round(event.frame / timeline.frame_rate * fs))
+            track[onset:onset + len(t)] += tones[event.beep_type]
+
+    if recording is not None:
+        onset = int(round(timeline.item_frames[0] / timeline.frame_rate * fs))
+        samples = np.asarray(recording, dtype=np.float32).reshape(len(recording), -1)[:, 0]
+        samples = samples[:len(track) - onset]
+        track[onset:onset + len(samples)] += samples
+
+    return track
+
+
+def verify_results(results_path, workers=None):
+    """
+    Verify all dual task sessions below a results directory in parallel and print a report.
+
+    Args:
+        results_path (str): The results directory.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+
+    Returns:
+        bool: True if all replayed sessions match their logs.
+    """
+    sessions = find_sessions(results_path)
+    start = time.perf_counter()
+    all_ok = True
+    n_trials = 0
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for main_csv, trials, mismatches in executor.map(verify_session, sessions):
+            n_trials += trials
+            status = 'OK' if not mismatches else '{} MISMATCHES'.format(len(mismatches))
+            print('{}: {} trials replayed - {}'.format(main_csv, trials, status))
+            for mismatch in mismatches:
+                print('    ' + mismatch)
+            all_ok = all_ok and not mismatches
+    elapsed = time.perf_counter() - start
+    real_time = n_trials * TRIAL_MS / 1000.0
+    print('{} sessions, {} trials in {:.2f} s ({:.0f}x faster than real time)'.format(
+        len(sessions), n_trials, elapsed, real_time / elapsed if elapsed > 0 else float('inf')))
+    return all_ok
+
+
+def main():
+    """Command line interface of the replay engine."""
+    parser = argparse.ArgumentParser(description='Headless replay of completed dual task sessions.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    verify_parser = commands.add_parser('verify', help='replay all sessions and compare with the logged fields')
+    verify_parser.add_argument('results', help='results directory, e.g. results/ or results/<subject>')
+    verify_parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+
+    render_parser = commands.add_parser('render', help='render the audio track of one trial')
+    render_parser.add_argument('main_csv', help='main CSV file of the dual task')
+    render_parser.add_argument('--trial', required=True, help="main trial number as logged, e.g. '03'")
+    render_parser.add_argument('--out', required=True, help='output WAV file')
+    render_parser.add_argument('--fs', type=int, default=48000, help='sample rate of the rendered track')
+    render_parser.add_argument('--frame-rate', type=float, default=None,
+                               help='frame rate for sessions that did not log it (default 60)')
+    render_parser.add_argument('--recordings', default=None,
+                               help="recordings directory, e.g. recordings/ - mixes the participant's recording in "
+                                    '(from the session container if there is no file)')
+    render_parser.add_argument('--timeline', default=None, help='also write the frame-by-frame timeline to this CSV')
+
+    args = parser.parse_args()
+
+    if args.command == 'verify':
+        raise SystemExit(0 if verify_results(args.results, args.workers) else 1)
+
+    rows = read_csv_rows(args.main_csv)
+    timelines = replay_task(rows, args.frame_rate)
+    timeline = next((t for t in timelines if t.main_trial == args.trial), None)
+    if timeline is None:
+        raise SystemExit("Trial '{}' not found in {}".format(args.trial, args.main_csv))
+
+    recording = None
+    if args.recordings is not None:
+        row = next(row for row in rows if row['main_trial'] == args.trial)
+        recording = load_source(recording_source(args.main_csv, row, args.recordings))[0]
+    write(args.out, args.fs, render_trial_audio(timeline, args.fs, recording))
+
+    if args.timeline is not None:
+        frames = frame_timeline(timeline)
+        with open(args.timeline, 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(list(frames))
+            writer.writerows(zip(*frames.values()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,190 @@
+"""
+Random number streams of an experiment session.
+All randomness of the experiment (stimulus order, item onsets, dot direction and timing, beep types and the
+number options of the beep count response) is drawn from independent numpy Generators, one per task and subsystem.
+They are derived from a single session seed, so a session can be reproduced from the seed stored with the results.
+The item onsets and dot timings of the dual tasks keep using the fixed task seeds, so they are the same for
+every participant as before.
+"""
+
+# Import necessary libraries
+import json
+import os
+import zlib
+import numpy as np
+from dualtask_schedule import BEEP_SLOT_FRAMES, FIRST_ITEM_ONSET, LAST_ITEM_ONSET
+
+
+# The subsystems that draw random numbers - each gets its own stream per task
+STREAMS = ('ordering', 'offsets', 'dots', 'beeps', 'numbers')
+
+# Fixed seeds of the dual tasks - the streams in FIXED_STREAMS are the same for every participant
+TASK_SEEDS = {
+    'practice_beep_count_dots': 424,
+    'test_beep_count_dots': 6667,
+}
+FIXED_STREAMS = ('offsets', 'dots')
+
+
+def new_session_seed():
+    """
+    Draw a fresh session seed from the operating system's entropy source.
+
+    Returns:
+        int: A 32-bit session seed.
+    """
+    return int(np.random.SeedSequence().entropy % 2 ** 32)
+
+
+def task_key(task_name):
+    """
+    Map a task name to a stable integer, used to derive the seeds of the task's streams.
+
+    Args:
+        task_name (str): The name of the task, e.g. 'test_beep_count_dots'.
+
+    Returns:
+        int: The CRC32 checksum of the task name.
+    """
+    return zlib.crc32(task_name.encode('utf-8'))
+
+
+class SessionRNG:
+    """
+    Manages the random number streams of one session.
+
+    Each (task, subsystem) pair gets an independent numpy Generator. Its seed is derived from the session seed,
+    the task name and the subsystem, so it does not depend on the order in which streams are used.
+
+    Attributes:
+        session_seed (int): The seed all streams are derived from.
+    """
+
+    def __init__(self, session_seed):
+        self.session_seed = int(session_seed)
+        self._streams = {}
+
+    def stream_seed(self, task_name, stream):
+        """
+        Return the seed entropy of a stream.
+
+        Args:
+            task_name (str): The name of the task ('single' and 'dual_beep_count_dots' for the stimulus order).
+            stream (str): One of STREAMS.
+
+        Returns:
+            list: The integers the stream's numpy SeedSequence is created from.
+        """
+        if stream not in STREAMS:
+            raise ValueError("Unknown random stream '{}'. Use one of: {}".format(stream, ', '.join(STREAMS)))
+        if stream in FIXED_STREAMS and task_name in TASK_SEEDS:
+            return [TASK_SEEDS[task_name], STREAMS.index(stream)]
+        return [self.session_seed, task_key(task_name), STREAMS.index(stream)]
+
+    def stream(self, task_name, stream):
+        """
+        Return the Generator of a stream, creating it on first use.
+
+        Args:
+            task_name (str): The name of the task.
+            stream (str): One of STREAMS.
+
+        Returns:
+            numpy.random.Generator: The generator of the stream.
+        """
+        key = (task_name, stream)
+        if key not in self._streams:
+            self._streams[key] = np.random.default_rng(np.random.SeedSequence(self.stream_seed(task_name, stream)))
+        return self._streams[key]
+
+    def draw_item_onsets(self, task_name, n_trials):
+        """
+        Draw the first frame of the item presentation of all trials (reference frames 300 to 601).
+
+        Args:
+            task_name (str): The name of the dual task.
+            n_trials (int): The number of trials of the task.
+
+        Returns:
+            numpy.ndarray: One onset per trial.
+        """
+        return self.stream(task_name, 'offsets').integers(FIRST_ITEM_ONSET, LAST_ITEM_ONSET + 1, size=n_trials)
+
+    def draw_dot_parameters(self, task_name, n_trials):
+        """
+        Draw the dot movement of all trials.
+
+        Args:
+            task_name (str): The name of the dual task.
+            n_trials (int): The number of trials of the task.
+
+        Returns:
+            dict: 'movement_index' - index of the dot movement direction (0 to 3) and 'dot_delay' - reference
+            frames between the item onset and the dot onset (15 to 50), one per trial.
+        """
+        dots = self.stream(task_name, 'dots').integers([0, 15], [4, 51], size=(n_trials, 2))
+        return {'movement_index': dots[:, 0], 'dot_delay': dots[:, 1]}
+
+    def draw_beep_draws(self, task_name, n_trials):
+        """
+        Draw the uniform numbers deciding the type of every beep slot of all trials.
+
+        Args:
+            task_name (str): The name of the dual task.
+            n_trials (int): The number of trials of the task.
+
+        Returns:
+            numpy.ndarray: Shape (n_trials, number of beep slots).
+        """
+        return self.stream(task_name, 'beeps').random((n_trials, len(BEEP_SLOT_FRAMES)))
+
+    def draw_beep_count_dots_parameters(self, task_name, n_trials):
+        """
+        Draw the random parameters of all trials of a beep count and dots task in one batch per stream.
+
+        Every stream is independent, so the parameters are the same as when the task components draw their own
+        parts (draw_item_onsets, draw_dot_parameters, draw_beep_draws).
+
+        Args:
+            task_name (str): The name of the dual task.
+            n_trials (int): The number of trials of the task.
+
+        Returns:
+            dict: Arrays with one entry (or row) per trial:
+                'start_offset' - first frame of the item presentation (300 to 601),
+                'movement_index' - index of the dot movement direction (0 to 3),
+                'dot_delay' - frames between the item onset and the dot onset (15 to 50),
+                'beep_draws' - uniform numbers deciding the type of every beep slot.
+        """
+        return dict(start_offset=self.draw_item_onsets(task_name, n_trials),
+                    beep_draws=self.draw_beep_draws(task_name, n_trials),
+                    **self.draw_dot_parameters(task_name, n_trials))
+
+    def seed_record(self, task_names):
+        """
+        Collect the session seed and the seeds of all streams of the given tasks.
+
+        Args:
+            task_names (list): The tasks of the session.
+
+        Returns:
+            dict: The session seed and a mapping task -> stream -> seed entropy.
+        """
+        return {
+            'session_seed': self.session_seed,
+            'streams': {task: {stream: self.stream_seed(task, stream) for stream in STREAMS} for task in task_names},
+        }
+
+    def save_seed_record(self, path, task_names):
+        """
+        Write the seed record of the session as JSON file next to the results.
+
+        Args:
+            path (str): The path of the JSON file.
+            task_names (list): The tasks of the session.
+        """
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        with open(path, 'w') as file:
+            json.dump(self.seed_record(task_names), file, indent=2)
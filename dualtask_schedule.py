@@ -0,0 +1,346 @@
+"""
+Timing and trial logic of the dual task that does not depend on psychopy.
+The frame loop of the dual task (dualtask_task_setup.py) and the headless tools (e.g. dualtask_replay.py)
+use the same functions, so a replayed trial follows exactly the same rules as the trial the participant saw.
+
+The trial timeline is defined in milliseconds. It was designed as frame counts on a 60 Hz display, so the frame
+constants below are reference frames at 60 Hz. At runtime, FrameGrid maps the timeline to the frame grid of the
+measured refresh rate and FrameClock derives the frame index from the flip times, so dropped frames do not delay
+the following events.
+"""
+
+# Import necessary libraries
+from collections import namedtuple
+import numpy as np
+
+
+# Frame layout of a beep count and dots trial in reference frames at 60 Hz
+REFERENCE_FRAME_RATE = 60.0
+TRIAL_FRAMES = 1200  # frames of the whole trial loop
+ITEM_FRAMES = 350  # frames the item is shown (before adaptation by the voice activity detection)
+DOT_FRAMES = 250  # frames the dots are shown
+BEEP_INTERVAL = 35  # a beep may be played every 35 frames ...
+FIRST_BEEP_FRAME = 49  # ... from this frame on
+FIRST_ITEM_ONSET = 300  # the item presentation starts between these frames (5 to 10 s into the trial)
+LAST_ITEM_ONSET = 601
+BEEP_BLACKOUT = 10  # no beeps are played from 10 frames before the item onset until 10 frames after its end
+BEEP_SLOT_FRAMES = tuple(frame for frame in range(TRIAL_FRAMES)
+                         if frame % BEEP_INTERVAL == 0 and frame >= FIRST_BEEP_FRAME)
+
+
+def reference_ms(reference_frames):
+    """
+    Convert reference frames (at 60 Hz) to milliseconds.
+
+    Parameters:
+    reference_frames : int or float
+        Number of frames at the reference frame rate.
+
+    Returns:
+    float
+        The duration in milliseconds.
+    """
+    return reference_frames * 1000.0 / REFERENCE_FRAME_RATE
+
+
+# The same timeline in milliseconds
+TRIAL_MS = reference_ms(TRIAL_FRAMES)  # 20 s
+ITEM_MS = reference_ms(ITEM_FRAMES)  # 5.83 s
+DOT_MS = reference_ms(DOT_FRAMES)  # 4.17 s
+BEEP_BLACKOUT_MS = reference_ms(BEEP_BLACKOUT)  # 167 ms
+# the longest extension of the item presentation that still ends within the trial after the latest onset
+MAX_ITEM_EXTENSION_MS = TRIAL_MS - ITEM_MS - reference_ms(LAST_ITEM_ONSET)  # 4.15 s
+
+# Movement directions of the dots (degrees) and the corresponding arrow keys
+MOVEMENT_DIRECTIONS = [0, 90, 180, 270]
+RESPONSE_KEYS = ['right', 'up', 'left', 'down']
+
+# Tones of the beeps - psychopy's notes 'C' and 'A' in octave 5
+BEEP_DURATION = 0.2  # seconds
+BEEP_NOTES = {'normal': 'C', 'deviant': 'A'}
+BEEP_FREQUENCIES = {'normal': 523.25, 'deviant': 880.0}
+
+# Reactions to the beeps of the beep press task - a press counts for a beep from 100 ms to 1.2 s after its onset
+BEEP_PRESS_KEYS = ['space']
+BEEP_PRESS_MIN_RT = 0.1  # seconds - earlier presses are not reactions to the beep
+BEEP_PRESS_MAX_RT = 1.2  # seconds
+
+# A beep slot of a trial: its frame, the beep type and whether it was played (outside the blackout)
+BeepEvent = namedtuple('BeepEvent', ['frame', 'beep_type', 'played'])
+# The reaction to a played beep: 'hit' or 'miss' for a deviant, 'false_alarm' or 'none' for a normal beep, and the
+# reaction time in seconds (None without a press)
+BeepResponse = namedtuple('BeepResponse', ['response_type', 'rt'])
+
+
+def next_beep_type(beep_counter, deviants_so_far, beep_draw):
+    """
+    Decide the type of the beep of the next slot.
+
+    The first 3 beeps are normal. Afterwards at least 3 deviants are enforced towards the end of the sequence,
+    otherwise a beep is deviant with a probability of at most 0.5, lowered once 3 deviants were played.
+
+    Parameters:
+    beep_counter : int
+        Number of beeps played so far in the trial.
+    deviants_so_far : int
+        Number of deviant beeps played so far in the trial.
+    beep_draw : float
+        Uniform random number in [0, 1) drawn for this slot.
+
+    Returns:
+    beep_type : str
+        'normal' or 'deviant'.
+    """
+    # If the first 3 beeps have not yet been generated, they should be normal
+    if beep_counter < 3:
+        return 'normal'
+
+    # Ensure that there are at least 3 deviants in the sequence
+    remaining_beeps = 22 - beep_counter  # assuming you have 23 beeps in total
+    if deviants_so_far < 3 and remaining_beeps <= (3 - deviants_so_far):
+        return 'deviant'
+
+    # Calculate the probability of generating a deviant beep
+    if deviants_so_far >= 3:
+        deviant_prob = min(0.5, deviants_so_far / (beep_counter - 3))
+    else:
+        deviant_prob = 0.5
+
+    return 'deviant' if beep_draw < deviant_prob else 'normal'
+
+
+def in_beep_blackout(frame, start_offset, end_offset, blackout=BEEP_BLACKOUT):
+    """
+    Check whether a frame lies in the pause of the beeps around the item presentation.
+
+    Parameters:
+    frame : int
+        The frame to check.
+    start_offset : int
+        First frame of the item presentation.
+    end_offset : int
+        Frame after the last frame of the item presentation.
+    blackout : int, optional
+        Frames of the pause before and after the item presentation (default: 10 reference frames).
+
+    Returns:
+    bool
+        True if no beep is played in this frame.
+    """
+    return start_offset - blackout <= frame < end_offset + blackout
+
+
+def beep_schedule(start_offset, end_offset, beep_draws, frame_grid=None):
+    """
+    Reconstruct the beeps of a trial from its item presentation and its beep draws.
+
+    Since the item presentation can only change while it is shown, its final end gives the same blackout for every
+    beep slot as during the trial.
+
+    Parameters:
+    start_offset : int
+        First frame of the item presentation.
+    end_offset : int
+        Frame after the last frame of the item presentation.
+    beep_draws : sequence of float
+        The uniform random numbers of the beep slots.
+    frame_grid : FrameGrid, optional
+        The frame grid of the trial. Defaults to the reference grid at 60 Hz.
+
+    Returns:
+    events : list of BeepEvent
+        One event per beep slot.
+    """
+    if frame_grid is None:
+        frame_grid = FrameGrid(REFERENCE_FRAME_RATE)
+    events = []
+    beep_counter = 0
+    deviants_so_far = 0
+    for frame, beep_draw in zip(frame_grid.beep_slot_frames, beep_draws):
+        beep_type = next_beep_type(beep_counter, deviants_so_far, beep_draw)
+        played = not in_beep_blackout(frame, start_offset, end_offset, frame_grid.beep_blackout)
+        if played:
+            beep_counter += 1
+            deviants_so_far += beep_type == 'deviant'
+        events.append(BeepEvent(frame, beep_type, played))
+    return events
+
+
+def score_beep_presses(beep_onsets, beep_types, press_times, min_rt=BEEP_PRESS_MIN_RT, max_rt=BEEP_PRESS_MAX_RT):
+    """
+    Match the key presses of a beep press trial to the beeps.
+
+    A press can belong to every beep that started min_rt to max_rt seconds before it. The presses are taken in
+    order: a press goes to the earliest deviant among these beeps that has no hit yet (so a slow reaction to a
+    deviant still counts after the next beep has started), otherwise to the latest of these beeps as a false alarm
+    if it is a normal beep without a press. Presses that belong to no beep, or only to beeps that already have a
+    press, are unmatched.
+
+    Parameters:
+    beep_onsets : sequence of float
+        The onset times of the played beeps in seconds, in the order they were played.
+    beep_types : sequence of str
+        'normal' or 'deviant' for every played beep.
+    press_times : sequence of float
+        The times of the key presses in seconds, on the clock of the beep onsets.
+    min_rt : float, optional
+        Shortest reaction time in seconds (default: 0.1).
+    max_rt : float, optional
+        Longest reaction time in seconds (default: 1.2).
+
+    Returns:
+    responses : list of BeepResponse
+        The reaction to every played beep.
+    unmatched : list of float
+        The times of the presses that belong to no beep.
+    """
+    onsets = np.asarray(beep_onsets, dtype=float)
+    presses = np.sort(np.asarray(press_times, dtype=float))
+    # the beeps a press can belong to are the range first[i]:last[i] of the beeps
+    first = np.searchsorted(onsets, presses - max_rt, side='left')
+    last = np.searchsorted(onsets, presses - min_rt, side='right')
+    responses = [None] * len(onsets)
+    unmatched = []
+    for press, start, stop in zip(presses.tolist(), first.tolist(), last.tolist()):
+        deviants = [index for index in range(start, stop)
+                    if beep_types[index] == 'deviant' and responses[index] is None]
+        if deviants:
+            responses[deviants[0]] = BeepResponse('hit', float(press - onsets[deviants[0]]))
+        elif stop > start and beep_types[stop - 1] == 'normal' and responses[stop - 1] is None:
+            responses[stop - 1] = BeepResponse('false_alarm', float(press - onsets[stop - 1]))
+        else:
+            unmatched.append(press)
+    responses = [response if response is not None else
+                 BeepResponse('miss' if beep_type == 'deviant' else 'none', None)
+                 for response, beep_type in zip(responses, beep_types)]
+    return responses, unmatched
+
+
+class FrameGrid:
+    """
+    The trial timeline mapped to the frame grid of a display.
+
+    Attributes:
+        frame_rate (float): The refresh rate of the display in Hz.
+        trial_frames (int): Frames of the whole dual task trial loop.
+        item_frames (int): Frames the item is shown (before adaptation by the voice activity detection).
+        dot_frames (int): Frames the dots are shown.
+        beep_blackout (int): Frames without beeps before and after the item presentation.
+        beep_slot_frames (tuple): Frames at which a beep may be played.
+    """
+
+    def __init__(self, frame_rate):
+        self.frame_rate = float(frame_rate)
+        self.trial_frames = self.frames(TRIAL_MS)
+        self.item_frames = self.frames(ITEM_MS)
+        self.dot_frames = self.frames(DOT_MS)
+        self.beep_blackout = self.frames(BEEP_BLACKOUT_MS)
+        self.beep_slot_frames = tuple(self.from_reference(frame) for frame in BEEP_SLOT_FRAMES)
+
+    def frames(self, ms):
+        """Return the number of frames closest to a duration in milliseconds."""
+        return int(round(ms * self.frame_rate / 1000.0))
+
+    def from_reference(self, reference_frames):
+        """Map a number of reference frames (at 60 Hz) to frames of this grid."""
+        return self.frames(reference_ms(reference_frames))
+
+
+class FrameClock:
+    """
+    Derives the index of the next frame from the flip times.
+
+    Normally every flip advances the schedule by one frame. If frames were dropped, the clock skips the frames
+    that were not shown, so the events of the timeline stay on time instead of drifting later.
+
+    Attributes:
+        frame (int): The index of the frame to draw next.
+        dropped (int): Number of frames skipped because of late flips.
+    """
+
+    def __init__(self, frame_rate):
+        self.frame_rate = float(frame_rate)
+        self.frame = 0
+        self.dropped = 0
+        self._t0 = None
+
+    def next_frame(self, flip_time):
+        """
+        Advance the clock after a flip.
+
+        Parameters:
+        flip_time : float or None
+            The time stamp returned by window.flip(). If None, the clock advances by one frame.
+
+        Returns:
+        frame : int
+            The index of the frame to draw next.
+        """
+        if flip_time is None:
+            self.frame += 1
+            return self.frame
+        if self._t0 is None:
+            # time stamp of the first frame of the schedule
+            self._t0 = flip_time - self.frame / self.frame_rate
+        expected = int(round((flip_time - self._t0) * self.frame_rate)) + 1
+        if expected > self.frame + 1:
+            self.dropped += expected - self.frame - 1
+        self.frame = max(self.frame + 1, expected)
+        return self.frame
+
+
+def number_option_range(given_number):
+    """
+    Return the range the other three number options are drawn from: two below to two above a number under 10,
+    otherwise the tens of the number (e.g. 130 to 139 for 134).
+
+    Parameters:
+    given_number : int
+        The number to be recognized.
+
+    Returns:
+    range_start, range_end : int
+        First and last number of the range (including the given number).
+    """
+    if given_number < 10:
+        return given_number - 2, given_number + 2
+    num_str = str(given_number)
+    return int(num_str[:-1] + '0'), int(num_str[:-1] + '9')
+
+
+def select_and_replace_number(given_number, rng):
+    """
+    Based on the given number, this function generates three random numbers that are within the
+    same tens or ones range. It then combines these numbers with the given number,
+    and randomly shuffles them to produce a list of four numbers.
+
+    Parameters:
+    given_number : int
+        The base number based on which three other numbers are generated.
+    rng : numpy.random.Generator
+        The random number stream for the number options.
+
+    Returns:
+    numbers : list of int
+        List of four numbers where one of the numbers is the given_number.
+    replace_index : int
+        The index at which the given_number is placed in the list.
+    """
+
+    # Check the range of the given_number
+    range_start, range_end = number_option_range(given_number)
+
+    # Create a list of all numbers in the range except the given_number
+    range_without_given = [i for i in range(range_start, range_end + 1) if i != given_number]
+
+    # Randomly select 3 numbers from this list
+    numbers = [int(number) for number in rng.choice(range_without_given, 3, replace=False)]
+
+    # Add the given_number to the list and shuffle
+    numbers.append(given_number)
+    numbers = [numbers[i] for i in rng.permutation(4)]
+
+    # Get the index of the given_number
+    replace_index = numbers.index(given_number)
+
+    return numbers, replace_index
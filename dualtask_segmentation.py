@@ -0,0 +1,257 @@
+"""
+Pause and boundary segmentation of the recordings.
+The prosodic boundary in a name sequence - after name 1 in "(Lotte und Laura) und Lisa" versus after name 2 - is
+marked among others by a pause. This module finds the speech and pause intervals of every recording with an
+energy-based segmenter (vectorized over all frames, see dualtask_prosody.speech_intervals), writes them as Praat
+TextGrid files and collects all pauses of a study in one table.
+
+The recordings are processed in parallel; WAV files are memory-mapped, FLAC files are read with soundfile and
+the recordings of session containers are read from the container. With new thresholds a whole study is
+re-segmented in one command.
+
+Usage:
+    python dualtask_segmentation.py recordings/ [--threshold-db -45] [--min-pause 0.1] [--out pauses.csv]
+        Segments all recordings below recordings/ (or recordings/<subject>/), writes <recording>.TextGrid next to
+        every recording (or into --textgrids) and the pause table.
+    python dualtask_segmentation.py results/
+        Segments the recordings of all session containers below results/; the TextGrids are written next to the
+        container.
+"""
+
+# Import necessary libraries
+import argparse
+import glob
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas
+from dualtask_container import container_sources, describe_source, load_source
+from dualtask_prosody import frame_signal, intensity_contour, speech_intervals
+
+
+# Default segmentation settings
+FRAME_SECONDS = 0.025
+HOP_SECONDS = 0.005
+THRESHOLD_DB = -45.0  # frames from this intensity (dBFS) on count as speech
+MIN_PAUSE = 0.1  # shorter silences (e.g. stop closures) do not count as pauses
+MIN_SPEECH = 0.05  # shorter sounds (e.g. clicks) do not count as speech
+
+# Labels of the intervals in the TextGrid
+SPEECH_LABEL = 'speech'
+PAUSE_LABEL = 'pause'
+
+# File names written by the trial functions: dualtask_<subject>_<task>_<trial>_<stimulus ID>.<ext>
+RECORDING_NAME = re.compile(r'^dualtask_(?P<subject>.+?)_(?P<task>(?:practice|test)_[a-z_]+?)_(?P<main_trial>\d{2})_'
+                            r'(?P<stimulus_id>.+)$')
+
+
+def parse_recording_name(path):
+    """
+    Split the file name of a recording into subject, task, trial and stimulus ID.
+
+    Args:
+        path (str): Path of the recording.
+
+    Returns:
+        dict: 'subject', 'task', 'main_trial' and 'stimulus_id' (empty strings if the name does not match).
+    """
+    name = os.path.splitext(os.path.basename(path))[0]
+    match = RECORDING_NAME.match(name)
+    if match is None:
+        return {'subject': '', 'task': '', 'main_trial': '', 'stimulus_id': ''}
+    return match.groupdict()
+
+
+def segment_recording(samples, fs, threshold_db=THRESHOLD_DB, min_pause=MIN_PAUSE, min_speech=MIN_SPEECH):
+    """
+    Split a recording into speech and pause intervals.
+
+    Args:
+        samples (numpy.ndarray): The mono recording.
+        fs (int): Its sample rate.
+        threshold_db (float, optional): Intensity from which a frame counts as speech.
+        min_pause (float, optional): Shortest silence (seconds) between speech that counts as pause.
+        min_speech (float, optional): Shortest sound (seconds) that counts as speech.
+
+    Returns:
+        numpy.ndarray: Start and end time (seconds) of every speech segment, shape (n_segments, 2).
+    """
+    frames = frame_signal(samples, int(FRAME_SECONDS * fs), int(HOP_SECONDS * fs))
+    intensity = intensity_contour(frames)
+    segments = speech_intervals(intensity, HOP_SECONDS, threshold_db, min_pause, min_speech)
+    # the intensity of a frame belongs to its centre
+    return np.clip(segments + FRAME_SECONDS / 2, 0, len(samples) / fs)
+
+
+def interval_tier(segments, duration):
+    """
+    Fill the time of a recording with labelled intervals.
+
+    Args:
+        segments (numpy.ndarray): The speech segments (start, end) in seconds.
+        duration (float): The duration of the recording.
+
+    Returns:
+        list: (start, end, label) of consecutive intervals from 0 to duration - speech segments are labelled
+        'speech', the silences between them 'pause' and the silence before and after the speech ''.
+    """
+    intervals = []
+    position = 0.0
+    for index, (start, end) in enumerate(segments):
+        if start > position:
+            intervals.append((position, start, PAUSE_LABEL if index else ''))
+        intervals.append((start, end, SPEECH_LABEL))
+        position = end
+    if position < duration:
+        intervals.append((position, duration, ''))
+    return intervals
+
+
+def write_textgrid(path, intervals, duration, tier_name='speech'):
+    """
+    Write an interval tier as Praat TextGrid (long text format).
+
+    Args:
+        path (str): The TextGrid file.
+        intervals (list): (start, end, label) of consecutive intervals.
+        duration (float): The duration of the recording.
+        tier_name (str, optional): The name of the tier. Defaults to 'speech'.
+    """
+    lines = [
+        'File type = "ooTextFile"', 'Object class = "TextGrid"', '',
+        'xmin = 0', 'xmax = {:.4f}'.format(duration), 'tiers? <exists>', 'size = 1', 'item []:',
+        '    item [1]:', '        class = "IntervalTier"', '        name = "{}"'.format(tier_name),
+        '        xmin = 0', '        xmax = {:.4f}'.format(duration),
+        '        intervals: size = {}'.format(len(intervals)),
+    ]
+    for number, (start, end, label) in enumerate(intervals, 1):
+        lines += [
+            '        intervals [{}]:'.format(number),
+            '            xmin = {:.4f}'.format(start),
+            '            xmax = {:.4f}'.format(end),
+            '            text = "{}"'.format(label.replace('"', '""')),
+        ]
+    with open(path, 'w', encoding='utf-8') as file:
+        file.write('\n'.join(lines) + '\n')
+
+
+def segment_file(job):
+    """
+    Segment one recording and write its TextGrid (runs in a worker process).
+
+    Args:
+        job (tuple): The source of the recording - (path of the file, None) or (path of the session container,
+            name of the recording) -, TextGrid directory (None: next to the recording), threshold in dBFS, minimum
+            pause and minimum speech in seconds.
+
+    Returns:
+        tuple: The source and its pause rows (None if the recording could not be read).
+    """
+    source, textgrid_path, threshold_db, min_pause, min_speech = job
+    try:
+        samples, fs = load_source(source, mmap=True)
+    except (OSError, RuntimeError, ValueError, KeyError):
+        return source, None
+    duration = len(samples) / fs
+    segments = segment_recording(samples, fs, threshold_db, min_pause, min_speech)
+    intervals = interval_tier(segments, duration)
+
+    path, name = source
+    if name is not None:
+        # recordings of a container get their TextGrid next to the container
+        path = os.path.join(os.path.dirname(path), name)
+    textgrid = os.path.splitext(path)[0] + '.TextGrid'
+    if textgrid_path:
+        textgrid = os.path.join(textgrid_path, os.path.basename(textgrid))
+    write_textgrid(textgrid, intervals, duration)
+
+    recording = dict(parse_recording_name(path), recording=os.path.basename(path))
+    pauses = segments[1:, 0] - segments[:-1, 1]
+    longest = int(np.argmax(pauses)) if len(pauses) else -1
+    rows = [dict(recording, pause=index + 1, after_segment=index + 1, n_segments=len(segments),
+                 start=round(float(segments[index, 1]), 4), end=round(float(segments[index + 1, 0]), 4),
+                 duration=round(float(pauses[index]), 4), longest=index == longest)
+            for index in range(len(pauses))]
+    if not rows:
+        # keep recordings without pauses in the table
+        rows = [dict(recording, pause=0, after_segment=0, n_segments=len(segments), start=np.nan, end=np.nan,
+                     duration=0.0, longest=False)]
+    return source, rows
+
+
+def find_recordings(recordings_path):
+    """Return the sources of all WAV and FLAC recordings and session container recordings below a directory."""
+    paths = []
+    for extension in ('wav', 'flac'):
+        paths += glob.glob(os.path.join(recordings_path, '**', '*.' + extension), recursive=True)
+    return [(path, None) for path in sorted(paths)] + container_sources(recordings_path)
+
+
+def segment_recordings(recordings_path, textgrid_path=None, threshold_db=THRESHOLD_DB, min_pause=MIN_PAUSE,
+                       min_speech=MIN_SPEECH, conditions_file=None, workers=None):
+    """
+    Segment all recordings below a directory in parallel.
+
+    Args:
+        recordings_path (str): The recordings directory (or the directory of a single subject) - or the results
+            directory for the recordings of the session containers.
+        textgrid_path (str, optional): Directory for the TextGrid files. None writes them next to the recordings.
+        threshold_db (float, optional): Intensity from which a frame counts as speech.
+        min_pause (float, optional): Shortest silence (seconds) between speech that counts as pause.
+        min_speech (float, optional): Shortest sound (seconds) that counts as speech.
+        conditions_file (str, optional): Path of conditions.xlsx - adds the condition of every stimulus ID.
+        workers (int, optional): Number of worker processes.
+
+    Returns:
+        pandas.DataFrame: One row per pause (and one row for each recording without pauses).
+    """
+    if textgrid_path:
+        os.makedirs(textgrid_path, exist_ok=True)
+    sources = find_recordings(recordings_path)
+    start = time.perf_counter()
+    rows = []
+    jobs = [(source, textgrid_path, threshold_db, min_pause, min_speech) for source in sources]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for source, pauses in executor.map(segment_file, jobs, chunksize=8):
+            if pauses is None:
+                print('Could not read ' + describe_source(source))
+                continue
+            rows += pauses
+    print('{} recordings segmented in {:.1f} s'.format(len(sources), time.perf_counter() - start))
+
+    table = pandas.DataFrame(rows)
+    if conditions_file and not table.empty:
+        conditions = pandas.read_excel(conditions_file)[['ID', 'condition']].drop_duplicates('ID')
+        table = table.merge(conditions.rename(columns={'ID': 'stimulus_id'}), on='stimulus_id', how='left')
+    return table
+
+
+def main():
+    """Command line interface of the segmentation."""
+    parser = argparse.ArgumentParser(description='Pause segmentation of the recordings with TextGrid export.')
+    parser.add_argument('recordings', help='recordings directory, e.g. recordings/ or recordings/<subject> - or '
+                                           'results/ for the recordings of the session containers')
+    parser.add_argument('--threshold-db', type=float, default=THRESHOLD_DB,
+                        help='intensity (dBFS) from which a frame counts as speech')
+    parser.add_argument('--min-pause', type=float, default=MIN_PAUSE,
+                        help='shortest silence (s) between speech that counts as pause')
+    parser.add_argument('--min-speech', type=float, default=MIN_SPEECH,
+                        help='shortest sound (s) that counts as speech')
+    parser.add_argument('--textgrids', default=None,
+                        help='directory for the TextGrid files (default: next to the recordings)')
+    parser.add_argument('--conditions', default=os.path.join('stimuli', 'conditions.xlsx'),
+                        help="stimulus list with the condition of every stimulus ID ('' to skip)")
+    parser.add_argument('--out', default='pauses.csv', help='output CSV file of the pause table')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    table = segment_recordings(args.recordings, args.textgrids, args.threshold_db, args.min_pause,
+                               args.min_speech, args.conditions or None, args.workers)
+    table.to_csv(args.out, index=False)
+    print('Pause table written to ' + args.out)
+
+
+if __name__ == '__main__':
+    main()
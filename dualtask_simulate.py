@@ -0,0 +1,338 @@
+"""
+Monte Carlo simulation of the dual task design.
+Before participants are run, the simulator draws many trials of the beep count and dots task and many stimulus
+orders with the same rules as the experiment - without psychopy, window or sound - and reports the design
+statistics with their tails:
+    - beeps played and deviant beeps per trial, and how often the minimum of 3 deviants had to be forced
+    - beep slots that fall in the blackout around the item presentation (beeps that are not played)
+    - the number options of the beep count and number responses: options below 1, counts of 10 or more (options
+      from the tens of the count) and how often the correct number is the smallest or largest option
+    - the attempts of the randomization in load_and_randomize until the run-length constraints hold, and the
+      time they take
+
+The trials are simulated in chunks across a process pool; within a chunk all trials are processed at once with
+numpy, slot by slot. The chunks only return histograms, which are merged for the report. The vectorized beep logic
+is checked against beep_schedule (the function the replay uses) before the simulation starts.
+
+Usage:
+    python dualtask_simulate.py [--trials 1000000] [--frame-rate 60] [--seed 1234] [--workers 8]
+"""
+
+# Import necessary libraries
+import argparse
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from math import comb
+import numpy as np
+import pandas
+from dualtask_lists import split_stimuli, satisfies_run_constraints
+from dualtask_rng import new_session_seed
+from dualtask_schedule import beep_schedule, number_option_range, FrameGrid, FIRST_ITEM_ONSET, LAST_ITEM_ONSET
+
+
+# Trials simulated per job of the process pool
+CHUNK_TRIALS = 50000
+# Percentiles of the tail reported for every statistic
+PERCENTILES = (50, 95, 99, 99.9)
+
+
+def simulate_beeps(item_start, item_end, beep_draws, frame_grid):
+    """
+    Decide the beeps of many trials at once with the rules of next_beep_type and in_beep_blackout.
+
+    Args:
+        item_start (numpy.ndarray): First frame of the item presentation of every trial.
+        item_end (numpy.ndarray): Frame after the last frame of the item presentation of every trial.
+        beep_draws (numpy.ndarray): The uniform numbers of the beep slots, shape (n_trials, n_slots).
+        frame_grid (FrameGrid): The frame grid of the trials.
+
+    Returns:
+        tuple: Boolean arrays of shape (n_trials, n_slots) - the deviant beeps, the played slots and the slots in
+        which a deviant was forced to reach 3 deviants.
+    """
+    n_trials, n_slots = beep_draws.shape
+    deviant = np.zeros((n_trials, n_slots), dtype=bool)
+    played = np.zeros((n_trials, n_slots), dtype=bool)
+    forced = np.zeros((n_trials, n_slots), dtype=bool)
+    beep_counter = np.zeros(n_trials, dtype=int)
+    deviants_so_far = np.zeros(n_trials, dtype=int)
+    blackout = frame_grid.beep_blackout
+    for slot, frame in enumerate(frame_grid.beep_slot_frames):
+        # at least 3 deviants are enforced towards the end of the sequence (see next_beep_type)
+        forced[:, slot] = (beep_counter >= 3) & (deviants_so_far < 3) & \
+            (22 - beep_counter <= 3 - deviants_so_far)
+        deviant_prob = np.full(n_trials, 0.5)
+        lowered = deviants_so_far >= 3
+        deviant_prob[lowered] = np.minimum(0.5, deviants_so_far[lowered] / (beep_counter[lowered] - 3))
+        deviant[:, slot] = (beep_counter >= 3) & (forced[:, slot] | (beep_draws[:, slot] < deviant_prob))
+        played[:, slot] = ~((item_start - blackout <= frame) & (frame < item_end + blackout))
+        beep_counter += played[:, slot]
+        deviants_so_far += played[:, slot] & deviant[:, slot]
+    return deviant, played, forced & played
+
+
+def check_against_schedule(n_trials, frame_rate, seed):
+    """
+    Compare simulate_beeps with beep_schedule on random trials.
+
+    Args:
+        n_trials (int): The number of trials to compare.
+        frame_rate (float): The refresh rate of the simulated display.
+        seed (int): The seed of the trials.
+
+    Returns:
+        int: The number of trials in which the beeps differ.
+    """
+    frame_grid = FrameGrid(frame_rate)
+    item_start, item_end, beep_draws = draw_trials(np.random.default_rng(seed), n_trials, frame_grid)
+    deviant, played, _ = simulate_beeps(item_start, item_end, beep_draws, frame_grid)
+    mismatches = 0
+    for trial in range(n_trials):
+        events = beep_schedule(int(item_start[trial]), int(item_end[trial]), beep_draws[trial], frame_grid)
+        if [event.played for event in events] != played[trial].tolist() or \
+                [event.beep_type == 'deviant' for event in events] != deviant[trial].tolist():
+            mismatches += 1
+    return mismatches
+
+
+def draw_trials(rng, n_trials, frame_grid):
+    """
+    Draw the item presentation and the beep draws of trials as the dual task does (see SessionRNG).
+
+    The item end is the end without adaptation by the voice activity detection.
+
+    Args:
+        rng (numpy.random.Generator): The random numbers of the simulation.
+        n_trials (int): The number of trials.
+        frame_grid (FrameGrid): The frame grid of the trials.
+
+    Returns:
+        tuple: First frame and end of the item presentation and the beep draws of every trial.
+    """
+    reference_start = rng.integers(FIRST_ITEM_ONSET, LAST_ITEM_ONSET + 1, size=n_trials)
+    item_start = np.array([frame_grid.from_reference(int(frame))
+                           for frame in range(LAST_ITEM_ONSET + 1)])[reference_start]
+    item_end = item_start + frame_grid.item_frames
+    beep_draws = rng.random((n_trials, len(frame_grid.beep_slot_frames)))
+    return item_start, item_end, beep_draws
+
+
+def order_attempts(rng, n_sessions, conditions, names, batch=4096):
+    """
+    Count the attempts of the randomization of load_and_randomize until an order satisfies the constraints.
+
+    Every attempt is an independent random order, so a stream of attempts is drawn in batches and split at the
+    accepted orders.
+
+    Args:
+        rng (numpy.random.Generator): The random numbers of the simulation.
+        n_sessions (int): The number of simulated sessions.
+        conditions (numpy.ndarray): The condition of every test item.
+        names (numpy.ndarray): The first name of every test item.
+        batch (int, optional): Orders drawn at once.
+
+    Returns:
+        numpy.ndarray: The number of attempts of every session.
+    """
+    attempts = []
+    pending = 0
+    while len(attempts) < n_sessions:
+        orders = rng.permuted(np.tile(np.arange(len(conditions)), (batch, 1)), axis=1)
+        accepted = np.flatnonzero(satisfies_run_constraints(conditions[orders], names[orders]))
+        if len(accepted):
+            attempts.append(accepted[0] + 1 + pending)
+            attempts.extend(np.diff(accepted))
+            pending = batch - 1 - accepted[-1]
+        else:
+            pending += batch
+    return np.array(attempts[:n_sessions])
+
+
+def simulate_chunk(job):
+    """
+    Simulate one chunk of trials and sessions (runs in a worker process).
+
+    Args:
+        job (tuple): Seed entropy of the chunk, number of trials, number of sessions, frame rate, conditions and
+            first names of the test items.
+
+    Returns:
+        dict: Histograms (counts per value) of the statistics of the chunk.
+    """
+    entropy, n_trials, n_sessions, frame_rate, conditions, names = job
+    rng = np.random.default_rng(np.random.SeedSequence(entropy))
+    frame_grid = FrameGrid(frame_rate)
+    item_start, item_end, beep_draws = draw_trials(rng, n_trials, frame_grid)
+    deviant, played, forced = simulate_beeps(item_start, item_end, beep_draws, frame_grid)
+    return {
+        'played': np.bincount(played.sum(axis=1)),
+        'deviants': np.bincount((deviant & played).sum(axis=1)),
+        'blackout': np.bincount((~played).sum(axis=1)),
+        'forced': np.bincount(forced.sum(axis=1)),
+        'numbers': np.bincount(rng.integers(100, 1000, size=n_trials)),
+        'attempts': np.bincount(order_attempts(rng, n_sessions, conditions, names)),
+    }
+
+
+def merge_histograms(histograms):
+    """Add up histograms of different lengths."""
+    merged = np.zeros(max(len(histogram) for histogram in histograms), dtype=np.int64)
+    for histogram in histograms:
+        merged[:len(histogram)] += histogram
+    return merged
+
+
+def histogram_summary(histogram):
+    """
+    Summarize a histogram of integer values.
+
+    Args:
+        histogram (numpy.ndarray): The count of every value.
+
+    Returns:
+        dict: 'mean', 'min', 'max' and the PERCENTILES ('p50', 'p95', ...).
+    """
+    values = np.arange(len(histogram))
+    total = histogram.sum()
+    cumulative = np.cumsum(histogram) / total
+    summary = {'mean': float((values * histogram).sum() / total), 'min': int(values[histogram > 0][0]),
+               'max': int(values[histogram > 0][-1])}
+    for percentile in PERCENTILES:
+        summary['p{:g}'.format(percentile)] = int(np.searchsorted(cumulative, percentile / 100.0 - 1e-12))
+    return summary
+
+
+def option_statistics(histogram):
+    """
+    Compute how the number options of select_and_replace_number look for a distribution of correct numbers.
+
+    The three other options are drawn without replacement from number_option_range, so the probabilities are
+    exact for every number and weighted with its frequency.
+
+    Args:
+        histogram (numpy.ndarray): The count of every correct number.
+
+    Returns:
+        dict: 'below_one' - an option below 1 is shown, 'negative' - a negative option is shown, 'tens' - the
+        options come from the tens of the number (numbers of 10 and more), 'edge' - the correct number is the
+        smallest or largest option (all other options on one side).
+    """
+    statistics = {'below_one': 0.0, 'negative': 0.0, 'tens': 0.0, 'edge': 0.0}
+    total = histogram.sum()
+    for number in np.flatnonzero(histogram):
+        weight = histogram[number] / total
+        range_start, range_end = number_option_range(int(number))
+        others = [option for option in range(range_start, range_end + 1) if option != number]
+        draws = comb(len(others), 3)
+        below = sum(option < number for option in others)
+        statistics['below_one'] += weight * (1 - comb(len(others) - sum(option < 1 for option in others), 3) / draws)
+        statistics['negative'] += weight * (1 - comb(len(others) - sum(option < 0 for option in others), 3) / draws)
+        statistics['tens'] += weight * (number >= 10)
+        statistics['edge'] += weight * (comb(below, 3) + comb(len(others) - below, 3)) / draws
+    return statistics
+
+
+def attempt_seconds(coordinates, rng, n_attempts=200):
+    """
+    Measure the time of one attempt of the randomization in load_and_randomize (shuffle and check).
+
+    Args:
+        coordinates (pandas.DataFrame): The test items.
+        rng (numpy.random.Generator): The random numbers of the shuffles.
+        n_attempts (int, optional): The number of attempts timed.
+
+    Returns:
+        float: Seconds per attempt.
+    """
+    start = time.perf_counter()
+    for _ in range(n_attempts):
+        rand_coordinates = coordinates.sample(frac=1, random_state=rng).reset_index(drop=True)
+        satisfies_run_constraints(rand_coordinates['condition'].to_numpy(), rand_coordinates['name1'].to_numpy())
+    return (time.perf_counter() - start) / n_attempts
+
+
+def format_summary(summary, unit='', scale=1.0):
+    """Format a histogram summary as one line."""
+    return 'mean {:.2f}{unit}, '.format(summary['mean'] * scale, unit=unit) + ', '.join(
+        '{} {:g}{}'.format(key, round(summary[key] * scale, 3), unit)
+        for key in ['p{:g}'.format(percentile) for percentile in PERCENTILES] + ['max'])
+
+
+def simulate(stim_path, n_trials, frame_rate, seed, workers=None):
+    """
+    Run the simulation and print the design statistics.
+
+    Args:
+        stim_path (str): The stimulus directory with conditions.xlsx.
+        n_trials (int): The number of simulated trials - one session (stimulus order) per len(test items) trials.
+        frame_rate (float): The refresh rate of the simulated display.
+        seed (int): The seed of the simulation.
+        workers (int, optional): Number of worker processes.
+
+    Returns:
+        dict: The merged histograms.
+    """
+    _, coordinates = split_stimuli(pandas.read_excel(os.path.join(stim_path, 'conditions.xlsx')))
+    conditions = coordinates['condition'].to_numpy()
+    names = coordinates['name1'].to_numpy()
+    n_sessions = max(1, n_trials // len(coordinates))
+
+    mismatches = check_against_schedule(500, frame_rate, seed)
+    if mismatches:
+        raise ValueError('The vectorized beeps differ from beep_schedule in {} of 500 trials'.format(mismatches))
+
+    jobs = []
+    for chunk, first in enumerate(range(0, n_trials, CHUNK_TRIALS)):
+        chunk_trials = min(CHUNK_TRIALS, n_trials - first)
+        chunk_sessions = n_sessions * (first + chunk_trials) // n_trials - n_sessions * first // n_trials
+        jobs.append(([seed, chunk], chunk_trials, chunk_sessions, frame_rate, conditions, names))
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        chunks = list(executor.map(simulate_chunk, jobs))
+    elapsed = time.perf_counter() - start
+    histograms = {key: merge_histograms([chunk[key] for chunk in chunks]) for key in chunks[0]}
+    seconds = attempt_seconds(coordinates, np.random.default_rng(seed))
+
+    print('{} trials and {} stimulus orders at {:g} Hz simulated in {:.1f} s (seed {}, beeps checked against '
+          'beep_schedule)'.format(n_trials, n_sessions, frame_rate, elapsed, seed))
+    print('Beeps played per trial: ' + format_summary(histogram_summary(histograms['played'])))
+    print('Beep slots in the blackout around the item (not played): ' +
+          format_summary(histogram_summary(histograms['blackout'])))
+    deviants = histograms['deviants']
+    print('Deviants per trial: ' + format_summary(histogram_summary(deviants)))
+    print('    ' + ', '.join('{}: {:.3%}'.format(count, share)
+                             for count, share in enumerate(deviants / deviants.sum()) if share > 0))
+    forced = histograms['forced']
+    print('Trials with forced deviants: {:.3%}, trials with fewer than 3 deviants: {:.3%}'.format(
+        1 - forced[0] / forced.sum(), deviants[:3].sum() / deviants.sum()))
+    for label, histogram in (('Beep count options', deviants), ('Number options', histograms['numbers'])):
+        statistics = option_statistics(histogram)
+        print('{}: option below 1 shown {:.3%}, negative option shown {:.3%}, options from the tens {:.3%}, '
+              'correct number smallest or largest option {:.3%}'.format(
+                  label, statistics['below_one'], statistics['negative'], statistics['tens'], statistics['edge']))
+    attempts = histograms['attempts']
+    print('Randomization attempts per stimulus order (acceptance {:.1%}): '.format(
+        attempts.sum() / (np.arange(len(attempts)) * attempts).sum()) + format_summary(histogram_summary(attempts)))
+    print('Randomization time per session ({:.0f} us per attempt): '.format(seconds * 1e6) +
+          format_summary(histogram_summary(attempts), ' ms', seconds * 1000))
+    return histograms
+
+
+def main():
+    """Command line interface of the simulator."""
+    parser = argparse.ArgumentParser(description='Monte Carlo simulation of the dual task design.')
+    parser.add_argument('--trials', type=int, default=1000000, help='number of simulated trials')
+    parser.add_argument('--frame-rate', type=float, default=60.0, help='refresh rate of the simulated display')
+    parser.add_argument('--stimuli', default='stimuli', help='stimulus directory with conditions.xlsx')
+    parser.add_argument('--seed', type=int, default=None, help='seed of the simulation (default: random)')
+    parser.add_argument('--workers', type=int, default=None, help='number of worker processes')
+    args = parser.parse_args()
+
+    seed = new_session_seed() if args.seed is None else args.seed
+    simulate(args.stimuli, args.trials, args.frame_rate, seed, args.workers)
+
+
+if __name__ == '__main__':
+    main()
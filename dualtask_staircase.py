@@ -0,0 +1,123 @@
+"""
+Adaptive coherence of the moving dots.
+With a fixed coherence the dot task is trivial for some participants and almost impossible for others, so the load
+of the secondary task differs between participants. The staircase adapts the coherence of the dots to the
+participant: a Bayesian posterior over the threshold coherence and the lapse rate of a Weibull psychometric
+function (with the guess rate of the four directions) is updated with every dot response, and the coherence of the
+next trial is the one with the lowest expected entropy of the posterior after its response (QUEST+).
+
+The posterior is a grid; the likelihoods of all candidate coherences are computed once, so an update and the choice
+of the next coherence are a few numpy operations on arrays of about 30000 values (well below a millisecond).
+
+Modes (dot_coherence_mode in dualtask_configuration.py):
+    'fixed'             the coherence of initialize_stimuli in all trials (no staircase)
+    'adaptive_practice' the staircase runs in the practice trials; the test trials use the estimated threshold
+    'adaptive'          the staircase runs in the practice and the test trials
+"""
+
+# Import necessary libraries
+import numpy as np
+from dualtask_records import Phase
+from dualtask_schedule import MOVEMENT_DIRECTIONS
+
+
+COHERENCE_MODES = ('fixed', 'adaptive_practice', 'adaptive')
+
+# Grid of the posterior and the coherences that can be presented
+THRESHOLD_GRID = np.geomspace(0.02, 1.0, 61)  # threshold coherence (about 72% correct), log-uniform prior
+LAPSE_GRID = np.linspace(0.0, 0.1, 11)  # rate of wrong responses independent of the coherence
+COHERENCE_LEVELS = np.geomspace(0.02, 1.0, 40)
+SLOPE = 3.5  # slope of the Weibull function
+GUESS_RATE = 1.0 / len(MOVEMENT_DIRECTIONS)
+
+
+def psychometric(coherence, threshold, lapse, slope=SLOPE, guess_rate=GUESS_RATE):
+    """
+    Return the probability of a correct response (Weibull function with guess and lapse rate).
+
+    Args:
+        coherence (numpy.ndarray): Coherence of the dots.
+        threshold (numpy.ndarray): Threshold coherence - broadcast against coherence and lapse.
+        lapse (numpy.ndarray): Lapse rate.
+        slope (float, optional): Slope of the function.
+        guess_rate (float, optional): Probability of a correct guess.
+
+    Returns:
+        numpy.ndarray: The probability of a correct response.
+    """
+    return guess_rate + (1 - guess_rate - lapse) * (1 - np.exp(-(coherence / threshold) ** slope))
+
+
+def _entropy(posterior, axis):
+    """Entropy (in bits) of normalized distributions along the given axes."""
+    return -np.sum(posterior * np.log2(np.where(posterior > 0, posterior, 1.0)), axis=axis)
+
+
+class CoherenceStaircase:
+    """
+    QUEST+ staircase over threshold coherence and lapse rate.
+
+    Attributes:
+        mode (str): 'adaptive_practice' or 'adaptive' (see COHERENCE_MODES).
+        posterior (numpy.ndarray): Posterior of shape (len(THRESHOLD_GRID), len(LAPSE_GRID)).
+        n_updates (int): Number of responses the posterior was updated with.
+    """
+
+    def __init__(self, mode='adaptive_practice'):
+        if mode not in COHERENCE_MODES[1:]:
+            raise ValueError("Unknown staircase mode '{}'. Use 'adaptive_practice' or 'adaptive'.".format(mode))
+        self.mode = mode
+        # likelihood of a correct response for every coherence level and grid point: (level, threshold, lapse)
+        self._correct = psychometric(COHERENCE_LEVELS[:, None, None], THRESHOLD_GRID[None, :, None],
+                                     LAPSE_GRID[None, None, :])
+        self.posterior = np.full((len(THRESHOLD_GRID), len(LAPSE_GRID)), 1.0 / (len(THRESHOLD_GRID) *
+                                                                               len(LAPSE_GRID)))
+        self.n_updates = 0
+
+    def adapts(self, task_name):
+        """Return whether the staircase adapts the coherence in a task (or uses the estimated threshold)."""
+        return self.mode == 'adaptive' or Phase.of_task(task_name) == Phase.practice
+
+    def next_coherence(self):
+        """
+        Choose the coherence of the next trial.
+
+        Returns:
+            float: The coherence level whose response is expected to reduce the entropy of the posterior most.
+        """
+        p_correct = np.sum(self._correct * self.posterior, axis=(1, 2))
+        after_correct = self._correct * self.posterior
+        after_incorrect = (1 - self._correct) * self.posterior
+        expected_entropy = (p_correct * _entropy(after_correct / p_correct[:, None, None], axis=(1, 2)) +
+                            (1 - p_correct) * _entropy(after_incorrect / (1 - p_correct)[:, None, None], axis=(1, 2)))
+        return float(COHERENCE_LEVELS[np.argmin(expected_entropy)])
+
+    def update(self, coherence, correct):
+        """
+        Update the posterior with a response.
+
+        Args:
+            coherence (float): The presented coherence.
+            correct (bool): Whether the response was correct.
+        """
+        likelihood = psychometric(coherence, THRESHOLD_GRID[:, None], LAPSE_GRID[None, :])
+        self.posterior *= likelihood if correct else 1 - likelihood
+        self.posterior /= self.posterior.sum()
+        self.n_updates += 1
+
+    def estimate(self):
+        """
+        Return the posterior estimates.
+
+        Returns:
+            dict: 'dot_threshold' (posterior mean of the threshold coherence, averaged in log space),
+            'dot_threshold_sd' (posterior standard deviation of log10 threshold) and 'dot_lapse' (posterior mean).
+        """
+        log_threshold = np.log10(THRESHOLD_GRID)
+        threshold_marginal = self.posterior.sum(axis=1)
+        mean = np.sum(threshold_marginal * log_threshold)
+        return {
+            'dot_threshold': round(float(10 ** mean), 4),
+            'dot_threshold_sd': round(float(np.sqrt(np.sum(threshold_marginal * (log_threshold - mean) ** 2))), 4),
+            'dot_lapse': round(float(np.sum(self.posterior.sum(axis=0) * LAPSE_GRID)), 4),
+        }
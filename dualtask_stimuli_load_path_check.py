@@ -1,11 +1,14 @@
 """
 This script checks and if necessary creates all output directories and also loads and randomizes the stimuli.
+If a pre-generated list of the subject exists (see dualtask_lists), the stimuli are put in its order instead.
 """
 
 # Import necessary libraries
 import os
 import pandas
 import logging
+from dualtask_lists import split_stimuli, satisfies_run_constraints, stored_order
+from dualtask_recording import file_sha256
 
 
 def check_config_paths(stim_path, output_path, pics_path, record_path):
@@ -31,14 +34,15 @@ def check_config_paths(stim_path, output_path, pics_path, record_path):
         os.mkdir(record_path)
 
 
-def load_and_randomize(stim_path, task):
+def load_and_randomize(stim_path, task, rng=None, subject=None, lists_file=None):
     """
     Loads stimulus data from an Excel file, separates it into practice and coordinates data,
     randomizes the coordinates data, and returns the combined data.
 
-    The function repeatedly shuffles the rows of the coordinates data until it achieves a
-    randomization where neither the 'condition' nor the 'name1' field have the same values
-    in three consecutive rows.
+    If lists_file holds a pre-generated list of the subject for this task (generated from the same
+    conditions.xlsx), the coordinates data are put in that order. Otherwise the function repeatedly
+    shuffles the rows of the coordinates data until it achieves a randomization where neither the
+    'condition' nor the 'name1' field have the same values in three consecutive rows.
 
     Parameters:
     stim_path : str
@@ -47,6 +51,14 @@ def load_and_randomize(stim_path, task):
     task : str
         A string indicating the type of task. The task type doesn't affect the randomization
         but it is used to log the operation in case of errors.
+    rng : numpy.random.Generator, optional
+        The random number stream used for shuffling, e.g. the 'ordering' stream of the session.
+        If None, pandas draws from the global numpy random state.
+    subject : str, optional
+        The subject ID whose pre-generated list is used.
+    lists_file : str, optional
+        The list file written by dualtask_lists.py. If None (or there is no list of the subject),
+        the order is randomized at runtime.
 
     Returns:
     stimulus_type : list
@@ -82,31 +94,24 @@ def load_and_randomize(stim_path, task):
         quit()
 
     # Separate practice data and coordinates data
-    practice = stimuli[:4]
-    coordinates = stimuli[6:]
-
-    randomized = False
-
-    while not randomized:
-        # Randomize the order of coordinates
-        if task == "single":
-            rand_coordinates = coordinates.sample(frac=1).reset_index(drop=True)
-        else:
-            rand_coordinates = coordinates.sample(frac=1).reset_index(drop=True)
-
-        # check for repeats
-        for i in range(0, len(rand_coordinates)):
-            if i >= len(rand_coordinates) - 3:
-                # rand_coordinates.to_csv('rand_Coordinates_%s.csv' % i)
-                randomized = True
-            elif \
-                    rand_coordinates['condition'][i] == rand_coordinates['condition'][i + 1] and \
-                            rand_coordinates['condition'][i] == rand_coordinates['condition'][i + 2] and \
-                            rand_coordinates['condition'][i] == rand_coordinates['condition'][i + 3] or \
-                    rand_coordinates['name1'][i] == rand_coordinates['name1'][i + 1] and \
-                            rand_coordinates['name1'][i] == rand_coordinates['name1'][i + 2]:
-                # rand_coordinates.to_csv('rand_Coordinates_%s.csv' % i)
-                break
+    practice, coordinates = split_stimuli(stimuli)
+
+    order = None
+    if lists_file and subject is not None:
+        order = stored_order(lists_file, subject, task, file_sha256(os.path.join(stim_path, 'conditions.xlsx')))
+        if order is None:
+            print("No pre-generated {} list for subject '{}' - the order is randomized now".format(task, subject))
+
+    if order is not None:
+        rand_coordinates = coordinates.iloc[order].reset_index(drop=True)
+    else:
+        randomized = False
+        while not randomized:
+            # Randomize the order of coordinates
+            rand_coordinates = coordinates.sample(frac=1, random_state=rng).reset_index(drop=True)
+            # check for repeats
+            randomized = satisfies_run_constraints(rand_coordinates['condition'].to_numpy(),
+                                                   rand_coordinates['name1'].to_numpy())
 
     # Append practice data and randomized coordinates data to stimulus_type
     stimulus_type = [practice, rand_coordinates]
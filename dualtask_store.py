@@ -0,0 +1,304 @@
+"""
+SQLite session store - an alternative result backend to the CSV files.
+Every session gets one database file next to its CSV files. The results of a trial are inserted as they arrive
+and committed together at the end of the trial, the database runs in WAL mode so it can be read (e.g. by the
+dashboard or an analysis script) while the session is running.
+
+The tables are normalized: one row per trial, per beep (counted or pressed), per response and per recording, with
+indices on subject, task, phase and condition. The result records (see dualtask_records) are stored with their
+typed values - the list-valued fields (beep sequence, response keys, number options) become rows or plain values.
+
+Example:
+    import sqlite3
+    db = sqlite3.connect('results/<subject>/session_<subject>_<date>.db')
+    db.execute("SELECT condition, AVG(accuracy = 'correct') FROM responses JOIN trials USING (session, task, "
+               "main_trial) WHERE response = 'dot' GROUP BY condition").fetchall()
+"""
+
+# Import necessary libraries
+import json
+import os
+import sqlite3
+from enum import Enum
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    session TEXT PRIMARY KEY,
+    experiment TEXT,
+    subject TEXT,
+    date TEXT,
+    session_seed INTEGER
+);
+CREATE TABLE IF NOT EXISTS trials (
+    session TEXT NOT NULL REFERENCES sessions (session),
+    subject TEXT NOT NULL,
+    task TEXT NOT NULL,
+    phase TEXT NOT NULL,
+    main_trial INTEGER NOT NULL,
+    stimulus_id TEXT,
+    stimulus TEXT,
+    condition TEXT,
+    frame_rate REAL,
+    item_1st_frame INTEGER,
+    item_last_frame INTEGER,
+    dot_direction INTEGER,
+    dot_1st_frame INTEGER,
+    dot_last_frame INTEGER,
+    dot_coherence REAL,
+    dot_threshold REAL,
+    dot_threshold_sd REAL,
+    dot_lapse REAL,
+    beep_count_trials INTEGER,
+    beep_count_deviant_trials INTEGER,
+    beep_count_normal_trials INTEGER,
+    beep_sequence TEXT,
+    beep_press_trials INTEGER,
+    beep_press_deviant_trials INTEGER,
+    beep_press_normal_trials INTEGER,
+    beep_press_hits INTEGER,
+    beep_press_misses INTEGER,
+    beep_press_false_alarms INTEGER,
+    beep_press_unmatched INTEGER,
+    beep_press_rt_correct REAL,
+    beep_press_rt_incorrect REAL,
+    beep_press_accuracy REAL,
+    start_time TEXT,
+    end_time TEXT,
+    duration TEXT,
+    PRIMARY KEY (session, task, main_trial)
+);
+CREATE TABLE IF NOT EXISTS beeps (
+    session TEXT NOT NULL,
+    task TEXT NOT NULL,
+    main_trial INTEGER NOT NULL,
+    beep INTEGER,
+    beep_type TEXT,
+    presentation TEXT,
+    note TEXT,
+    start_time TEXT,
+    end_time TEXT,
+    duration TEXT
+);
+CREATE TABLE IF NOT EXISTS beep_presses (
+    session TEXT NOT NULL,
+    task TEXT NOT NULL,
+    main_trial INTEGER NOT NULL,
+    beep INTEGER,
+    beep_type TEXT,
+    presentation TEXT,
+    note TEXT,
+    response_type TEXT,
+    accuracy TEXT,
+    rt REAL,
+    start_time TEXT,
+    end_time TEXT,
+    duration TEXT
+);
+CREATE TABLE IF NOT EXISTS responses (
+    session TEXT NOT NULL,
+    task TEXT NOT NULL,
+    main_trial INTEGER NOT NULL,
+    response TEXT NOT NULL,
+    response_key TEXT,
+    accuracy TEXT,
+    options TEXT,
+    correct_index INTEGER
+);
+CREATE TABLE IF NOT EXISTS recordings (
+    session TEXT NOT NULL,
+    task TEXT NOT NULL,
+    main_trial INTEGER NOT NULL,
+    file TEXT,
+    speech_onset REAL,
+    speech_offset REAL,
+    peak_dbfs REAL,
+    rms_dbfs REAL,
+    clipping_ratio REAL,
+    silence_fraction REAL,
+    input_overflows INTEGER,
+    qc TEXT
+);
+CREATE INDEX IF NOT EXISTS trials_subject ON trials (subject);
+CREATE INDEX IF NOT EXISTS trials_task_phase ON trials (task, phase);
+CREATE INDEX IF NOT EXISTS trials_condition ON trials (condition);
+CREATE INDEX IF NOT EXISTS beeps_trial ON beeps (session, task, main_trial);
+CREATE INDEX IF NOT EXISTS beep_presses_trial ON beep_presses (session, task, main_trial);
+CREATE INDEX IF NOT EXISTS responses_trial ON responses (session, task, main_trial);
+CREATE INDEX IF NOT EXISTS recordings_trial ON recordings (session, task, main_trial);
+"""
+
+# Columns added to the tables after their first version - added to databases of earlier sessions when they are
+# opened again
+ADDED_COLUMNS = {
+    'trials': (('dot_coherence', 'REAL'), ('dot_threshold', 'REAL'), ('dot_threshold_sd', 'REAL'),
+               ('dot_lapse', 'REAL'), ('beep_sequence', 'TEXT'), ('beep_press_trials', 'INTEGER'),
+               ('beep_press_deviant_trials', 'INTEGER'), ('beep_press_normal_trials', 'INTEGER'),
+               ('beep_press_hits', 'INTEGER'), ('beep_press_misses', 'INTEGER'), ('beep_press_false_alarms', 'INTEGER'),
+               ('beep_press_unmatched', 'INTEGER'), ('beep_press_rt_correct', 'REAL'),
+               ('beep_press_rt_incorrect', 'REAL'), ('beep_press_accuracy', 'REAL')),
+}
+
+
+def session_database(subject_path, participant_info):
+    """
+    Return the database file of a session.
+
+    Args:
+        subject_path (str): The results directory of the subject.
+        participant_info (dict): The participant's information.
+
+    Returns:
+        str: e.g. 'results/<subject>/session_<subject>_<date>.db'.
+    """
+    return os.path.join(subject_path, 'session_{}_{}.db'.format(participant_info['subject'],
+                                                                participant_info['cur_date']))
+
+
+def _value(value):
+    """Map enums, numpy scalars and lists of the result records to values SQLite can store."""
+    if isinstance(value, Enum):
+        return value.value
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+def _first_key(keys):
+    """Return the first key of a psychopy key list, None if there is none."""
+    return keys[0] if isinstance(keys, (list, tuple)) and keys else keys
+
+
+class SessionStore:
+    """
+    The SQLite database of one session.
+
+    Rows are inserted within an open transaction; commit() writes them at the trial boundary, so a crash loses at
+    most the trial that was running.
+
+    Attributes:
+        path (str): The database file.
+        session (str): The key of the session - subject and date of the session.
+    """
+
+    def __init__(self, path, participant_info):
+        self.path = path
+        self.session = '{}_{}'.format(participant_info['subject'], participant_info['cur_date'])
+        self._participant_info = participant_info
+        self._connection = sqlite3.connect(path)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        # with WAL a commit only needs to survive a crash of the application, not of the operating system
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+        for table, columns in ADDED_COLUMNS.items():
+            existing = {row[1] for row in self._connection.execute('PRAGMA table_info({})'.format(table))}
+            for name, column_type in columns:
+                if name not in existing:
+                    self._connection.execute('ALTER TABLE {} ADD COLUMN {} {}'.format(table, name, column_type))
+        self._connection.execute(
+            'INSERT OR IGNORE INTO sessions (session, experiment, subject, date, session_seed) VALUES (?, ?, ?, ?, ?)',
+            (self.session, participant_info['experiment'], participant_info['subject'],
+             participant_info['cur_date'], int(participant_info['session_seed'])))
+        self._connection.commit()
+
+    def add_result(self, result, type='main'):
+        """
+        Insert a result record as passed to append_result_to_csv (without committing).
+
+        Args:
+            result (Record): A TrialRecord ('main'), a BeepRecord ('beep_count') or a BeepPressRecord ('beep_press').
+            type (str, optional): 'main', 'beep_count' or 'beep_press'. Defaults to 'main'.
+        """
+        if type == 'main':
+            self._add_trial(result)
+        elif type == 'beep_count':
+            self._add_beep(result)
+        elif type == 'beep_press':
+            self._add_beep_press(result)
+        else:
+            raise ValueError("Unknown result type '{}'".format(type))
+
+    def _add_beep(self, result):
+        """Insert a row of the beep count stream - a played beep or the pause during the item presentation."""
+        beep = result.beep_count_trial
+        note = None
+        if not isinstance(beep, int):
+            beep, note = None, beep
+        self._connection.execute(
+            'INSERT INTO beeps VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.session, result.task, int(result.main_trial), beep, _value(result.beep_count_stimulus),
+             _value(result.presentation), note, result.start_time, result.end_time, result.duration))
+
+    def _add_beep_press(self, result):
+        """Insert a row of the beep press stream - a played beep with the reaction to it, or the pause."""
+        beep = result.beep_press_trial
+        note = None
+        if not isinstance(beep, int):
+            beep, note = None, beep
+        self._connection.execute(
+            'INSERT INTO beep_presses VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            (self.session, result.task, int(result.main_trial), beep, _value(result.beep_press_stimulus),
+             _value(result.presentation), note, _value(result.beep_press_response_type),
+             _value(result.beep_press_accuracy), _value(result.beep_press_rt), result.start_time, result.end_time,
+             result.duration))
+
+    def _add_trial(self, result):
+        """Insert a trial with its responses and its recording."""
+        trial = (self.session, result.task, int(result.main_trial))
+        self._connection.execute(
+            'INSERT OR REPLACE INTO trials (session, subject, task, phase, main_trial, stimulus_id, stimulus, '
+            'condition, frame_rate, item_1st_frame, item_last_frame, dot_direction, dot_1st_frame, dot_last_frame, '
+            'dot_coherence, dot_threshold, dot_threshold_sd, dot_lapse, beep_count_trials, beep_count_deviant_trials, '
+            'beep_count_normal_trials, beep_sequence, beep_press_trials, beep_press_deviant_trials, '
+            'beep_press_normal_trials, beep_press_hits, beep_press_misses, beep_press_false_alarms, '
+            'beep_press_unmatched, beep_press_rt_correct, beep_press_rt_incorrect, beep_press_accuracy, start_time, '
+            'end_time, duration) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, '
+            '?, ?)',
+            (self.session, self._participant_info['subject'], result.task, _value(result.phase), trial[2],
+             _value(result.stimulus_id), _value(result.stimulus), _value(result.condition),
+             _value(result.frame_rate), _value(result.item_1st_frame), _value(result.item_last_frame),
+             _value(result.dot_direction), _value(result.dot_1st_frame), _value(result.dot_last_frame),
+             _value(result.dot_coherence), _value(result.dot_threshold), _value(result.dot_threshold_sd),
+             _value(result.dot_lapse), _value(result.beep_count_trials), _value(result.beep_count_deviant_trials),
+             _value(result.beep_count_normal_trials),
+             None if result.beep_sequence is None else json.dumps([_value(beep) for beep in result.beep_sequence]),
+             _value(result.beep_press_trials), _value(result.beep_press_deviant_trials),
+             _value(result.beep_press_normal_trials), _value(result.beep_press_hits), _value(result.beep_press_misses),
+             _value(result.beep_press_false_alarms), _value(result.beep_press_unmatched),
+             _value(result.beep_press_rt_correct), _value(result.beep_press_rt_incorrect),
+             _value(result.beep_press_accuracy), result.start_time, result.end_time, result.duration))
+
+        if result.dot_response_accuracy is not None:
+            self._connection.execute(
+                'INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                trial + ('dot', _first_key(result.dot_response_key), _value(result.dot_response_accuracy), None,
+                         None))
+        if result.beep_count_response_accuracy is not None:
+            self._connection.execute(
+                'INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                trial + ('beep_count', _first_key(result.beep_count_response),
+                         _value(result.beep_count_response_accuracy),
+                         json.dumps([int(option) for option in result.beep_count_number_selection]),
+                         _value(result.beep_count_index_correct_count)))
+        if result.number_response_accuracy is not None:
+            self._connection.execute(
+                'INSERT INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                trial + ('number', _first_key(result.index_number_response), _value(result.number_response_accuracy),
+                         json.dumps([int(option) for option in result.number_selection]),
+                         _value(result.index_rand_nr)))
+
+        self._connection.execute(
+            'INSERT INTO recordings VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+            trial + (_value(result.stimulus_rec), _value(result.speech_onset), _value(result.speech_offset),
+                     _value(result.rec_peak_dbfs), _value(result.rec_rms_dbfs), _value(result.rec_clipping_ratio),
+                     _value(result.rec_silence_fraction), _value(result.rec_input_overflows), _value(result.rec_qc)))
+
+    def commit(self):
+        """Commit the rows of the current trial."""
+        self._connection.commit()
+
+    def close(self):
+        """Commit the remaining rows and close the database."""
+        self._connection.commit()
+        self._connection.close()
@@ -8,23 +8,28 @@ their response to the math problem and moving-dots task.
 
 # Import necessary libraries
 from psychopy import prefs
-# Set the audio library preference
+# Set the audio library preference - before psychopy's sound module is imported by the task components below
 prefs.hardware['audioLib'] = ['ptb', 'sounddevice', 'pygame', 'pyo']
-# Now, import sound
-from psychopy import sound, core, event, visual
+from psychopy import core, event, visual
 import time
 import datetime
-import sounddevice as sd
-from scipy.io.wavfile import write
-import random
-from dualtask_configuration import append_result_to_csv
+from dualtask_configuration import save_result, recording_format, vad_enabled, vad_threshold_db, \
+    vad_hangover, vad_max_extension, vad_early_advance, vad_trailing_silence, qc_clip_level, qc_max_clipping_ratio, \
+    qc_silence_db, qc_min_peak_dbfs, session_container, get_session_container
+from dualtask_recording import RecordingWriter, Recorder, recording_qc
+from dualtask_markers import MarkerEvent
+from dualtask_rng import SessionRNG
+from dualtask_records import TrialRecord, Phase
+from dualtask_components import Component, FrameEngine, TrialState, BeepStream, BeepPress, DotField, NumberMemory, \
+    KeyListener, clock_times
+from dualtask_schedule import REFERENCE_FRAME_RATE, BEEP_PRESS_KEYS, FrameGrid, FrameClock
 import os
-import numpy as np
 
 
 # single task procedure
 def execute_singleTask(window, results, subj_path_rec, stimuli, task_name, werKommt, fixation, item, rec_seconds,
-                       fs, participant_info, base_filename):
+                       fs, participant_info, base_filename, recording_writer, recorder, frame_rate, status=None,
+                       markers=None):
     """
     Execute the single task procedure.
 
@@ -44,7 +49,15 @@ def execute_singleTask(window, results, subj_path_rec, stimuli, task_name, werKo
         fs: The sample rate for the recording.
         participant_info: The participant's information.
         base_filename: The filename for the result CSV file.
+        recording_writer: The RecordingWriter that saves the recordings in the background.
+        recorder: The Recorder that records the responses and detects speech.
+        frame_rate: The refresh rate of the window - the item duration is mapped to frames of this rate.
+        status: The StatusBlock of the experimenter dashboard, updated after every trial (optional).
+        markers: The MarkerOutlet the item onsets are sent to (optional).
     """
+    # The timeline in milliseconds mapped to the frames of the display
+    frame_grid = FrameGrid(frame_rate)
+
     # Initialize start time and format it into string
     start_time = time.time()
     start_time_str = datetime.datetime.fromtimestamp(start_time).strftime('%H:%M:%S')
@@ -72,23 +85,40 @@ def execute_singleTask(window, results, subj_path_rec, stimuli, task_name, werKo
         item.setText(stimulus)
         item.name = 'item_' + str(stimuli.loc[x]['ID'])  # Naming the TextStim to find it in the log-file
 
-        # Start recording the participant's verbal response
-        responseRecord = sd.rec(int(rec_seconds * fs), samplerate=fs, channels=1)
-
-        # Present item and pic for 350 frames
-        for frame in range(350):
+        # Start recording the participant's verbal response into a preallocated buffer of the pool
+        responseRecord = recording_writer.buffer_pool.acquire(int(rec_seconds * fs))
+        recorder.start(responseRecord)
+
+        # Present item and pic for 5.83 s (350 frames at 60 Hz) - adapted to the participant's speech by the voice
+        # activity detection; the frame index follows the flip times, so dropped frames do not lengthen the trial
+        frame_clock = FrameClock(frame_rate)
+        frame = 0
+        item_end = frame_grid.item_frames
+        max_item_end = item_end + frame_grid.frames(vad_max_extension * 1000)
+        while frame < item_end:
             item.draw()  # Draw item
-            window.flip()  # Flip window to make drawn items visible
+            flip_time = window.flip()  # Flip window to make drawn items visible
+            if frame == 0 and markers is not None:
+                markers.push(MarkerEvent.item_onset, 0, x + 1, frame, flip_time)
+            item_end = adapt_item_end(frame, item_end, max_item_end, recorder)
+            frame = frame_clock.next_frame(flip_time)
 
         # Stop the recording after the presentation is over
-        sd.stop()
-
-        # Save the recording as a WAV file
-        write(os.path.join(subj_path_rec, 'dualtask_' + participant_info['subject'] + '_' + task_name + '_' +
-                           "{:02d}".format(x + 1) + '_' + str(stimuli.loc[x]['ID']) + '.wav'), fs, responseRecord)
-        # naming the recording wav file to find it in the log-file
-        responseRecordName = 'dualtask_' + participant_info['subject'] + '_' + task_name + '_' + \
-                             "{:02d}".format(x + 1) + '_' + str(stimuli.loc[x]['ID']) + '.wav'
+        rec_frames = recorder.stop()
+        speech_onset, speech_offset = recorder.speech_span()
+        # Health check of the recording - done before the buffer is handed to the writer
+        rec_qc, rec_alert = check_recording(responseRecord[:rec_frames], fs, recorder,
+                                            task_name + ' trial ' + "{:02d}".format(x + 1))
+        if rec_alert:
+            print('RECORDING ALERT - ' + rec_alert)
+
+        # Hand the recording to the background writer - it is encoded and saved while the next trial runs
+        # the returned file name is used to find the recording in the log-file
+        responseRecordName = recording_writer.submit(
+            os.path.join(subj_path_rec, 'dualtask_' + participant_info['subject'] + '_' + task_name + '_' +
+                         "{:02d}".format(x + 1) + '_' + str(stimuli.loc[x]['ID'])), responseRecord, fs,
+            n_frames=rec_frames,
+            metadata={'task': task_name, 'main_trial': "{:02d}".format(x + 1), 'stimulus_id': stimuli.loc[x]['ID']})
 
         # Calculate and format end time and duration
         end_time = time.time()
@@ -98,39 +128,39 @@ def execute_singleTask(window, results, subj_path_rec, stimuli, task_name, werKo
         minutes, seconds = divmod(remainder, 60)
         duration_str = '{:02d}:{:02d}:{:02d}'.format(int(hours), int(minutes), int(seconds))
 
-        # Prepare the result dictionary
-        results.append({
-            'task': task,
-            'main_trial': "{:02d}".format(x + 1),
-            'phase': 'practice' if task_name.startswith('practice') else 'test',
-            'stimulus_id': stimuli.loc[x]['ID'],
-            'stimulus': stimuli.loc[x]['item'],
-            'stimulus_rec': responseRecordName,
-            'dot_direction': 'NA',
-            'dot_1st_frame': 'NA',
-            'dot_last_frame': 'NA',
-            'dot_response_key': 'NA',
-            'dot_response_accuracy': 'NA',
-            'beep_sequence':'NA',
-            'beep_count_trials': 'NA',
-            'beep_count_deviant_trials': 'NA',
-            'beep_count_normal_trials': 'NA',
-            'beep_count_number_selection': 'NA',
-            'beep_count_index_correct_count': 'NA',
-            'beep_count_response': 'NA',
-            'beep_count_response_accuracy': 'NA',
-            'start_time': start_time_str,
-            'end_time': end_time_str,
-            'duration': duration_str,
-        })
+        # Prepare the result record - the dot and beep count fields stay empty in the single task
+        results.append(TrialRecord(
+            task=task,
+            main_trial=x + 1,
+            phase=Phase.of_task(task_name),
+            stimulus_id=stimuli.loc[x]['ID'],
+            stimulus=stimuli.loc[x]['item'],
+            condition=stimuli.loc[x]['condition'],
+            stimulus_rec=responseRecordName,
+            frame_rate=frame_rate,
+            item_1st_frame=0,
+            item_last_frame=item_end - 1,
+            speech_onset=speech_onset,
+            speech_offset=speech_offset,
+            **rec_qc,
+            start_time=start_time_str,
+            end_time=end_time_str,
+            duration=duration_str,
+        ))
         # Append the result to the CSV file
-        append_result_to_csv(results[-1], base_filename, participant_info)
+        save_result(results[-1], base_filename, participant_info)
+
+        # Publish the trial to the experimenter dashboard
+        if status is not None:
+            status.trial_done(x + 1, frame_clock.dropped, (rec_qc['rec_peak_dbfs'], rec_qc['rec_rms_dbfs']), rec_alert)
 
 
 # dual task procedure
 def execute_dualTask_beep_count_dots(window, results, base_filename, subj_path_rec, stimuli, task_name, werKommt,
                                      fixation, item, prompt, feedback, fs, rec_seconds, movementDirections,
-                                     responseList, dots, arrows, arrows_small, number_prompts, participant_info):
+                                     responseList, dots, arrows, arrows_small, number_prompts, participant_info,
+                                     recording_writer, recorder, session_rng, frame_rate, status=None, staircase=None,
+                                     markers=None):
     """
     Executes a dual-task experiment where the participant is asked to count beeps and track moving dots.
     The participant's responses are recorded for analysis.
@@ -176,36 +206,181 @@ def execute_dualTask_beep_count_dots(window, results, base_filename, subj_path_r
         List of number prompt stimulus objects for drawing.
     participant_info : dict
         Dictionary containing information about the participant.
+    recording_writer : RecordingWriter
+        The writer that saves the recordings in the background.
+    recorder : Recorder
+        The recorder that records the spoken responses and detects speech.
+    session_rng : SessionRNG
+        The random number streams of the session.
+    frame_rate : float
+        The refresh rate of the window - the trial timeline is mapped to frames of this rate.
+    status : StatusBlock, optional
+        The status block of the experimenter dashboard, updated after every trial.
+    staircase : CoherenceStaircase, optional
+        The staircase that sets the coherence of the dots. If None, the coherence of the dots is not changed.
+    markers : MarkerOutlet, optional
+        The outlet the events of the trials are sent to.
+
+    Returns:
+    None
+    """
+
+    # The read-aloud item, the moving dots and the beeps to count - the responses are collected in this order:
+    # dots first, then the beep count
+    components = [
+        ReadAloud(item, stimuli, subj_path_rec, participant_info, fs, rec_seconds, recording_writer, recorder),
+        DotField(dots, movementDirections, prompt, feedback, arrows, responseList, staircase),
+        BeepStream(prompt, feedback, number_prompts, arrows_small, responseList),
+    ]
+    execute_dualTask(window, results, base_filename, stimuli, task_name, werKommt, fixation, participant_info,
+                     session_rng, frame_rate, components, status, markers)
+
+
+def execute_dualTask_number_beep_press(window, results, base_filename, subj_path_rec, stimuli, task_name, werKommt,
+                                       fixation, item, prompt, feedback, fs, rec_seconds, responseList, arrows_small,
+                                       number_prompts, participant_info, recording_writer, recorder, session_rng,
+                                       frame_rate, status=None, markers=None):
+    """
+    Executes a dual-task experiment where the participant remembers a number and presses the space bar on every
+    high beep while reading the item aloud.
+    The presses are collected with their key-down time in a background thread and matched to the beep onsets after
+    every trial (see BeepPress); the beeps with the reactions are written to the beep press CSV file.
+
+    Parameters:
+    window : object
+        The window object where all the visual stimuli are drawn.
+    results : list
+        A list to hold the results of the experiment.
+    base_filename : str
+        The base filename for all output files.
+    subj_path_rec : str
+        The path to save the recordings of the participant's responses.
+    stimuli : DataFrame
+        A DataFrame containing the stimuli for the experiment.
+    task_name : str
+        The name of the task to be executed.
+    werKommt : object
+        Text stimulus object for drawing.
+    fixation : object
+        Shape stimulus object for drawing.
+    item : object
+        Text stimulus object for drawing the main task.
+    prompt : object
+        Text stimulus object for drawing instructions.
+    feedback : object
+        Text stimulus object for drawing feedback.
+    fs : int
+        The sampling frequency for recording.
+    rec_seconds : int
+        The duration of recording in seconds.
+    responseList : list
+        List of possible responses from the participant.
+    arrows_small : list
+        List of small arrow stimulus objects for drawing.
+    number_prompts : list
+        List of number prompt stimulus objects for drawing.
+    participant_info : dict
+        Dictionary containing information about the participant.
+    recording_writer : RecordingWriter
+        The writer that saves the recordings in the background.
+    recorder : Recorder
+        The recorder that records the spoken responses and detects speech.
+    session_rng : SessionRNG
+        The random number streams of the session.
+    frame_rate : float
+        The refresh rate of the window - the trial timeline is mapped to frames of this rate.
+    status : StatusBlock, optional
+        The status block of the experimenter dashboard, updated after every trial.
+    markers : MarkerOutlet, optional
+        The outlet the events of the trials are sent to.
+
+    Returns:
+    None
+    """
+
+    # the number to remember, shown before 'Wer kommt?'
+    randNumber = visual.TextStim(window,
+                                 pos=(0, 0),
+                                 height=0.25,
+                                 color="black",
+                                 name='randNumber')
+
+    # The read-aloud item, the beeps to react to and the number - the responses are collected in this order:
+    # feedback on the beep presses first, then the number
+    components = [
+        ReadAloud(item, stimuli, subj_path_rec, participant_info, fs, rec_seconds, recording_writer, recorder),
+        BeepPress(KeyListener(BEEP_PRESS_KEYS), prompt, feedback),
+        NumberMemory(randNumber, prompt, feedback, number_prompts, arrows_small, responseList),
+    ]
+    execute_dualTask(window, results, base_filename, stimuli, task_name, werKommt, fixation, participant_info,
+                     session_rng, frame_rate, components, status, markers)
+
+
+# dual task procedure composed of task components
+def execute_dualTask(window, results, base_filename, stimuli, task_name, werKommt, fixation, participant_info,
+                     session_rng, frame_rate, components, status=None, markers=None):
+    """
+    Executes a dual task composed of task components (see dualtask_components).
+
+    Every trial shows 'Wer kommt?' and the fixation cross, runs the frame loop of all components on one frame
+    engine, collects the responses of the components in their order and saves the trial result.
+
+    Parameters:
+    window : object
+        The window object where all the visual stimuli are drawn.
+    results : list
+        A list to hold the results of the experiment.
+    base_filename : str
+        The base filename for all output files.
+    stimuli : DataFrame
+        A DataFrame containing the stimuli for the experiment.
+    task_name : str
+        The name of the task to be executed.
+    werKommt : object
+        Text stimulus object for drawing.
+    fixation : object
+        Shape stimulus object for drawing.
+    participant_info : dict
+        Dictionary containing information about the participant.
+    session_rng : SessionRNG
+        The random number streams of the session.
+    frame_rate : float
+        The refresh rate of the window - the trial timeline is mapped to frames of this rate.
+    components : list
+        The components of the task; the first one is the read-aloud item (ReadAloud), which sets the item
+        presentation the other components refer to.
+    status : StatusBlock, optional
+        The status block of the experimenter dashboard, updated after every trial.
+    markers : MarkerOutlet, optional
+        The outlet the events of the trials are sent to.
 
     Returns:
     None
     """
 
-    # List of random numbers, same order for every participant
-    if task_name == 'practice_beep_count_dots':
-        random.seed(424)  # Set a random seed for reproducibility - here to get same list of nrs for practice
-    elif task_name == 'test_beep_count_dots':
-        random.seed(6667)  # Set a random seed for reproducibility - here to get same list of nrs for test
+    # The timeline in milliseconds mapped to the frames of the display
+    frame_grid = FrameGrid(frame_rate)
+    engine = FrameEngine(components)
+
+    # Draw the random parameters of all trials at once - offsets and dot timings use the fixed task seeds,
+    # so they are in the same order for every participant
+    for component in components:
+        component.start_task(session_rng, task_name, len(stimuli))
 
     # Initialize start time and start_time_str
     start_time = time.time()
     start_time_str = datetime.datetime.fromtimestamp(start_time).strftime('%H:%M:%S')
 
-    # Beep configuration
-    beep_duration = 0.2  # Duration of each beep in seconds
+    def save(record, type):
+        save_result(record, base_filename, participant_info, type=type)
 
     # Iterate over stimuli
     for x in range(len(stimuli)):
-        task = task_name
-
-        # Generate a random start and end frame for the main task stimulus presentation
-        start_offset = random.randint(300, 601)  # random number between 300 and 600
-        end_offset = start_offset + 350
-
-        # Randomly select a movement direction and a start/end frame for the moving dots
-        movement = random.choice(movementDirections)
-        rand1stFrame = random.randint((start_offset+15), (start_offset+50))
-        randLastFrame = rand1stFrame + 250
+        trial = TrialState(x, task_name, frame_grid, start_time, start_time_str, save, markers)
+        for component in components:
+            component.start_trial(trial)
+        for component in components:
+            component.before_presentation(window, trial)
 
         # naming the TextStim to find it in the log-file
         werKommt.name = 'werKommt'
@@ -221,263 +396,155 @@ def execute_dualTask_beep_count_dots(window, results, base_filename, subj_path_r
         core.wait(1.0)
         window.flip()
 
-        stimulus = stimuli.loc[x]['item']
-        item.setText(stimulus)
-        # naming the TextStim to find it in the log-file
-        item.name = 'item_' + str(stimuli.loc[x]['ID'])
-
-        # start recording the participant response - reading out loud the stimulus
-        responseRecord = sd.rec(int(rec_seconds * fs), samplerate=fs, channels=1)
-        beep_type = 'NA'
-        beep_counter = 0
-        beep_sequence = []  # List to store the beep sounds played within the current main trial
-        beep_count_results = []
-        is_row_added = False  # Flag variable to track if a row has been added for the condition
-
-        for frame in range(1200):  # Loop for 1200 frames
-            # Check if it's time to play a beep sound
-            if frame % 35 == 0 and frame >= 49:
-
-                # If the first 3 beeps have not yet been generated, they should be normal
-                if beep_counter < 3:
-                    beep_sound = sound.Sound('C', octave=5, secs=beep_duration)
-                    beep_type = 'normal'
-                else:
-                    # Ensure that there are at least 3 deviants in the sequence
-                    deviants_so_far = beep_sequence.count('deviant')
-                    remaining_beeps = 22 - beep_counter  # assuming you have 23 beeps in total
-
-                    if deviants_so_far < 3 and remaining_beeps <= (3 - deviants_so_far):
-                        beep_sound = sound.Sound('A', octave=5, secs=beep_duration)
-                        beep_type = 'deviant'
-                    else:
-                        # Calculate the probability of generating a deviant beep
-                        if deviants_so_far >= 3:
-                            deviant_prob = min(0.5, deviants_so_far / (beep_counter - 3))
-                        else:
-                            deviant_prob = 0.5
-
-                        if np.random.rand() < deviant_prob:
-                            beep_sound = sound.Sound('A', octave=5, secs=beep_duration)
-                            beep_type = 'deviant'
-                        else:
-                            beep_sound = sound.Sound('C', octave=5, secs=beep_duration)
-                            beep_type = 'normal'
-
-                # Play the beep sound if it is not in the item presentation or dot presentation phase
-                if not start_offset - 10 <= frame < end_offset + 10:
-                    beep_sound.play()
-
-                    # Increment the beep counter
-                    beep_counter += 1
-
-                    # Append the beep sound to the current trial's beep sequence
-                    beep_sequence.append(beep_type)
-
-                    # Record end time and duration
-                    end_time = time.time()
-                    end_time_str = datetime.datetime.fromtimestamp(end_time).strftime('%H:%M:%S')
-                    duration = end_time - start_time
-                    hours, remainder = divmod(duration, 3600)
-                    minutes, seconds = divmod(remainder, 60)
-                    duration_str = '{:02d}:{:02d}:{:02d}'.format(int(hours), int(minutes), int(seconds))
-
-                    # Append the data of the current trial to the results
-                    beep_count_results.append({
-                        'task': task_name,
-                        'phase':'practice' if task_name.startswith('practice') else 'test',
-                        'main_trial': "{:02d}".format(x + 1),
-                        'beep_count_trial': beep_counter,
-                        'beep_count_stimulus': beep_type,
-                        'presentation': 'dual' if start_offset <= frame < end_offset else 'single',
-                        'start_time': start_time_str,
-                        'end_time': end_time_str,
-                        'duration': duration_str,
-                    })
-
-                # Add a row for frames when item is shown
-                if start_offset - 10 <= frame < end_offset + 10:
-
-                    # Record end time and duration
-                    end_time = time.time()
-                    end_time_str = datetime.datetime.fromtimestamp(end_time).strftime('%H:%M:%S')
-                    duration = end_time - start_time
-                    hours, remainder = divmod(duration, 3600)
-                    minutes, seconds = divmod(remainder, 60)
-                    duration_str = '{:02d}:{:02d}:{:02d}'.format(int(hours), int(minutes), int(seconds))
-
-                    # Append the data of the current trial to the results if a row hasn't been added already
-                    if not is_row_added:
-                        beep_count_results.append({
-                        'task': task_name,
-                        'phase':'practice' if task_name.startswith('practice') else 'test',
-                        'main_trial': "{:02d}".format(x + 1),
-                        'beep_count_trial': 'pause for ' + str(end_offset-start_offset) + 'frames',
-                        'beep_count_stimulus': 'none',
-                        'presentation': 'name_coordinate and dots',
-                        'start_time': start_time_str,
-                        'end_time': end_time_str,
-                        'duration': duration_str,
-                    })
-                    is_row_added = True
-
-            # reading aloud primary task
-            if start_offset <= frame < end_offset:  # This means that if the current frame is between start_offset and end_offset, it is the time to show the main task
-                item.draw()  # Drawing the name of the image on the screen
-
-                if frame == start_offset:  # If we are at the start of the primary task
-                    # Start recording the participant's spoken response
-                    responseRecord = sd.rec(int(rec_seconds * fs), samplerate=fs, channels=1)
-
-                if frame == end_offset - 1:  # If we are at the end of the primary task
-                    # Stop recording the participant's spoken response
-                    sd.stop()
-                    # Save the spoken response as a .wav file
-                    write(os.path.join(subj_path_rec,
-                                       'dualtask_' + participant_info['subject'] + '_' + task_name + '_' +
-                                       "{:02d}".format(x + 1) + '_' + str(stimuli.loc[x]['ID']) + '.wav'),
-                          fs, responseRecord)
-
-            if rand1stFrame <= frame < randLastFrame:  # Present dots for subset of frames
-                dots.dir = movement
-                dots.draw()
-
-            window.flip()
-
-        for result in beep_count_results:
-            append_result_to_csv(result, base_filename, participant_info, type='beep_count')
-
-        # Reset the flag for the next trial
-        is_row_added = False
-
-        core.wait(2)
-
-        # show first response screen
-        prompt.setText('Drücken Sie den Richtungs-Pfeil auf der Tastatur,\n in die sich die Punkte bewegt haben.')
-        prompt.pos = (0, -0.6)
-        prompt.size = 0.12
-        prompt.draw()
+        # The frame index follows the flip times, so dropped frames do not shift the following events
+        frame_clock = FrameClock(frame_rate)
+        engine.run(window, trial, frame_grid.trial_frames, frame_clock)  # 20 s (1200 frames at 60 Hz)
 
-        # these are the arrows pointing at 0,90,180,270 degrees - resembling movement direction of dots
-        for arrow in arrows:
-            arrow.draw()
-        window.flip()
-
-        # wait for a response - allowed are the key buttons on the keypad
-        arrowKey = event.waitKeys(keyList=responseList)
-        # compare input arrow key with movement direction to check accuracy
-        if responseList.index(arrowKey[0]) == movementDirections.index(movement):
-            dot_Accuracy = 'correct'
-            feedback.setText('Korrekt!')
-            feedback.setColor('black')
-            feedback.draw()
-        else:
-            dot_Accuracy = 'incorrect'
-            feedback.setText('Inkorrekt!')
-            feedback.setColor('black')
-            feedback.draw()
-        window.flip()
+        for component in components:
+            component.end_presentation(trial)
 
         core.wait(2)
 
-        number_selection, correct_index = select_and_replace_number(beep_sequence.count('deviant'))
+        fields = {}
+        for component in components:
+            fields.update(component.respond(window, trial))
 
-        # now number_prompts have been created and are of the same length as number_selection
-        for i, arrow in zip(range(len(number_selection)), arrows_small):
-            number_prompts[i].text = str(number_selection[i])
-            number_prompts[i].draw()
-            arrow.draw()
+        # Record end time and duration
+        end_time_str, duration_str = clock_times(start_time)
+
+        # Prepare the result record
+        results.append(TrialRecord(
+            task=task_name,
+            main_trial=x + 1,
+            phase=Phase.of_task(task_name),
+            stimulus_id=stimuli.loc[x]['ID'],
+            stimulus=stimuli.loc[x]['item'],
+            condition=stimuli.loc[x]['condition'],
+            frame_rate=frame_rate,
+            **fields,
+            start_time=start_time_str,
+            end_time=end_time_str,
+            duration=duration_str,
+        ))
+        # Append the result to the CSV file
+        save_result(results[-1], base_filename, participant_info)
 
-        # show second response screen
-        prompt.setText('Wieviele hohe Töne haben Sie gehört?\n Drücken Sie den entsprechenden Pfeil auf der Tastatur.')
-        prompt.pos = (0, -0.75)
-        prompt.size = 0.12
-        prompt.draw()
+        # Publish the trial to the experimenter dashboard
+        if status is not None:
+            status.trial_done(x + 1, frame_clock.dropped, (fields['rec_peak_dbfs'], fields['rec_rms_dbfs']),
+                              components[0].rec_alert, fields.get('dot_response_accuracy'),
+                              fields.get('beep_count_response_accuracy'))
 
-        window.flip()
 
-        # wait for a response - allowed are the key buttons on the keypad
-        arrowKey_number = event.waitKeys(keyList=responseList)
-        # compare input arrow key with movement direction to check accuracy
-        if responseList.index(arrowKey_number[0]) == correct_index:
-            numbers_accuracy = 'correct'
-            feedback.setText('Korrekt!')
-            feedback.setColor('black')
-            feedback.draw()
-        else:
-            numbers_accuracy = 'incorrect'
-            feedback.setText('Inkorrekt!')
-            feedback.setColor('black')
-            feedback.draw()
-        window.flip()
+class ReadAloud(Component):
+    """
+    The primary task of the dual tasks: the item is read aloud and recorded.
 
-        core.wait(2)
+    The item is presented from a random onset (5 to 10 s into the trial); its presentation is extended or
+    shortened depending on the participant's speech (see adapt_item_end). The recording is checked and handed to
+    the background writer as soon as the presentation is over.
+    """
 
-        # Define a file name for the response record
-        responseRecordName = 'dualtask_' + participant_info['subject'] + '_' + task_name + '_' + \
-                             "{:02d}".format(x + 1) + '_' + str(stimuli.loc[x]['ID']) + '.wav'
+    def __init__(self, item, stimuli, subj_path_rec, participant_info, fs, rec_seconds, recording_writer, recorder):
+        self.item = item
+        self.stimuli = stimuli
+        self.subj_path_rec = subj_path_rec
+        self.participant_info = participant_info
+        self.fs = fs
+        self.rec_seconds = rec_seconds
+        self.recording_writer = recording_writer
+        self.recorder = recorder
+
+    def start_task(self, session_rng, task_name, n_trials):
+        self.onsets = session_rng.draw_item_onsets(task_name, n_trials)
+
+    def start_trial(self, trial):
+        # Random start and end frame for the main task stimulus presentation - drawn in reference frames at 60 Hz
+        # (300 to 601, i.e. 5 to 10 s) and mapped to the frames of the display
+        frame_grid = trial.frame_grid
+        trial.reference_start = int(self.onsets[trial.index])
+        trial.item_start = frame_grid.from_reference(trial.reference_start)
+        trial.item_end = trial.item_start + frame_grid.item_frames
+        trial.max_item_end = trial.item_end + frame_grid.frames(vad_max_extension * 1000)
+        self.trial = trial
 
-        # Record end time and duration
-        end_time = time.time()
-        end_time_str = datetime.datetime.fromtimestamp(end_time).strftime('%H:%M:%S')
-        duration = end_time - start_time
-        hours, remainder = divmod(duration, 3600)
-        minutes, seconds = divmod(remainder, 60)
-        duration_str = '{:02d}:{:02d}:{:02d}'.format(int(hours), int(minutes), int(seconds))
-
-        # Filter single presentation trials
-        count_results_trials_single = [r for r in beep_count_results if
-                             'presentation' in r and r['presentation'] == 'single']
-
-        beep_count_trials = len(count_results_trials_single)
-
-        # Filter deviants in single presentation trials
-        count_results_trials_single_deviant = [r for r in beep_count_results if
-                               'presentation' and 'beep_count_stimulus' in r and
-                                        r['presentation'] == 'single' and
-                                        r['beep_count_stimulus'] == 'deviant']
-
-        # Calculate the number of single deviant presentation trials
-        beep_count_trials_deviant = len(count_results_trials_single_deviant)
-
-        # Calculate the number of single normal presentation trials
-        beep_count_trials_normal = beep_count_trials - beep_count_trials_deviant
-
-        beep_count_results.clear()  # Clear beep_results after writing to CSV
-
-        # Prepare the result dictionary
-        results.append({
-            'task': task,
-            'main_trial': "{:02d}".format(x + 1),
-            'phase': 'practice' if task_name.startswith('practice') else 'test',
-            'stimulus_id': stimuli.loc[x]['ID'],
-            'stimulus': stimuli.loc[x]['item'],
-            'stimulus_rec': responseRecordName,
-            'dot_direction': movement,
-            'dot_1st_frame': rand1stFrame,
-            'dot_last_frame': randLastFrame,
-            'dot_response_key': arrowKey,
-            'dot_response_accuracy': dot_Accuracy,
-            'beep_sequence':str(beep_sequence),
-            'beep_count_trials': beep_count_trials,
-            'beep_count_deviant_trials': beep_count_trials_deviant,
-            'beep_count_normal_trials': beep_count_trials_normal,
-            'beep_count_number_selection': str(number_selection),
-            'beep_count_index_correct_count': correct_index,
-            'beep_count_response': str(arrowKey_number[0]),
-            'beep_count_response_accuracy': numbers_accuracy,
-            'start_time': start_time_str,
-            'end_time': end_time_str,
-            'duration': duration_str,
-        })
-        # Append the result to the CSV file
-        append_result_to_csv(results[-1], base_filename, participant_info)
+        # naming the TextStim to find it in the log-file
+        self.item.name = 'item_' + str(self.stimuli.loc[trial.index]['ID'])
+        self.item.setText(self.stimuli.loc[trial.index]['item'])
+
+        # buffer for the participant response - reading out loud the stimulus - the recording starts at item_start
+        self.responseRecord = self.recording_writer.buffer_pool.acquire(int(self.rec_seconds * self.fs))
+        self.item_started = False  # Whether the item presentation (and recording) has started
+        self.item_finished = False  # Whether the item presentation (and recording) is over
+        self.rec_alert = None
+
+    def frame_spans(self, trial):
+        # until the end of the trial - the presentation may be extended and frames may be dropped
+        return [(trial.item_start, trial.frame_grid.trial_frames, self._present)]
+
+    def _present(self, frame):
+        """Present the item and record the spoken response."""
+        if self.item_finished:
+            return
+        trial = self.trial
+        recorder = self.recorder
+        if not self.item_started:  # If we are at the start of the primary task
+            # Start recording the participant's spoken response
+            recorder.start(self.responseRecord)
+            self.item_started = True
+            trial.mark(MarkerEvent.item_onset, frame)
+
+        # extend or shorten the item presentation depending on the participant's speech
+        trial.item_end = adapt_item_end(frame, trial.item_end, trial.max_item_end, recorder)
+
+        if frame < trial.item_end:
+            self.item.draw()  # Drawing the name of the image on the screen
+
+        if frame >= trial.item_end - 1:  # If we are at the end of the primary task
+            self._finish(trial)
+
+    def _finish(self, trial):
+        """Stop the recording, check it and hand it to the background writer."""
+        self.item_finished = True
+        # Stop recording the participant's spoken response - a recording that never started is empty
+        rec_frames = self.recorder.stop() if self.item_started else 0
+        self.speech_onset, self.speech_offset = self.recorder.speech_span() if self.item_started else (None, None)
+        main_trial = "{:02d}".format(trial.main_trial)
+        # Health check of the recording (vectorized, about a millisecond) - the alert is shown after the loop
+        self.rec_qc, self.rec_alert = check_recording(self.responseRecord[:rec_frames], self.fs, self.recorder,
+                                                      trial.task_name + ' trial ' + main_trial)
+        # Hand the spoken response to the background writer - no encoding or disk access in the frame loop
+        stimulus_id = self.stimuli.loc[trial.index]['ID']
+        self.responseRecordName = self.recording_writer.submit(
+            os.path.join(self.subj_path_rec, 'dualtask_' + self.participant_info['subject'] + '_' +
+                         trial.task_name + '_' + main_trial + '_' + str(stimulus_id)), self.responseRecord,
+            self.fs, n_frames=rec_frames,
+            metadata={'task': trial.task_name, 'main_trial': main_trial, 'stimulus_id': stimulus_id})
+
+    def end_presentation(self, trial):
+        if not self.item_finished:
+            # the frame loop ended before the end of the (extended) presentation, e.g. after dropped frames
+            trial.item_end = min(trial.item_end, trial.frame_grid.trial_frames)
+            self._finish(trial)
+        if self.rec_alert:
+            print('RECORDING ALERT - ' + self.rec_alert)
+
+    def respond(self, window, trial):
+        return {
+            'stimulus_rec': self.responseRecordName,
+            'item_1st_frame': trial.item_start,
+            'item_last_frame': trial.item_end - 1,
+            'speech_onset': self.speech_onset,
+            'speech_offset': self.speech_offset,
+            **self.rec_qc,
+        }
 
 
 # Display instructions consecutively
 def execute_task(window, task_name, participant_info, stimuli, werKommt, fixation, item, prompt,
                  feedback, fs, rec_seconds, movementDirections, responseList, dots, arrows, arrows_small,
-                 number_prompts, dual_task=False):
+                 number_prompts, dual_task=False, recording_writer=None, recorder=None,
+                 frame_rate=REFERENCE_FRAME_RATE, status=None, staircase=None, markers=None):
     """
     Executes a task for a participant based on the task_name and type (single or dual).
     It sets up paths for recording and results, checks the task name to call the appropriate
@@ -520,6 +587,19 @@ def execute_task(window, task_name, participant_info, stimuli, werKommt, fixatio
         List of number prompt stimulus objects for drawing.
     dual_task : bool, optional
         Whether the task to be executed is a dual task or a single task (default is False).
+    recording_writer : RecordingWriter, optional
+        The session-wide writer for the recordings. If None, a writer for the configured recording format
+        is created for this task and closed once all of its recordings are written.
+    recorder : Recorder, optional
+        The session-wide recorder with its open input stream. If None, a recorder is opened for this task.
+    frame_rate : float, optional
+        The refresh rate of the window, used to map the trial timeline to frames (default is 60 Hz).
+    status : StatusBlock, optional
+        The status block of the experimenter dashboard. If given, the progress is published after every trial.
+    staircase : CoherenceStaircase, optional
+        The staircase of the dot coherence, kept across the practice and test tasks (see dualtask_staircase).
+    markers : MarkerOutlet, optional
+        The outlet the events of the trials are sent to (see dualtask_markers).
 
     Returns:
     None
@@ -536,7 +616,8 @@ def execute_task(window, task_name, participant_info, stimuli, werKommt, fixatio
     # Initialize an empty list to hold the results
     results = []
     # Import the end-of-practice instructions
-    from dualtask_instructions import instructPracticeSingleTaskEnd,  instructPracticeDualTask_beep_count_dots_End
+    from dualtask_instructions import instructPracticeSingleTaskEnd,  instructPracticeDualTask_beep_count_dots_End, \
+        instructPracticeDualTask_number_beep_press_End
 
     # path setup results per participant
     # Define the path in results for each subject
@@ -555,23 +636,61 @@ def execute_task(window, task_name, participant_info, stimuli, werKommt, fixatio
     if not os.path.exists(subj_path_rec):
         os.makedirs(subj_path_rec)
 
+    # Recordings are encoded and written in the background - use a task-local writer if none is passed
+    own_writer = recording_writer is None
+    if own_writer:
+        recording_writer = RecordingWriter(recording_format, container=get_session_container(
+            subj_path_results, participant_info) if session_container else None)
+    # All random numbers of the task come from the session's streams, derived from the session seed
+    session_rng = SessionRNG(participant_info['session_seed'])
+    own_recorder = recorder is None
+    if own_recorder:
+        recorder = Recorder(fs, threshold_db=vad_threshold_db, hangover=vad_hangover)
+        recorder.open()
+
+    if status is not None:
+        status.start_task(task_name, len(stimuli), frame_rate)
+
     # Execute the task and save the result
     if dual_task:
         if task_name == 'practice_beep_count_dots':
             execute_dualTask_beep_count_dots(window, results, base_filename, subj_path_rec, stimuli, task_name, werKommt,
                                              fixation, item, prompt, feedback, fs, rec_seconds, movementDirections,
-                                             responseList, dots, arrows, arrows_small, number_prompts, participant_info)
+                                             responseList, dots, arrows, arrows_small, number_prompts, participant_info,
+                                             recording_writer, recorder, session_rng, frame_rate, status, staircase,
+                                             markers)
             display_text_and_wait(instructPracticeDualTask_beep_count_dots_End, window)
         if task_name == 'test_beep_count_dots':
             execute_dualTask_beep_count_dots(window, results, base_filename, subj_path_rec, stimuli, task_name, werKommt,
                                              fixation, item, prompt, feedback, fs, rec_seconds, movementDirections,
-                                             responseList, dots, arrows, arrows_small, number_prompts, participant_info)
+                                             responseList, dots, arrows, arrows_small, number_prompts, participant_info,
+                                             recording_writer, recorder, session_rng, frame_rate, status, staircase,
+                                             markers)
+        if task_name == 'practice_number_beep_press':
+            execute_dualTask_number_beep_press(window, results, base_filename, subj_path_rec, stimuli, task_name,
+                                               werKommt, fixation, item, prompt, feedback, fs, rec_seconds,
+                                               responseList, arrows_small, number_prompts, participant_info,
+                                               recording_writer, recorder, session_rng, frame_rate, status,
+                                               markers)
+            display_text_and_wait(instructPracticeDualTask_number_beep_press_End, window)
+        if task_name == 'test_number_beep_press':
+            execute_dualTask_number_beep_press(window, results, base_filename, subj_path_rec, stimuli, task_name,
+                                               werKommt, fixation, item, prompt, feedback, fs, rec_seconds,
+                                               responseList, arrows_small, number_prompts, participant_info,
+                                               recording_writer, recorder, session_rng, frame_rate, status,
+                                               markers)
     else:
         execute_singleTask(window, results, subj_path_rec, stimuli, task_name, werKommt, fixation, item, rec_seconds,
-                           fs, participant_info, base_filename)
+                           fs, participant_info, base_filename, recording_writer, recorder, frame_rate, status,
+                           markers)
         if task_name == 'practice_single':
             display_text_and_wait(instructPracticeSingleTaskEnd, window)
 
+    if own_recorder:
+        recorder.close()
+    if own_writer:
+        recording_writer.close()
+
 
 def display_and_wait(element, window):
     """
@@ -609,43 +728,85 @@ def display_text_and_wait(text_string, window):
     return display_and_wait(text_stim, window)
 
 
-def select_and_replace_number(given_number):
+def adapt_item_end(frame, item_end, max_item_end, recorder):
     """
-    Based on the given number, this function generates three random numbers that are within the
-    same tens or ones range. It then combines these numbers with the given number,
-    and randomly shuffles them to produce a list of four numbers.
+    Adapt the end of the item presentation (and recording) to the participant's speech.
+
+    While speech continues in the last frame of the presentation, the presentation is extended frame by frame up to
+    max_item_end. If early advance is configured, the presentation ends as soon as the participant has been silent
+    for vad_trailing_silence seconds after speaking.
 
     Parameters:
-    given_number : int
-        The base number based on which three other numbers are generated.
+    frame : int
+        The current frame.
+    item_end : int
+        The frame after the last frame of the item presentation so far.
+    max_item_end : int
+        The latest possible end of the item presentation.
+    recorder : Recorder
+        The recorder with the speech state of the running recording.
 
     Returns:
-    numbers : list of int
-        List of four numbers where one of the numbers is the given_number.
-    replace_index : int
-        The index at which the given_number is placed in the list.
+    item_end : int
+        The (possibly changed) frame after the last frame of the item presentation.
     """
+    if not vad_enabled:
+        return item_end
 
-    # Check the range of the given_number
-    if given_number < 10:
-        range_start = given_number - 2
-        range_end = given_number + 2
-    else:
-        num_str = str(given_number)
-        range_start = int(num_str[:-1] + '0')
-        range_end = int(num_str[:-1] + '9')
+    # extend while the participant is still speaking - after dropped frames the last frame may have been skipped
+    if frame >= item_end - 1 and item_end < max_item_end and recorder.speech_active:
+        return min(frame + 2, max_item_end)
 
-    # Create a list of all numbers in the range except the given_number
-    range_without_given = [i for i in range(range_start, range_end + 1) if i != given_number]
+    # advance early once the participant has finished speaking
+    if vad_early_advance:
+        trailing_silence = recorder.trailing_silence()
+        if trailing_silence is not None and trailing_silence >= vad_trailing_silence:
+            return frame + 1
 
-    # Randomly select 3 numbers from this list
-    numbers = random.sample(range_without_given, 3)
+    return item_end
 
-    # Add the given_number to the list and shuffle
-    numbers.append(given_number)
-    random.shuffle(numbers)
 
-    # Get the index of the given_number
-    replace_index = numbers.index(given_number)
+def check_recording(data, fs, recorder, label):
+    """
+    Run the health check of a recording right after it was stopped.
+
+    Parameters:
+    data : numpy.ndarray
+        The recorded part of the buffer.
+    fs : int
+        The sample rate of the recording.
+    recorder : Recorder
+        The recorder - provides the input overflows and underflows of the recording.
+    label : str
+        Name of the trial used in the alert, e.g. 'test_single trial 03'.
 
-    return numbers, replace_index
+    Returns:
+    columns : dict
+        The recording columns of the main CSV file ('rec_peak_dbfs', ..., 'rec_qc').
+    alert : str or None
+        The alert for the experimenter, None if the recording is fine.
+    """
+    qc = recording_qc(data, fs, qc_clip_level, qc_silence_db)
+    problems = []
+    if recorder.input_overflows:
+        problems.append('input overflow')
+    if recorder.input_underflows:
+        problems.append('input underflow')
+    if qc['clipping_ratio'] > qc_max_clipping_ratio:
+        problems.append('clipped')
+    if qc['peak_dbfs'] < qc_min_peak_dbfs:
+        problems.append('silent')
+
+    columns = {
+        'rec_peak_dbfs': qc['peak_dbfs'],
+        'rec_rms_dbfs': qc['rms_dbfs'],
+        'rec_clipping_ratio': qc['clipping_ratio'],
+        'rec_silence_fraction': qc['silence_fraction'],
+        'rec_input_overflows': recorder.input_overflows,
+        'rec_qc': ';'.join(problems) if problems else 'ok',
+    }
+    alert = None
+    if problems:
+        alert = '{}: {} (peak {} dBFS, {:.2%} clipped)'.format(label, ', '.join(problems), qc['peak_dbfs'],
+                                                               qc['clipping_ratio'])
+    return columns, alert
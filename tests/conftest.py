@@ -0,0 +1,48 @@
+"""
+Shared setup of the tests.
+The modules of the experiment are imported from the repository root. Without psychopy a stand-in of the psychopy
+modules the experiment imports is installed: the logging helpers call root.log like psychopy 2025.2 and later (with
+the levelname keyword), all other modules only provide the names that are used at import time. Tests that run task
+code replace core, event and sound of the modules under test with their own stand-ins (see test_dualtask_replay).
+"""
+
+# Import necessary libraries
+import os
+import sys
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+try:
+    import psychopy  # noqa: F401
+except ImportError:
+    logging = types.ModuleType('psychopy.logging')
+    logging.EXP, logging.WARNING = 22, 30
+    logging.defaultClock = types.SimpleNamespace(getTime=lambda: 1.0)
+    logging.getLevel = lambda level: {22: 'EXP', 30: 'WARNING'}[level]
+
+    class _Logger:
+        def __init__(self):
+            self.forwarded = []
+
+        def log(self, message, level, t=None, obj=None, levelname=None):
+            self.forwarded.append((message, level, levelname))
+
+    logging.root = _Logger()
+    logging.exp = lambda msg, t=None, obj=None: logging.root.log(msg, level=logging.EXP, t=t, obj=obj,
+                                                                 levelname='EXP')
+    logging.warning = lambda msg, t=None, obj=None: logging.root.log(msg, level=logging.WARNING, t=t, obj=obj,
+                                                                     levelname='WARNING')
+
+    psychopy = types.ModuleType('psychopy')
+    psychopy.__path__ = []
+    psychopy.logging = logging
+    psychopy.prefs = types.SimpleNamespace(hardware={})
+    modules = {'psychopy': psychopy, 'psychopy.logging': logging}
+    for name in ('core', 'event', 'visual', 'sound', 'monitors', 'gui', 'hardware'):
+        module = types.ModuleType('psychopy.' + name)
+        setattr(psychopy, name, module)
+        modules['psychopy.' + name] = module
+    psychopy.hardware.__path__ = []
+    psychopy.hardware.keyboard = modules['psychopy.hardware.keyboard'] = types.ModuleType('psychopy.hardware.keyboard')
+    sys.modules.update(modules)
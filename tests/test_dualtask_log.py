@@ -0,0 +1,30 @@
+"""
+Tests of the LogSink with the level helpers of psychopy's logger (or its stand-in, see conftest).
+"""
+
+# Import necessary libraries
+import pytest
+from psychopy import logging
+from dualtask_log import LogSink
+
+
+@pytest.fixture
+def sink(tmp_path):
+    sink = LogSink(str(tmp_path / 'session.log'))
+    sink.install()
+    yield sink
+    sink.close()
+
+
+def test_level_helpers_after_install(sink):
+    logging.exp('dots: dir = 90', t=2.0)
+    logging.warning('frame dropped', t=2.5)
+    sink.close()
+    with open(sink.path, encoding='utf-8') as file:
+        lines = file.read().splitlines()
+    assert lines == ['2.0000\tEXP\tdots: dir = 90', '2.5000\tWARNING\tframe dropped']
+
+
+def test_uninstall_restores_logger(sink):
+    sink.uninstall()
+    assert 'log' not in vars(logging.root)
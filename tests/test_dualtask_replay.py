@@ -0,0 +1,96 @@
+"""
+Tests of the replay against the live task code.
+The beep count and dots task is run headless with its real components (ReadAloud, DotField, BeepStream) and the
+real CSV backend; window, stimuli, recorder and psychopy's core, event and sound are stand-ins. The replay of the
+written session has to reproduce every logged field.
+"""
+
+# Import necessary libraries
+import time
+import types
+import pandas
+import pytest
+import dualtask_components
+import dualtask_task_setup
+from dualtask_recording import RecordingWriter
+from dualtask_replay import read_csv_rows, verify_session
+from dualtask_rng import SessionRNG
+from dualtask_schedule import MOVEMENT_DIRECTIONS, RESPONSE_KEYS
+
+
+SESSION_SEED = 20261019
+TASK_NAME = 'test_beep_count_dots'
+
+
+class Stimulus:
+    """Stand-in of the window and the stimuli - every method does nothing, flip returns no time stamp."""
+
+    def __getattr__(self, name):
+        return lambda *args, **kwargs: None
+
+
+class Recorder:
+    """Stand-in of the Recorder - the participant speaks past the end of every second item."""
+
+    input_overflows = 0
+    input_underflows = 0
+
+    def __init__(self):
+        self.recordings = 0
+        self.speech_active = False
+
+    def start(self, buffer):
+        self.buffer = buffer
+        self.recordings += 1
+        self.speech_active = self.recordings % 2 == 0
+
+    def stop(self):
+        return len(self.buffer) // 2
+
+    def speech_span(self):
+        return (0.5, 2.0) if self.speech_active else (None, None)
+
+    def trailing_silence(self):
+        return None
+
+
+@pytest.fixture
+def headless(monkeypatch):
+    """Replace psychopy's core, event and sound in the task modules - no waits, the first key answers."""
+    core = types.SimpleNamespace(getTime=time.perf_counter, wait=lambda *args, **kwargs: None)
+    for module in (dualtask_components, dualtask_task_setup):
+        monkeypatch.setattr(module, 'core', core)
+    monkeypatch.setattr(dualtask_components, 'event',
+                        types.SimpleNamespace(waitKeys=lambda keyList=None, **kwargs: [keyList[0]]))
+    monkeypatch.setattr(dualtask_components, 'sound', types.SimpleNamespace(Sound=lambda *args, **kwargs: Stimulus()))
+
+
+@pytest.mark.parametrize('frame_rate', [60.0, 144.0])
+def test_live_session_replays_without_mismatches(tmp_path, headless, frame_rate):
+    participant_info = {'experiment': 'dualtask', 'subject': 'S01', 'cur_date': '2026-10-19',
+                        'session_seed': SESSION_SEED}
+    stimuli = pandas.DataFrame({'ID': ['A1', 'A2', 'B1', 'B2'],
+                                'item': ['Lotte und Laura und Lisa'] * 4,
+                                'condition': ['grouped', 'ungrouped'] * 2})
+    base_filename = str(tmp_path / '{}_S01_20261019_120000'.format(TASK_NAME))
+    dots = Stimulus()
+    dots.coherence = 0.5
+    recording_writer = RecordingWriter('int16')
+    recorder = Recorder()
+    results = []
+    try:
+        dualtask_task_setup.execute_dualTask_beep_count_dots(
+            Stimulus(), results, base_filename, str(tmp_path), stimuli, TASK_NAME, Stimulus(), Stimulus(),
+            Stimulus(), Stimulus(), Stimulus(), 16000, 12, MOVEMENT_DIRECTIONS, RESPONSE_KEYS, dots,
+            [Stimulus() for _ in range(4)], [Stimulus() for _ in range(4)], [Stimulus() for _ in range(4)],
+            participant_info, recording_writer, recorder, SessionRNG(SESSION_SEED), frame_rate)
+    finally:
+        recording_writer.close()
+
+    _, n_trials, mismatches = verify_session(base_filename + '_main.csv')
+    assert n_trials == len(stimuli)
+    assert mismatches == []
+    # the speech of every second trial extended the item presentation
+    rows = read_csv_rows(base_filename + '_main.csv')
+    item_frames = [int(row['item_last_frame']) - int(row['item_1st_frame']) + 1 for row in rows]
+    assert item_frames[0] < item_frames[1]
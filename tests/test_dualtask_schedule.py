@@ -0,0 +1,33 @@
+"""
+Tests of the mapping of the trial timeline (in reference frames at 60 Hz) to the frame grid of a display.
+"""
+
+# Import necessary libraries
+import pytest
+from dualtask_schedule import FrameGrid, FrameClock, BEEP_SLOT_FRAMES, TRIAL_FRAMES, ITEM_FRAMES, DOT_FRAMES, \
+    REFERENCE_FRAME_RATE
+
+
+def test_reference_grid_is_identity():
+    frame_grid = FrameGrid(REFERENCE_FRAME_RATE)
+    assert [frame_grid.from_reference(frame) for frame in range(TRIAL_FRAMES)] == list(range(TRIAL_FRAMES))
+    assert frame_grid.beep_slot_frames == BEEP_SLOT_FRAMES
+    assert (frame_grid.trial_frames, frame_grid.item_frames, frame_grid.dot_frames) == \
+        (TRIAL_FRAMES, ITEM_FRAMES, DOT_FRAMES)
+
+
+@pytest.mark.parametrize('frame_rate', [50.0, 59.94, 75.0, 120.0, 144.0, 240.0])
+def test_mapped_frames_keep_the_reference_times(frame_rate):
+    frame_grid = FrameGrid(frame_rate)
+    for reference_frame in range(TRIAL_FRAMES + 1):
+        mapped = frame_grid.from_reference(reference_frame)
+        assert abs(mapped / frame_rate - reference_frame / REFERENCE_FRAME_RATE) <= 0.5 / frame_rate + 1e-9
+    assert list(frame_grid.beep_slot_frames) == sorted(set(frame_grid.beep_slot_frames))
+    assert frame_grid.trial_frames == round(TRIAL_FRAMES / REFERENCE_FRAME_RATE * frame_rate)
+
+
+def test_frame_clock_skips_dropped_frames():
+    frame_clock = FrameClock(60.0)
+    flips = [10.0, 10.0 + 1 / 60, 10.0 + 4 / 60, 10.0 + 5 / 60]  # the flips of frames 2 and 3 were missed
+    assert [frame_clock.next_frame(flip) for flip in flips] == [1, 2, 5, 6]
+    assert frame_clock.dropped == 2
@@ -0,0 +1,31 @@
+"""
+Tests of the posterior update of the QUEST+ coherence staircase.
+"""
+
+# Import necessary libraries
+import numpy as np
+from dualtask_staircase import CoherenceStaircase, psychometric, THRESHOLD_GRID
+
+
+def test_update_moves_the_threshold_estimate():
+    prior = CoherenceStaircase().estimate()['dot_threshold']
+    correct, incorrect = CoherenceStaircase(), CoherenceStaircase()
+    correct.update(0.1, True)
+    incorrect.update(0.1, False)
+    assert correct.estimate()['dot_threshold'] < prior < incorrect.estimate()['dot_threshold']
+    for staircase in (correct, incorrect):
+        assert staircase.n_updates == 1
+        assert np.isclose(staircase.posterior.sum(), 1.0)
+
+
+def test_staircase_converges_to_the_observer_threshold():
+    rng = np.random.default_rng(48)
+    threshold = THRESHOLD_GRID[30]  # about 0.14
+    staircase = CoherenceStaircase('adaptive')
+    sd_before = staircase.estimate()['dot_threshold_sd']
+    for _ in range(80):
+        coherence = staircase.next_coherence()
+        staircase.update(coherence, rng.random() < psychometric(coherence, threshold, 0.0))
+    estimate = staircase.estimate()
+    assert abs(np.log10(estimate['dot_threshold'] / threshold)) < 0.2
+    assert estimate['dot_threshold_sd'] < sd_before / 2